@@ -0,0 +1,321 @@
+from vulkan import *
+
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+MIN_ALLOCATION_SIZE = 256
+
+def next_power_of_two(value):
+    return 1 << max(0, (value - 1).bit_length())
+
+class Allocation:
+    def __init__(self, allocator, block, memory, offset, size, order, memory_type_index) -> None:
+        self.allocator = allocator
+        self.block = block
+        self.memory = memory
+        self.offset = offset
+        self.size = size
+        self.order = order
+        self.memory_type_index = memory_type_index
+        self.mapped = None
+
+    def free(self):
+        self.allocator.free(self)
+
+class BuddyBlock:
+    def __init__(self, memory, size, min_size, mapped) -> None:
+        self.memory = memory
+        self.size = size
+        self.min_size = min_size
+        self.mapped = mapped
+
+        # Order k holds nodes of min_size << k bytes, the top order is the whole block
+        self.max_order = (size // min_size).bit_length() - 1
+        self.free_lists = [set() for _ in range(self.max_order + 1)]
+        self.free_lists[self.max_order].add(0)
+        self.used = 0
+        self.allocation_count = 0
+
+    def order_for(self, size, alignment):
+        # Buddy nodes are aligned to their own size, so rounding up covers the alignment too
+        node_size = next_power_of_two(max(size, alignment, self.min_size))
+        return (node_size // self.min_size).bit_length() - 1
+
+    def allocate(self, size, alignment):
+        order = self.order_for(size, alignment)
+        if order > self.max_order:
+            return None
+
+        found = order
+        while found <= self.max_order and not self.free_lists[found]:
+            found += 1
+
+        if found > self.max_order:
+            return None
+
+        offset = self.free_lists[found].pop()
+        while found > order:
+            found -= 1
+            self.free_lists[found].add(offset + (self.min_size << found))
+
+        self.used += self.min_size << order
+        self.allocation_count += 1
+
+        return (offset, order)
+
+    def free(self, offset, order):
+        self.used -= self.min_size << order
+        self.allocation_count -= 1
+
+        while order < self.max_order:
+            buddy = offset ^ (self.min_size << order)
+            if buddy not in self.free_lists[order]:
+                break
+
+            self.free_lists[order].remove(buddy)
+            offset = min(offset, buddy)
+            order += 1
+
+        self.free_lists[order].add(offset)
+
+    def is_empty(self):
+        return self.allocation_count == 0
+
+    def largest_free(self):
+        for order in range(self.max_order, -1, -1):
+            if self.free_lists[order]:
+                return self.min_size << order
+
+        return 0
+
+    def free_fragment_count(self):
+        return sum(len(free_list) for free_list in self.free_lists)
+
+class Allocator:
+    def __init__(self, device_capabilities, device, debug, block_size = DEFAULT_BLOCK_SIZE) -> None:
+        self.device = device
+        self.debug = debug
+        self.block_size = next_power_of_two(block_size)
+
+        self.memory_properties = device_capabilities.memory_properties
+        limits = device_capabilities.properties.limits
+        self.buffer_image_granularity = limits.bufferImageGranularity
+        self.max_allocation_count = limits.maxMemoryAllocationCount
+
+        # Once blocks are split no finer than the granularity, linear and optimal
+        # resources can never share a page and may live in the same blocks
+        self.min_allocation_size = MIN_ALLOCATION_SIZE
+        self.separate_linear = self.buffer_image_granularity > self.min_allocation_size
+
+        self.pools = {}
+        self.dedicated = []
+        self.device_allocation_count = 0
+
+        if debug:
+            print(f"Allocator using {self.block_size // (1024 * 1024)} MiB blocks, "
+                  f"bufferImageGranularity {self.buffer_image_granularity}, "
+                  f"maxMemoryAllocationCount {self.max_allocation_count}")
+
+    def find_memory_type(self, type_bits, required, preferred = 0):
+        fallback = None
+
+        for i in range(self.memory_properties.memoryTypeCount):
+            if not type_bits & (1 << i):
+                continue
+
+            flags = self.memory_properties.memoryTypes[i].propertyFlags
+            if (flags & required) != required:
+                continue
+
+            if (flags & preferred) == preferred:
+                return i
+
+            if fallback is None:
+                fallback = i
+
+        if fallback is None:
+            raise Exception('No suitable memory type found')
+
+        return fallback
+
+    def is_host_visible(self, memory_type_index):
+        return bool(self.memory_properties.memoryTypes[memory_type_index].propertyFlags & VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT)
+
+    def allocate_device_memory(self, size, memory_type_index):
+        if self.device_allocation_count >= self.max_allocation_count:
+            raise Exception('maxMemoryAllocationCount exceeded')
+
+        alloc_info = VkMemoryAllocateInfo(
+            sType=VK_STRUCTURE_TYPE_MEMORY_ALLOCATE_INFO,
+            allocationSize=size,
+            memoryTypeIndex=memory_type_index
+        )
+
+        device_memory = vkAllocateMemory(self.device, alloc_info, None)
+        self.device_allocation_count += 1
+
+        mapped = None
+        if self.is_host_visible(memory_type_index):
+            # Host visible memory stays mapped for its whole lifetime
+            mapped = memoryview(vkMapMemory(self.device, device_memory, 0, size, 0))
+
+        return (device_memory, mapped)
+
+    def free_device_memory(self, device_memory, mapped):
+        if mapped is not None:
+            vkUnmapMemory(self.device, device_memory)
+
+        vkFreeMemory(self.device, device_memory, None)
+        self.device_allocation_count -= 1
+
+    def allocate(self, requirements, required, preferred = 0, linear = True):
+        memory_type_index = self.find_memory_type(requirements.memoryTypeBits, required, preferred)
+
+        # Anything larger than half a block would waste most of it, give it its own memory
+        if requirements.size > self.block_size // 2:
+            (device_memory, mapped) = self.allocate_device_memory(requirements.size, memory_type_index)
+            allocation = Allocation(self, None, device_memory, 0, requirements.size, None, memory_type_index)
+            allocation.mapped = mapped
+            self.dedicated.append(allocation)
+            return allocation
+
+        key = (memory_type_index, linear if self.separate_linear else None)
+        blocks = self.pools.setdefault(key, [])
+
+        for block in blocks:
+            result = block.allocate(requirements.size, requirements.alignment)
+            if result is not None:
+                break
+        else:
+            (device_memory, mapped) = self.allocate_device_memory(self.block_size, memory_type_index)
+            block = BuddyBlock(device_memory, self.block_size, self.min_allocation_size, mapped)
+            blocks.append(block)
+            result = block.allocate(requirements.size, requirements.alignment)
+
+            if self.debug:
+                print(f"Allocated new {self.block_size} byte block for memory type {memory_type_index}")
+
+        (offset, order) = result
+        allocation = Allocation(self, block, block.memory, offset, requirements.size, order, memory_type_index)
+        if block.mapped is not None:
+            allocation.mapped = block.mapped[offset:offset + requirements.size]
+
+        return allocation
+
+    def free(self, allocation):
+        mapped = allocation.mapped
+        allocation.mapped = None
+
+        if allocation.block is None:
+            self.dedicated.remove(allocation)
+            self.free_device_memory(allocation.memory, mapped)
+            return
+
+        block = allocation.block
+        block.free(allocation.offset, allocation.order)
+
+        # Keep one empty block per pool around so alternating load/unload does not thrash
+        if block.is_empty():
+            for blocks in self.pools.values():
+                if block in blocks and len(blocks) > 1:
+                    blocks.remove(block)
+                    self.free_device_memory(block.memory, block.mapped)
+                    break
+
+    def create_buffer(self, size, usage, required, preferred = 0):
+        buffer_info = VkBufferCreateInfo(
+            sType=VK_STRUCTURE_TYPE_BUFFER_CREATE_INFO,
+            size=size,
+            usage=usage,
+            sharingMode=VK_SHARING_MODE_EXCLUSIVE
+        )
+
+        buffer = vkCreateBuffer(self.device, buffer_info, None)
+        requirements = vkGetBufferMemoryRequirements(self.device, buffer)
+
+        allocation = self.allocate(requirements, required, preferred, linear=True)
+        vkBindBufferMemory(self.device, buffer, allocation.memory, allocation.offset)
+
+        return (buffer, allocation)
+
+    def create_image(self, width, height, format, usage, required, preferred = 0, mip_levels = 1):
+        image_info = VkImageCreateInfo(
+            sType=VK_STRUCTURE_TYPE_IMAGE_CREATE_INFO,
+            imageType=VK_IMAGE_TYPE_2D,
+            format=format,
+            extent=VkExtent3D(width=width, height=height, depth=1),
+            mipLevels=mip_levels,
+            arrayLayers=1,
+            samples=VK_SAMPLE_COUNT_1_BIT,
+            tiling=VK_IMAGE_TILING_OPTIMAL,
+            usage=usage,
+            sharingMode=VK_SHARING_MODE_EXCLUSIVE,
+            initialLayout=VK_IMAGE_LAYOUT_UNDEFINED
+        )
+
+        image = vkCreateImage(self.device, image_info, None)
+        requirements = vkGetImageMemoryRequirements(self.device, image)
+
+        allocation = self.allocate(requirements, required, preferred, linear=False)
+        vkBindImageMemory(self.device, image, allocation.memory, allocation.offset)
+
+        return (image, allocation)
+
+    def destroy_buffer(self, buffer, allocation):
+        vkDestroyBuffer(self.device, buffer, None)
+        allocation.free()
+
+    def destroy_image(self, image, allocation):
+        vkDestroyImage(self.device, image, None)
+        allocation.free()
+
+    def get_statistics(self):
+        block_count = 0
+        reserved = 0
+        used = 0
+        free_fragments = 0
+        largest_free = 0
+        allocation_count = len(self.dedicated)
+
+        for blocks in self.pools.values():
+            for block in blocks:
+                block_count += 1
+                reserved += block.size
+                used += block.used
+                free_fragments += block.free_fragment_count()
+                largest_free = max(largest_free, block.largest_free())
+                allocation_count += block.allocation_count
+
+        dedicated_bytes = sum(allocation.size for allocation in self.dedicated)
+        free = reserved - used
+
+        return {
+            'device_allocations': self.device_allocation_count,
+            'blocks': block_count,
+            'dedicated_allocations': len(self.dedicated),
+            'allocations': allocation_count,
+            'reserved_bytes': reserved + dedicated_bytes,
+            'used_bytes': used + dedicated_bytes,
+            'free_bytes': free,
+            'free_fragments': free_fragments,
+            'largest_free_bytes': largest_free,
+            # 0 when all free space is one contiguous range, towards 1 as it splinters
+            'fragmentation': 1.0 - largest_free / free if free else 0.0
+        }
+
+    def log_statistics(self):
+        stats = self.get_statistics()
+        print('Allocator statistics:')
+        for key, value in stats.items():
+            print(f"\t{key}: {value}")
+
+    def destroy(self):
+        if self.debug:
+            self.log_statistics()
+
+        for allocation in list(self.dedicated):
+            self.free(allocation)
+
+        for blocks in self.pools.values():
+            for block in blocks:
+                self.free_device_memory(block.memory, block.mapped)
+
+        self.pools = {}
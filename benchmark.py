@@ -0,0 +1,333 @@
+from vulkan import *
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import compute
+import main
+import pipeline_cache
+
+ICD_SEARCH_PATHS = [
+    '/usr/share/vulkan/icd.d/lvp_icd*.json',
+    '/usr/local/share/vulkan/icd.d/lvp_icd*.json',
+    '/etc/vulkan/icd.d/lvp_icd*.json'
+]
+
+def find_software_icd():
+    for pattern in ICD_SEARCH_PATHS:
+        matches = sorted(glob.glob(pattern))
+        if matches:
+            return matches[0]
+
+    return None
+
+def use_icd(path):
+    # Read by the loader when the first instance is created, so this has to run before any engine exists
+    os.environ['VK_DRIVER_FILES'] = path
+    os.environ['VK_ICD_FILENAMES'] = path
+    # Mesa keeps its own shader cache on disk, which would hide cold pipeline creation
+    os.environ['MESA_SHADER_CACHE_DISABLE'] = 'true'
+
+def make_triangle(rng):
+    vertices = np.zeros((3, 5), dtype=np.float32)
+    center = rng.uniform(-0.9, 0.9, 2)
+    vertices[:, :2] = center + np.array([[0.0, -0.05], [0.05, 0.05], [-0.05, 0.05]])
+    vertices[:, 2:] = rng.uniform(0.0, 1.0, 3)
+    return vertices
+
+TRIANGLE_INDICES = np.array([0, 1, 2], dtype=np.uint16)
+
+def summarize(samples):
+    values = np.array(samples, dtype=np.float64)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max())
+    }
+
+def make_engine(**kwargs):
+    return main.Engine(headless=True, pipeline_cache_path=None, debug=False, **kwargs)
+
+def settle(engine):
+    # Push staged uploads through and let every frame slot go idle
+    engine.render()
+    vkDeviceWaitIdle(engine.device)
+
+def describe_environment(engine):
+    properties = engine.capabilities.properties
+    return {
+        'device': properties.deviceName,
+        'device_type': properties.deviceType,
+        'driver_version': properties.driverVersion,
+        'api_version': properties.apiVersion,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform()
+    }
+
+def benchmark_startup(repeats):
+    stages = {}
+    totals = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine = make_engine()
+        totals.append((time.perf_counter() - start) * 1e3)
+        engine.close()
+
+        for (stage, seconds) in engine.startup_times.items():
+            stages.setdefault(stage, []).append(seconds * 1e3)
+
+    report = {'total_ms': summarize(totals)}
+    for (stage, samples) in stages.items():
+        report[f"{stage}_ms"] = summarize(samples)
+    return report
+
+def benchmark_pipelines(engine, repeats):
+    original_cache = engine.pipeline_cache
+
+    def time_creation(cache):
+        engine.pipeline_cache = cache
+        engine.destroy_pipeline()
+        start = time.perf_counter()
+        engine.make_pipeline()
+        return (time.perf_counter() - start) * 1e3
+
+    vkDeviceWaitIdle(engine.device)
+
+    cold = []
+    for _ in range(repeats):
+        cache = pipeline_cache.create_pipeline_cache(engine.capabilities, engine.device, None, False)
+        cold.append(time_creation(cache))
+        vkDestroyPipelineCache(engine.device, cache, None)
+
+    warm_cache = pipeline_cache.create_pipeline_cache(engine.capabilities, engine.device, None, False)
+    time_creation(warm_cache)
+    warm = [time_creation(warm_cache) for _ in range(repeats)]
+    vkDestroyPipelineCache(engine.device, warm_cache, None)
+
+    engine.pipeline_cache = original_cache
+    engine.destroy_pipeline()
+    engine.make_pipeline()
+    engine.mark_scene_changed()
+
+    return {'cold_ms': summarize(cold), 'cached_ms': summarize(warm)}
+
+def benchmark_uploads(engine, total_bytes, mesh_bytes):
+    floats = mesh_bytes // 4 // 5 * 5
+    vertices = np.random.default_rng(0).uniform(-1.0, 1.0, floats).astype(np.float32)
+    mesh_count = max(1, total_bytes // vertices.nbytes)
+    uploaded = mesh_count * vertices.nbytes
+
+    report = {'bytes': uploaded, 'mesh_bytes': vertices.nbytes}
+
+    settle(engine)
+    start = time.perf_counter()
+    for _ in range(mesh_count):
+        engine.upload_mesh(vertices)
+    settle(engine)
+    elapsed = time.perf_counter() - start
+    report['staged_mb_per_s'] = uploaded / elapsed / 1e6
+
+    if engine.streamer is not None:
+        start = time.perf_counter()
+        for _ in range(mesh_count):
+            engine.stream_mesh(vertices)
+        engine.streamer.submit()
+        settle(engine)
+        elapsed = time.perf_counter() - start
+        report['streamed_mb_per_s'] = uploaded / elapsed / 1e6
+
+    return report
+
+def time_frames(engine, frames, rerecord):
+    start = time.perf_counter()
+    for _ in range(frames):
+        if rerecord:
+            engine.mark_scene_changed()
+        engine.render()
+    vkDeviceWaitIdle(engine.device)
+    return time.perf_counter() - start
+
+def benchmark_draws(object_counts, frames):
+    rng = np.random.default_rng(0)
+    engine = make_engine()
+    results = []
+    try:
+        for count in sorted(object_counts):
+            while len(engine.meshes) < count:
+                engine.upload_mesh(make_triangle(rng), TRIANGLE_INDICES)
+            settle(engine)
+
+            # Re-recorded frames pay for every draw in Python, reused ones only for the submit
+            recorded = time_frames(engine, frames, True)
+            reused = time_frames(engine, frames, False)
+            draws = len(engine.meshes) * frames
+
+            results.append({
+                'objects': len(engine.meshes),
+                'recorded_draws_per_s': draws / recorded,
+                'recorded_frame_ms': recorded / frames * 1e3,
+                'reused_draws_per_s': draws / reused,
+                'reused_frame_ms': reused / frames * 1e3
+            })
+    finally:
+        engine.close()
+
+    return results
+
+def benchmark_frames(object_count, frames):
+    rng = np.random.default_rng(0)
+    engine = make_engine()
+    try:
+        for _ in range(object_count):
+            engine.upload_mesh(make_triangle(rng), TRIANGLE_INDICES)
+        settle(engine)
+
+        for _ in range(frames):
+            engine.mark_scene_changed()
+            engine.render()
+        vkDeviceWaitIdle(engine.device)
+        for slot in range(engine.max_frames_in_flight):
+            engine.profiler.resolve(slot)
+
+        report = engine.profiler.export_percentiles()
+        report['objects'] = object_count
+    finally:
+        engine.close()
+
+    return report
+
+def time_recording(engine, repeats):
+    settle(engine)
+    frame_in_flight = engine.frames_in_flight[engine.current_frame]
+
+    samples = []
+    for _ in range(repeats):
+        engine.mark_scene_changed()
+        start = time.perf_counter_ns()
+        engine.get_frame_commands(frame_in_flight, engine.current_frame)
+        samples.append(time.perf_counter_ns() - start)
+
+    return samples
+
+def benchmark_recording(mesh_count, worker_counts, repeats):
+    rng = np.random.default_rng(0)
+    meshes = [make_triangle(rng) for _ in range(mesh_count)]
+
+    results = []
+    for workers in worker_counts:
+        engine = make_engine(record_workers=workers)
+        try:
+            for vertices in meshes:
+                engine.upload_mesh(vertices, TRIANGLE_INDICES)
+            samples = time_recording(engine, repeats)
+        finally:
+            engine.close()
+
+        results.append({
+            'workers': workers,
+            'p50_ms': float(np.percentile(samples, 50)) / 1e6,
+            'p99_ms': float(np.percentile(samples, 99)) / 1e6
+        })
+
+    # Speedup over inline recording, or over the first worker count when inline was not run
+    baseline = results[0]['p50_ms']
+    for result in results:
+        result['speedup'] = baseline / result['p50_ms']
+
+    return {'meshes': mesh_count, 'repeats': repeats, 'results': results}
+
+def benchmark_compute(engine, particle_count, repeats):
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-1.0, 1.0, (particle_count, 4)).astype(np.float32)
+    velocities = rng.uniform(-1.0, 1.0, (particle_count, 4)).astype(np.float32)
+    dt = 1.0 / 60.0
+    gravity = np.array([0.0, -9.81, 0.0, 0.0], dtype=np.float32)
+
+    numpy_samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        velocities += gravity * dt
+        positions += velocities * dt
+        numpy_samples.append((time.perf_counter() - start) * 1e3)
+
+    context = engine.compute
+    kernel = compute.make_integrate_kernel(context)
+    position_buffer = context.from_array(positions)
+    velocity_buffer = context.from_array(velocities)
+
+    gpu_samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        compute.integrate_particles(context, kernel, position_buffer, velocity_buffer, dt).result()
+        gpu_samples.append((time.perf_counter() - start) * 1e3)
+
+    context.destroy_buffer(position_buffer)
+    context.destroy_buffer(velocity_buffer)
+
+    return {'particles': particle_count, 'numpy_ms': summarize(numpy_samples), 'dispatch_ms': summarize(gpu_samples)}
+
+SECTIONS = ['startup', 'pipelines', 'uploads', 'draws', 'frames', 'recording', 'compute']
+
+def run(args):
+    report = {'sections': {}}
+
+    engine = make_engine()
+    try:
+        report['environment'] = describe_environment(engine)
+        report['environment']['icd'] = os.environ.get('VK_DRIVER_FILES')
+
+        if 'pipelines' in args.sections:
+            report['sections']['pipelines'] = benchmark_pipelines(engine, args.repeats)
+        if 'uploads' in args.sections:
+            report['sections']['uploads'] = benchmark_uploads(engine, args.upload_mb * 1024 * 1024, 1024 * 1024)
+        if 'compute' in args.sections:
+            report['sections']['compute'] = benchmark_compute(engine, args.particles, args.frames)
+    finally:
+        engine.close()
+
+    if 'startup' in args.sections:
+        report['sections']['startup'] = benchmark_startup(args.repeats)
+    if 'draws' in args.sections:
+        report['sections']['draws'] = benchmark_draws(args.objects, args.frames)
+    if 'frames' in args.sections:
+        report['sections']['frames'] = benchmark_frames(max(args.objects), args.frames)
+    if 'recording' in args.sections:
+        report['sections']['recording'] = benchmark_recording(max(args.objects), args.workers, args.frames)
+
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless engine benchmarks, reported as JSON')
+    parser.add_argument('--icd', help='ICD manifest to load, defaults to lavapipe')
+    parser.add_argument('--system-driver', action='store_true', help='Use whatever driver the loader finds')
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=SECTIONS)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--objects', type=int, nargs='+', default=[1, 10, 100, 1000, 4000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--upload-mb', type=int, default=64)
+    parser.add_argument('--particles', type=int, default=1 << 20)
+    parser.add_argument('--output', help='Write the report here instead of stdout')
+    args = parser.parse_args()
+
+    if not args.system_driver:
+        icd = args.icd or find_software_icd()
+        if icd is None:
+            sys.exit('No lavapipe ICD found, pass --icd or --system-driver')
+        use_icd(icd)
+
+    report = run(args)
+
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
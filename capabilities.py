@@ -0,0 +1,81 @@
+from vulkan import *
+
+def to_plain(value):
+    # Vulkan structs and arrays to dicts and lists, so a snapshot can be written out as JSON
+    if isinstance(value, StrWrap):
+        value = value.obj
+
+    if not isinstance(value, ffi.CData):
+        return value
+
+    value_type = ffi.typeof(value)
+    if value_type.kind == 'struct':
+        return {name: to_plain(getattr(value, name)) for (name, _) in value_type.fields}
+
+    if value_type.kind == 'array':
+        if value_type.item.cname == 'char':
+            return ffi.string(value).decode('utf-8', 'replace')
+        return [to_plain(item) for item in value]
+
+    # Pointers such as pNext are meaningless outside this process
+    return None
+
+class DeviceCapabilities:
+    def __init__(self, physical_device, instance_dispatch, surface, debug) -> None:
+        self.physical_device = physical_device
+        self.surface = surface
+
+        self.properties = vkGetPhysicalDeviceProperties(physical_device)
+        self.features = vkGetPhysicalDeviceFeatures(physical_device)
+        self.memory_properties = vkGetPhysicalDeviceMemoryProperties(physical_device)
+        self.queue_families = list(vkGetPhysicalDeviceQueueFamilyProperties(physical_device))
+        self.extensions = [
+            e.extensionName for e in vkEnumerateDeviceExtensionProperties(physical_device, None)
+        ]
+
+        # Needs VK_KHR_get_physical_device_properties2 on a 1.0 instance. The ID struct in the chain also
+        # needs VK_KHR_external_memory_capabilities, the UUID is None without either
+        self.device_uuid = None
+        self.has_properties_2 = instance_dispatch.vkGetPhysicalDeviceProperties2KHR is not None
+        has_id_properties = instance_dispatch.vkGetPhysicalDeviceExternalBufferPropertiesKHR is not None
+        if self.has_properties_2 and has_id_properties:
+            ids = ffi.new('VkPhysicalDeviceIDProperties*', {'sType': VK_STRUCTURE_TYPE_PHYSICAL_DEVICE_ID_PROPERTIES})
+            properties2 = ffi.new('VkPhysicalDeviceProperties2*', {'sType': VK_STRUCTURE_TYPE_PHYSICAL_DEVICE_PROPERTIES_2, 'pNext': ids})
+            instance_dispatch.vkGetPhysicalDeviceProperties2KHR(physical_device, properties2)
+            self.device_uuid = bytes(ffi.buffer(ids.deviceUUID)).hex()
+
+        # Per queue family, all False for headless devices that never present
+        self.present_support = [False] * len(self.queue_families)
+        self.surface_formats = []
+        self.present_modes = []
+
+        if surface is not None:
+            surface_support = instance_dispatch.vkGetPhysicalDeviceSurfaceSupportKHR
+            get_formats = instance_dispatch.vkGetPhysicalDeviceSurfaceFormatsKHR
+            get_present_modes = instance_dispatch.vkGetPhysicalDeviceSurfacePresentModesKHR
+
+            self.present_support = [bool(surface_support(physical_device, i, surface)) for i in range(len(self.queue_families))]
+            self.surface_formats = list(get_formats(physical_device, surface))
+            self.present_modes = list(get_present_modes(physical_device, surface))
+
+        if debug:
+            print(f"Captured capabilities of {self.properties.deviceName}: "
+                  f"{len(self.queue_families)} queue families, {len(self.extensions)} extensions")
+
+    def supports_extension(self, name):
+        return name in self.extensions
+
+    def to_dict(self):
+        return {
+            'properties': to_plain(self.properties),
+            'features': to_plain(self.features),
+            'memory_properties': to_plain(self.memory_properties),
+            'queue_families': [to_plain(family) for family in self.queue_families],
+            'device_uuid': self.device_uuid,
+            'extensions': list(self.extensions),
+            'present_support': list(self.present_support),
+            'surface_formats': [
+                {'format': f.format, 'color_space': f.colorSpace} for f in self.surface_formats
+            ],
+            'present_modes': list(self.present_modes)
+        }
@@ -0,0 +1,234 @@
+from vulkan import *
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+import readback
+
+# One record per written frame, appended to index.bin next to the chunks
+INDEX_DTYPE = np.dtype([
+    ('frame', '<u8'), ('timestamp_ns', '<i8'), ('chunk', '<u4'), ('slot', '<u4'),
+    ('width', '<u4'), ('height', '<u4'), ('format', '<u4')
+])
+
+FORMAT_VERSION = 1
+
+class ChunkedWriter:
+    def __init__(self, path, chunk_frames = 600) -> None:
+        # A directory of fixed size raw chunks, only the chunk being filled is mapped
+        self.path = path
+        self.chunk_frames = chunk_frames
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'header.json'), 'w') as f:
+            json.dump({'version': FORMAT_VERSION, 'chunk_frames': chunk_frames, 'index_dtype': INDEX_DTYPE.descr}, f)
+
+        self.index_file = open(os.path.join(path, 'index.bin'), 'wb')
+        self.chunk = None
+        self.chunk_index = -1
+        self.chunk_shape = None
+        self.slot = 0
+
+    def open_chunk(self, shape):
+        self.close_chunk()
+
+        self.chunk_index += 1
+        self.chunk_shape = shape
+        self.slot = 0
+        filename = os.path.join(self.path, f"chunk_{self.chunk_index:05d}.raw")
+        self.chunk = np.memmap(filename, dtype=np.uint8, mode='w+', shape=(self.chunk_frames,) + shape)
+
+    def close_chunk(self):
+        if self.chunk is None:
+            return
+
+        self.chunk.flush()
+        # Trim the last chunk down to the frames it actually holds
+        used = self.slot * self.chunk[0].nbytes
+        filename = self.chunk.filename
+        self.chunk = None
+        if used < os.path.getsize(filename):
+            os.truncate(filename, used)
+
+    def write(self, frame, timestamp_ns, array, format):
+        # A resize starts a new chunk, every chunk holds frames of one size
+        if self.chunk is None or self.slot == self.chunk_frames or array.shape != self.chunk_shape:
+            self.open_chunk(array.shape)
+
+        self.chunk[self.slot] = array
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['frame'] = frame
+        record['timestamp_ns'] = timestamp_ns
+        record['chunk'] = self.chunk_index
+        record['slot'] = self.slot
+        record['height'] = array.shape[0]
+        record['width'] = array.shape[1]
+        record['format'] = format
+        self.index_file.write(record.tobytes())
+
+        self.slot += 1
+        return True
+
+    def close(self):
+        self.close_chunk()
+        self.index_file.close()
+
+def read_index(path):
+    return np.fromfile(os.path.join(path, 'index.bin'), dtype=INDEX_DTYPE)
+
+def read_chunk(path, chunk, width, height):
+    filename = os.path.join(path, f"chunk_{chunk:05d}.raw")
+    return np.memmap(filename, dtype=np.uint8, mode='r').reshape(-1, height, width, 4)
+
+def ffmpeg_command(path, width, height, fps, format = VK_FORMAT_B8G8R8A8_UNORM):
+    pixel_format = 'bgra' if format in (VK_FORMAT_B8G8R8A8_UNORM, VK_FORMAT_B8G8R8A8_SRGB) else 'rgba'
+    return [
+        'ffmpeg', '-loglevel', 'error', '-y',
+        '-f', 'rawvideo', '-pix_fmt', pixel_format, '-s', f"{width}x{height}", '-r', str(fps),
+        '-i', '-', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path
+    ]
+
+class EncoderWriter:
+    def __init__(self, command, width, height) -> None:
+        # Raw frames go down a pipe to a local encoder, which only takes one frame size
+        self.shape = (height, width, 4)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame, timestamp_ns, array, format):
+        if array.shape != self.shape:
+            return False
+
+        self.process.stdin.write(memoryview(array).cast('B'))
+        return True
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+class CaptureSession:
+    def __init__(self, allocator, device, queue_family_index, writer, frame_count, queue_size, debug) -> None:
+        self.writer = writer
+        self.debug = debug
+
+        # Enough slots for the frames in flight plus everything queued, which is also the memory bound
+        self.ring = readback.ReadbackRing(allocator, device, queue_family_index, frame_count + queue_size, debug)
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Slots the writer is done with, released on the render thread which owns the ring
+        self.finished = queue.SimpleQueue()
+        self.pending = []
+
+        self.requested = 0
+        self.written = 0
+        self.dropped = {'ring_full': 0, 'queue_full': 0, 'rejected': 0, 'failed': 0}
+
+        self.thread = threading.Thread(target=self.run, name='capture', daemon=True)
+        self.thread.start()
+
+        if debug:
+            print(f"Capturing frames with a queue of {queue_size}")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            (frame, timestamp_ns) = item
+            try:
+                if self.writer.write(frame.frame, timestamp_ns, frame.array, frame.format):
+                    self.written += 1
+                else:
+                    self.dropped['rejected'] += 1
+            except Exception as e:
+                # One bad frame must not stop the writer, the slot still goes back to the ring
+                self.dropped['failed'] += 1
+                if self.debug:
+                    print(f"Failed to write captured frame {frame.frame}: {e}")
+            finally:
+                self.finished.put(frame)
+
+    def release_finished(self):
+        while True:
+            try:
+                frame = self.finished.get_nowait()
+            except queue.Empty:
+                return
+            frame.release()
+
+    def put(self, item, block):
+        # A blocking put gives up once the writer thread is gone, nothing would ever make room
+        while True:
+            try:
+                self.queue.put(item, block=block, timeout=0.1 if block else None)
+                return True
+            except queue.Full:
+                if not block or not self.thread.is_alive():
+                    return False
+
+    def hand_off(self, frame, timestamp_ns, block):
+        if not self.put((frame, timestamp_ns), block):
+            # The writer is behind, drop instead of holding up presentation
+            self.dropped['queue_full'] += 1
+            frame.release()
+
+    def pump(self):
+        # Once per rendered frame, after the engine has retired the slot it is about to reuse
+        self.release_finished()
+
+        remaining = []
+        for (future, timestamp_ns) in self.pending:
+            if future.done():
+                self.hand_off(future.result(), timestamp_ns, False)
+            else:
+                remaining.append((future, timestamp_ns))
+        self.pending = remaining
+
+        future = self.ring.request()
+        if future is None:
+            self.dropped['ring_full'] += 1
+            return
+
+        # Stamped when the frame is requested, which is when its recording starts
+        self.requested += 1
+        self.pending.append((future, time.perf_counter_ns()))
+
+    def get_statistics(self):
+        return {
+            'requested': self.requested,
+            'written': self.written,
+            'queued': self.queue.qsize(),
+            'dropped': dict(self.dropped)
+        }
+
+    def stop(self):
+        # Frames already submitted are waited for on their own fences, then the writer drains
+        self.ring.cancel_requests()
+        for (future, timestamp_ns) in self.pending:
+            if not future.cancelled():
+                self.hand_off(self.ring.wait(future), timestamp_ns, True)
+        self.pending = []
+
+        self.put(None, True)
+        self.thread.join()
+        self.release_finished()
+
+        # Left behind when the writer thread died before draining
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].release()
+        self.writer.close()
+
+        self.ring.destroy()
+
+        if self.debug:
+            print('Capture statistics:', self.get_statistics())
+
+        return self.get_statistics()
@@ -0,0 +1,56 @@
+from vulkan import *
+
+def make_command_pool(device, queue_family_index, debug, flags = VK_COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT):
+    pool_info = VkCommandPoolCreateInfo(
+        sType=VK_STRUCTURE_TYPE_COMMAND_POOL_CREATE_INFO,
+        queueFamilyIndex=queue_family_index,
+        flags=flags
+    )
+
+    if debug:
+        print(f"Creating command pool for queue family {queue_family_index}")
+
+    return vkCreateCommandPool(device, pool_info, None)
+
+def make_command_buffers(device, command_pool, count, debug, level = VK_COMMAND_BUFFER_LEVEL_PRIMARY):
+    alloc_info = VkCommandBufferAllocateInfo(
+        sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_ALLOCATE_INFO,
+        commandPool=command_pool,
+        level=level,
+        commandBufferCount=count
+    )
+
+    if debug:
+        print(f"Allocating {count} command buffers")
+
+    return list(vkAllocateCommandBuffers(device, alloc_info))
+
+def begin_single_time_commands(device, command_pool):
+    command_buffer = make_command_buffers(device, command_pool, 1, False)[0]
+
+    begin_info = VkCommandBufferBeginInfo(
+        sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+        flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+    )
+
+    vkBeginCommandBuffer(command_buffer, begin_info)
+
+    return command_buffer
+
+def end_single_time_commands(device, command_pool, queue, command_buffer):
+    vkEndCommandBuffer(command_buffer)
+
+    submit_info = VkSubmitInfo(
+        sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+        commandBufferCount=1,
+        pCommandBuffers=[command_buffer]
+    )
+
+    fence_info = VkFenceCreateInfo(sType=VK_STRUCTURE_TYPE_FENCE_CREATE_INFO)
+    fence = vkCreateFence(device, fence_info, None)
+
+    vkQueueSubmit(queue, 1, [submit_info], fence)
+    vkWaitForFences(device, 1, [fence], VK_TRUE, UINT64_MAX)
+
+    vkDestroyFence(device, fence, None)
+    vkFreeCommandBuffers(device, command_pool, 1, [command_buffer])
@@ -0,0 +1,319 @@
+from vulkan import *
+import concurrent.futures
+import numpy as np
+import commands
+import pipeline
+import sync
+
+# Push constants of shaders/integrate.comp
+INTEGRATE_PARAMS_DTYPE = np.dtype([('acceleration', '<f4', (4,)), ('dt', '<f4'), ('count', '<u4')])
+INTEGRATE_GROUP_SIZE = 64
+
+def group_count(invocations, local_size):
+    return (invocations + local_size - 1) // local_size
+
+class ComputeKernel:
+    def __init__(self, device, pipeline_cache, filepath, binding_count, push_constant_size, debug, shader_cache = None) -> None:
+        self.device = device
+        self.filepath = filepath
+        self.binding_count = binding_count
+        self.push_constant_size = push_constant_size
+
+        # Every binding is a storage buffer, in the order buffers are passed to dispatch
+        bindings = [
+            VkDescriptorSetLayoutBinding(
+                binding=binding,
+                descriptorType=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+                descriptorCount=1,
+                stageFlags=VK_SHADER_STAGE_COMPUTE_BIT
+            )
+            for binding in range(binding_count)
+        ]
+
+        layout_info = VkDescriptorSetLayoutCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_LAYOUT_CREATE_INFO,
+            bindingCount=len(bindings),
+            pBindings=bindings
+        )
+        self.descriptor_set_layout = vkCreateDescriptorSetLayout(device, layout_info, None)
+
+        push_constant_ranges = None
+        if push_constant_size > 0:
+            push_constant_ranges = [VkPushConstantRange(
+                stageFlags=VK_SHADER_STAGE_COMPUTE_BIT,
+                offset=0,
+                size=push_constant_size
+            )]
+
+        self.pipeline_layout = pipeline.create_pipeline_layout(device, [self.descriptor_set_layout], push_constant_ranges)
+        self.pipeline = pipeline.create_compute_pipeline(device, filepath, self.pipeline_layout, pipeline_cache, debug, shader_cache)
+
+    def destroy(self):
+        vkDestroyPipeline(self.device, self.pipeline, None)
+        vkDestroyPipelineLayout(self.device, self.pipeline_layout, None)
+        vkDestroyDescriptorSetLayout(self.device, self.descriptor_set_layout, None)
+
+class ComputeBuffer:
+    def __init__(self, allocator, shape, dtype) -> None:
+        self.allocator = allocator
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape) if np.iterable(shape) else (shape,)
+
+        count = int(np.prod(self.shape))
+        self.nbytes = count * self.dtype.itemsize
+
+        # Host memory so arrays are bound without a staging copy, cached where possible for readback
+        (self.buffer, self.allocation) = allocator.create_buffer(
+            max(self.nbytes, 4),
+            VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_SRC_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+            VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT,
+            VK_MEMORY_PROPERTY_HOST_CACHED_BIT
+        )
+
+        # Written before a dispatch and read after its future completes, never while it is in flight
+        self.array = np.frombuffer(self.allocation.mapped, dtype=self.dtype, count=count).reshape(self.shape)
+
+    def write(self, data):
+        self.array[...] = data
+
+    def destroy(self):
+        self.array = None
+        self.allocator.destroy_buffer(self.buffer, self.allocation)
+
+class ComputeSubmission:
+    def __init__(self, command_buffer, fence, buffers) -> None:
+        self.command_buffer = command_buffer
+        self.fence = fence
+        # Kept alive until the GPU is done with them
+        self.buffers = buffers
+        self.future = None
+
+class ComputeContext:
+    def __init__(self, allocator, device, queue_family_index, queue, pipeline_cache, debug, max_sets = 256, shader_cache = None) -> None:
+        self.allocator = allocator
+        self.device = device
+        self.queue = queue
+        self.pipeline_cache = pipeline_cache
+        self.shader_cache = shader_cache
+        self.max_sets = max_sets
+        self.debug = debug
+
+        self.command_pool = commands.make_command_pool(device, queue_family_index, debug)
+        self.free_submissions = []
+        self.in_flight = []
+
+        self.kernels = []
+        self.buffers = []
+
+        pool_size = VkDescriptorPoolSize(
+            type=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+            descriptorCount=8 * max_sets
+        )
+        pool_info = VkDescriptorPoolCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_POOL_CREATE_INFO,
+            flags=VK_DESCRIPTOR_POOL_CREATE_FREE_DESCRIPTOR_SET_BIT,
+            maxSets=max_sets,
+            poolSizeCount=1,
+            pPoolSizes=[pool_size]
+        )
+        self.descriptor_pool = vkCreateDescriptorPool(device, pool_info, None)
+
+        # (kernel, buffers) -> descriptor set, so repeated dispatches skip vkUpdateDescriptorSets
+        self.descriptor_sets = {}
+
+        # One waiter is enough, fences on a single queue signal in submission order
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='compute')
+
+        if debug:
+            print(f"Dispatching compute work on queue family {queue_family_index}")
+
+    def create_kernel(self, filepath, binding_count, push_constant_size = 0):
+        kernel = ComputeKernel(self.device, self.pipeline_cache, filepath, binding_count, push_constant_size, self.debug, self.shader_cache)
+        self.kernels.append(kernel)
+        return kernel
+
+    def create_buffer(self, shape, dtype):
+        buffer = ComputeBuffer(self.allocator, shape, dtype)
+        self.buffers.append(buffer)
+        return buffer
+
+    def from_array(self, array):
+        buffer = self.create_buffer(array.shape, array.dtype)
+        buffer.write(array)
+        return buffer
+
+    def destroy_buffer(self, buffer):
+        # Cached sets pointing at the buffer would be left dangling
+        self.wait_idle()
+        stale = [key for key in self.descriptor_sets if buffer in key[1]]
+        for key in stale:
+            vkFreeDescriptorSets(self.device, self.descriptor_pool, 1, [self.descriptor_sets.pop(key)])
+
+        self.buffers.remove(buffer)
+        buffer.destroy()
+
+    def get_descriptor_set(self, kernel, buffers):
+        key = (kernel, tuple(buffers))
+        descriptor_set = self.descriptor_sets.get(key)
+        if descriptor_set is not None:
+            return descriptor_set
+
+        alloc_info = VkDescriptorSetAllocateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_ALLOCATE_INFO,
+            descriptorPool=self.descriptor_pool,
+            descriptorSetCount=1,
+            pSetLayouts=[kernel.descriptor_set_layout]
+        )
+
+        try:
+            descriptor_set = vkAllocateDescriptorSets(self.device, alloc_info)[0]
+        except (VkErrorOutOfPoolMemory, VkErrorFragmentedPool):
+            # Start the cache over once everything that could still read a set has finished
+            self.wait_idle()
+            vkResetDescriptorPool(self.device, self.descriptor_pool, 0)
+            self.descriptor_sets = {}
+            descriptor_set = vkAllocateDescriptorSets(self.device, alloc_info)[0]
+
+        writes = [
+            VkWriteDescriptorSet(
+                sType=VK_STRUCTURE_TYPE_WRITE_DESCRIPTOR_SET,
+                dstSet=descriptor_set,
+                dstBinding=binding,
+                dstArrayElement=0,
+                descriptorCount=1,
+                descriptorType=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+                pBufferInfo=[VkDescriptorBufferInfo(buffer=buffer.buffer, offset=0, range=VK_WHOLE_SIZE)]
+            )
+            for (binding, buffer) in enumerate(buffers)
+        ]
+        vkUpdateDescriptorSets(self.device, len(writes), writes, 0, None)
+
+        self.descriptor_sets[key] = descriptor_set
+        return descriptor_set
+
+    def get_submission(self, buffers):
+        self.poll()
+
+        if self.free_submissions:
+            submission = self.free_submissions.pop()
+            vkResetFences(self.device, 1, [submission.fence])
+            submission.buffers = buffers
+            return submission
+
+        command_buffer = commands.make_command_buffers(self.device, self.command_pool, 1, False)[0]
+        fence = sync.make_fence(self.device, self.debug, signaled=False)
+        return ComputeSubmission(command_buffer, fence, buffers)
+
+    def dispatch(self, kernel, buffers, groups, push_constants = None, read_back = ()):
+        if len(buffers) != kernel.binding_count:
+            raise Exception(f"{kernel.filepath} takes {kernel.binding_count} buffers, got {len(buffers)}")
+
+        if isinstance(groups, int):
+            groups = (groups, 1, 1)
+        groups = tuple(groups) + (1,) * (3 - len(groups))
+
+        descriptor_set = self.get_descriptor_set(kernel, buffers)
+        submission = self.get_submission(list(buffers))
+        command_buffer = submission.command_buffer
+
+        begin_info = VkCommandBufferBeginInfo(
+            sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+            flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+        )
+        vkBeginCommandBuffer(command_buffer, begin_info)
+
+        vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, kernel.pipeline)
+        vkCmdBindDescriptorSets(
+            command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, kernel.pipeline_layout,
+            0, 1, [descriptor_set], 0, None
+        )
+
+        if push_constants is not None:
+            data = np.ascontiguousarray(push_constants)
+            if data.nbytes > kernel.push_constant_size:
+                raise Exception(f"{data.nbytes} bytes of push constants do not fit in {kernel.push_constant_size}")
+            vkCmdPushConstants(
+                command_buffer, kernel.pipeline_layout, VK_SHADER_STAGE_COMPUTE_BIT,
+                0, data.nbytes, ffi.from_buffer(data)
+            )
+
+        vkCmdDispatch(command_buffer, *groups)
+
+        # Shader writes become visible to the host and to whatever is dispatched next on this queue
+        barrier = VkMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_SHADER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_HOST_READ_BIT | VK_ACCESS_SHADER_READ_BIT | VK_ACCESS_SHADER_WRITE_BIT
+        )
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT,
+            VK_PIPELINE_STAGE_HOST_BIT | VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT,
+            0, 1, [barrier], 0, None, 0, None
+        )
+
+        vkEndCommandBuffer(command_buffer)
+
+        submit_info = VkSubmitInfo(
+            sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+            commandBufferCount=1,
+            pCommandBuffers=[command_buffer]
+        )
+        vkQueueSubmit(self.queue, 1, [submit_info], submission.fence)
+
+        outputs = [buffers[i] for i in read_back]
+        submission.future = self.executor.submit(self.wait, submission.fence, outputs)
+        self.in_flight.append(submission)
+
+        return submission.future
+
+    def wait(self, fence, outputs):
+        # Runs on the waiter thread, cffi releases the GIL while the fence is waited on
+        vkWaitForFences(self.device, 1, [fence], VK_TRUE, UINT64_MAX)
+
+        # Copies, so the buffers can be reused as soon as the future completes
+        return [output.array.copy() for output in outputs]
+
+    def poll(self):
+        remaining = []
+        for submission in self.in_flight:
+            if submission.future.done():
+                submission.buffers = None
+                submission.future = None
+                self.free_submissions.append(submission)
+            else:
+                remaining.append(submission)
+        self.in_flight = remaining
+
+    def wait_idle(self):
+        for submission in self.in_flight:
+            submission.future.result()
+        self.poll()
+
+    def destroy(self):
+        self.wait_idle()
+        self.executor.shutdown(wait=True)
+
+        for submission in self.free_submissions:
+            vkDestroyFence(self.device, submission.fence, None)
+        vkDestroyCommandPool(self.device, self.command_pool, None)
+
+        vkDestroyDescriptorPool(self.device, self.descriptor_pool, None)
+
+        for kernel in self.kernels:
+            kernel.destroy()
+        for buffer in self.buffers:
+            buffer.destroy()
+
+def make_integrate_kernel(context):
+    return context.create_kernel('shaders/integrate.spv', 2, INTEGRATE_PARAMS_DTYPE.itemsize)
+
+def integrate_particles(context, kernel, positions, velocities, dt, acceleration = (0.0, -9.81, 0.0)):
+    # positions and velocities are (n, 4) float32 ComputeBuffers, both are updated in place
+    count = positions.shape[0]
+
+    params = np.zeros((), dtype=INTEGRATE_PARAMS_DTYPE)
+    params['acceleration'][:3] = acceleration
+    params['dt'] = dt
+    params['count'] = count
+
+    return context.dispatch(kernel, [positions, velocities], group_count(count, INTEGRATE_GROUP_SIZE), params)
@@ -0,0 +1,296 @@
+from vulkan import *
+import threading
+
+# Descriptors of each type reserved per set when a pool is created
+POOL_RATIOS = {
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER: 2.0,
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC: 1.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER: 2.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER_DYNAMIC: 0.5,
+    VK_DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER: 4.0,
+    VK_DESCRIPTOR_TYPE_SAMPLED_IMAGE: 1.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_IMAGE: 1.0,
+    VK_DESCRIPTOR_TYPE_SAMPLER: 0.5
+}
+
+BUFFER_TYPES = (
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER,
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER_DYNAMIC
+)
+
+def binding(index, descriptor_type, stages, count = 1):
+    # A layout signature is a tuple of these, so equal layouts hash the same
+    return (index, descriptor_type, count, stages)
+
+def buffer_write(index, descriptor_type, buffer, offset = 0, size = VK_WHOLE_SIZE):
+    return (index, descriptor_type, buffer, offset, size)
+
+def image_write(index, descriptor_type, image_view, sampler = None, layout = VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL):
+    return (index, descriptor_type, image_view, sampler, layout)
+
+def update_set(device, descriptor_set, writes):
+    descriptor_writes = []
+    for write in writes:
+        (index, descriptor_type) = write[:2]
+
+        if descriptor_type in BUFFER_TYPES:
+            (buffer, offset, size) = write[2:]
+            info = {'pBufferInfo': [VkDescriptorBufferInfo(buffer=buffer, offset=offset, range=size)]}
+        else:
+            (image_view, sampler, layout) = write[2:]
+            info = {'pImageInfo': [VkDescriptorImageInfo(sampler=sampler, imageView=image_view, imageLayout=layout)]}
+
+        descriptor_writes.append(VkWriteDescriptorSet(
+            sType=VK_STRUCTURE_TYPE_WRITE_DESCRIPTOR_SET,
+            dstSet=descriptor_set,
+            dstBinding=index,
+            dstArrayElement=0,
+            descriptorCount=1,
+            descriptorType=descriptor_type,
+            **info
+        ))
+
+    vkUpdateDescriptorSets(device, len(descriptor_writes), descriptor_writes, 0, None)
+
+class LayoutCache:
+    def __init__(self, device, debug) -> None:
+        self.device = device
+        self.debug = debug
+        self.layouts = {}
+        # Draw callbacks on the recording workers look layouts up too
+        self.lock = threading.Lock()
+
+    def get(self, bindings):
+        # Binding order does not change the layout, so it does not change the key either
+        key = tuple(sorted(bindings))
+        with self.lock:
+            layout = self.layouts.get(key)
+            if layout is None:
+                layout = self.create_layout(key)
+                self.layouts[key] = layout
+
+        return layout
+
+    def create_layout(self, key):
+        layout_bindings = [
+            VkDescriptorSetLayoutBinding(
+                binding=index,
+                descriptorType=descriptor_type,
+                descriptorCount=count,
+                stageFlags=stages
+            )
+            for (index, descriptor_type, count, stages) in key
+        ]
+
+        layout_info = VkDescriptorSetLayoutCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_LAYOUT_CREATE_INFO,
+            bindingCount=len(layout_bindings),
+            pBindings=layout_bindings
+        )
+        layout = vkCreateDescriptorSetLayout(self.device, layout_info, None)
+
+        if self.debug:
+            print(f"Created descriptor set layout with {len(key)} bindings")
+
+        return layout
+
+    def destroy(self):
+        for layout in self.layouts.values():
+            vkDestroyDescriptorSetLayout(self.device, layout, None)
+        self.layouts = {}
+
+# allocate, release, reset and has_allocations may be called from any thread, the render thread and
+# the recording workers share one allocator per frame slot and the persistent set cache.
+# destroy only runs on the render thread once the device is idle
+class DescriptorAllocator:
+    def __init__(self, device, debug, sets_per_pool = 64, max_sets_per_pool = 4096, flags = 0) -> None:
+        self.device = device
+        self.debug = debug
+        self.sets_per_pool = sets_per_pool
+        self.max_sets_per_pool = max_sets_per_pool
+        self.flags = flags
+
+        # Full pools are set aside, reset ones and ones with freed sets are handed out again before
+        # anything new is created
+        self.current = None
+        self.current_is_new = False
+        self.used = []
+        self.free = []
+        self.allocated = 0
+        # pool -> sets still allocated from it
+        self.live = {}
+        # Pools must be externally synchronized, and secondaries recorded in parallel allocate from the same ones
+        self.lock = threading.Lock()
+
+    def create_pool(self):
+        pool_sizes = [
+            VkDescriptorPoolSize(type=descriptor_type, descriptorCount=max(1, int(ratio * self.sets_per_pool)))
+            for (descriptor_type, ratio) in POOL_RATIOS.items()
+        ]
+
+        pool_info = VkDescriptorPoolCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_POOL_CREATE_INFO,
+            flags=self.flags,
+            maxSets=self.sets_per_pool,
+            poolSizeCount=len(pool_sizes),
+            pPoolSizes=pool_sizes
+        )
+        pool = vkCreateDescriptorPool(self.device, pool_info, None)
+
+        if self.debug:
+            print(f"Created descriptor pool for {self.sets_per_pool} sets")
+
+        # Each new pool is bigger, so a busy frame settles on a few large pools
+        self.sets_per_pool = min(self.sets_per_pool * 2, self.max_sets_per_pool)
+
+        return pool
+
+    def next_pool(self):
+        # Called with the lock held, like create_pool
+        if self.current is not None:
+            self.used.append(self.current)
+
+        self.current_is_new = not self.free
+        self.current = self.free.pop() if self.free else self.create_pool()
+
+    def allocate_from(self, pool, layout):
+        alloc_info = VkDescriptorSetAllocateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_ALLOCATE_INFO,
+            descriptorPool=pool,
+            descriptorSetCount=1,
+            pSetLayouts=[layout]
+        )
+
+        return vkAllocateDescriptorSets(self.device, alloc_info)[0]
+
+    def allocate(self, layout):
+        with self.lock:
+            if self.current is None:
+                self.next_pool()
+
+            while True:
+                try:
+                    descriptor_set = self.allocate_from(self.current, layout)
+                    break
+                except (VkErrorOutOfPoolMemory, VkErrorFragmentedPool):
+                    # A pool with freed sets can still be too fragmented, only a fresh one failing is final
+                    if self.current_is_new:
+                        raise
+                    self.next_pool()
+
+            self.allocated += 1
+            self.live[self.current] = self.live.get(self.current, 0) + 1
+            return (self.current, descriptor_set)
+
+    def release(self, pool, descriptor_set):
+        # Only for pools created with VK_DESCRIPTOR_POOL_CREATE_FREE_DESCRIPTOR_SET_BIT
+        with self.lock:
+            vkFreeDescriptorSets(self.device, pool, 1, [descriptor_set])
+            self.allocated -= 1
+            self.live[pool] -= 1
+
+            if self.live[pool] == 0:
+                # Nothing left in it, a reset also undoes any fragmentation
+                vkResetDescriptorPool(self.device, pool, 0)
+                del self.live[pool]
+
+            if pool in self.used:
+                self.used.remove(pool)
+                self.free.append(pool)
+
+    def has_allocations(self):
+        with self.lock:
+            return self.allocated > 0
+
+    def reset(self):
+        # Only once every command buffer using these sets has finished, e.g. after the frame fence
+        with self.lock:
+            if self.allocated == 0 and not self.used:
+                return
+
+            pools = self.used + ([self.current] if self.current is not None else [])
+            for pool in pools:
+                vkResetDescriptorPool(self.device, pool, 0)
+
+            self.free += pools
+            self.used = []
+            self.current = None
+            self.allocated = 0
+            self.live = {}
+
+    def destroy(self):
+        for pool in self.used + self.free + ([self.current] if self.current is not None else []):
+            vkDestroyDescriptorPool(self.device, pool, None)
+
+        self.used = []
+        self.free = []
+        self.current = None
+        self.live = {}
+
+class DescriptorSetCache:
+    def __init__(self, device, layout_cache, debug) -> None:
+        self.device = device
+        self.layout_cache = layout_cache
+        self.debug = debug
+
+        # Persistent sets are freed one by one when a resource they point at goes away
+        self.allocator = DescriptorAllocator(device, debug, flags=VK_DESCRIPTOR_POOL_CREATE_FREE_DESCRIPTOR_SET_BIT)
+        # (layout signature, writes) -> (pool, set)
+        self.sets = {}
+        self.updates = 0
+        # Held from lookup to insert, so two recording workers never make the same set twice
+        self.lock = threading.Lock()
+
+    def get(self, bindings, writes):
+        key = (tuple(sorted(bindings)), tuple(sorted(writes, key=lambda write: write[0])))
+        with self.lock:
+            entry = self.sets.get(key)
+            if entry is not None:
+                return entry[1]
+
+            layout = self.layout_cache.get(bindings)
+            (pool, descriptor_set) = self.allocator.allocate(layout)
+            update_set(self.device, descriptor_set, key[1])
+            self.updates += 1
+
+            self.sets[key] = (pool, descriptor_set)
+            return descriptor_set
+
+    def invalidate(self, handle):
+        # Drops every set that points at a buffer, image view or sampler about to be destroyed
+        with self.lock:
+            stale = [key for key in self.sets if any(handle in write[2:] for write in key[1])]
+            for key in stale:
+                (pool, descriptor_set) = self.sets.pop(key)
+                self.allocator.release(pool, descriptor_set)
+
+        return len(stale)
+
+    def destroy(self):
+        self.sets = {}
+        self.allocator.destroy()
+
+class FrameDescriptors:
+    def __init__(self, device, layout_cache, debug) -> None:
+        self.device = device
+        self.layout_cache = layout_cache
+        self.allocator = DescriptorAllocator(device, debug)
+
+    def allocate(self, bindings, writes):
+        # Transient, only valid for command buffers recorded in this frame slot before its next reset.
+        # The allocator's lock covers the pool, the new set is only seen by this thread until it is returned
+        layout = self.layout_cache.get(bindings)
+        (_, descriptor_set) = self.allocator.allocate(layout)
+        update_set(self.device, descriptor_set, writes)
+        return descriptor_set
+
+    def has_allocations(self):
+        return self.allocator.has_allocations()
+
+    def reset(self):
+        self.allocator.reset()
+
+    def destroy(self):
+        self.allocator.destroy()
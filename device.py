@@ -1,20 +1,61 @@
 from vulkan import *
-import queue_families
+import capabilities
+import selection
 
-def is_suitable_device(device, debug_mode):
-    requested_extensions = [VK_KHR_SWAPCHAIN_EXTENSION_NAME]
+def get_required_extensions(headless):
+    if headless:
+        return []
 
-    supported_extensions = [
-        e.extensionName for e in vkEnumerateDeviceExtensionProperties(device, None)
+    return [VK_KHR_SWAPCHAIN_EXTENSION_NAME]
+
+# Optional extensions that depend on VK_KHR_get_physical_device_properties2 being enabled on the instance
+PROPERTIES_2_EXTENSIONS = [VK_EXT_MEMORY_BUDGET_EXTENSION_NAME]
+
+def get_optional_extensions():
+    return [VK_KHR_DRAW_INDIRECT_COUNT_EXTENSION_NAME, VK_EXT_MEMORY_BUDGET_EXTENSION_NAME]
+
+def get_enabled_extensions(device_capabilities, headless):
+    optional_extensions = [
+        e for e in get_optional_extensions()
+        if device_capabilities.supports_extension(e) and (e not in PROPERTIES_2_EXTENSIONS or device_capabilities.has_properties_2)
     ]
 
+    return get_required_extensions(headless) + optional_extensions
+
+def get_required_features():
+    return []
+
+def get_enabled_features(device_capabilities):
+    # Optional features are turned on whenever the device has them
+    supported = device_capabilities.features
+
+    return VkPhysicalDeviceFeatures(
+        pipelineStatisticsQuery=supported.pipelineStatisticsQuery,
+        # Lets secondaries recorded in parallel run inside the primary's statistics query
+        inheritedQueries=supported.inheritedQueries
+    )
+
+def is_suitable_device(device_capabilities, debug_mode, headless = False):
+    requested_extensions = get_required_extensions(headless)
+
     for extension in requested_extensions:
-        if extension not in supported_extensions:
+        if not device_capabilities.supports_extension(extension):
             return False
-    
+
+    for feature in get_required_features():
+        if not getattr(device_capabilities.features, feature):
+            return False
+
+    families = device_capabilities.queue_families
+    if not any(family.queueFlags & VK_QUEUE_GRAPHICS_BIT for family in families):
+        return False
+
+    if not headless and not any(device_capabilities.present_support):
+        return False
+
     return True
 
-def choose_physical_device(instance, debug_mode):
+def choose_physical_device(instance, instance_dispatch, surface, debug_mode, headless = False, policy = None):
     if debug_mode:
         print('Choosing physical device')
 
@@ -23,14 +64,31 @@ def choose_physical_device(instance, debug_mode):
     if debug_mode:
         print(f"Found {len(devices)} devices")
 
+    if policy is None:
+        policy = selection.SelectionPolicy()
+
+    # Each device is queried once, the chosen snapshot is what the rest of setup reads
+    candidates = []
     for device in devices:
+        device_capabilities = capabilities.DeviceCapabilities(device, instance_dispatch, surface, debug_mode)
         if debug_mode:
-            log_device_properties(device)
-        if is_suitable_device(device, debug_mode):
-            return device
-            
-def log_device_properties(device):
-    properties = vkGetPhysicalDeviceProperties(device)
+            log_device_properties(device_capabilities)
+        candidates.append(device_capabilities)
+
+    ranked = selection.rank_devices(
+        candidates, policy, lambda c: is_suitable_device(c, debug_mode, headless), debug_mode
+    )
+
+    if not ranked:
+        if policy.device_uuid is not None:
+            raise Exception(f"No suitable physical device with UUID {policy.device_uuid}")
+        raise Exception('No suitable physical device')
+
+    return ranked[0].capabilities
+
+
+def log_device_properties(device_capabilities):
+    properties = device_capabilities.properties
     print(f"Device name: {properties.deviceName}")
     
     if properties.deviceType == VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU:
@@ -44,11 +102,8 @@ def log_device_properties(device):
     else:
         print("Device type: Unknown")
 
-def create_logical_device(physicalDevice, instance, surface, debug):
-    indices = queue_families.find_queue_families(physicalDevice, instance, surface, debug)
-    unique_indices = [indices.graphics_queue_family]
-    if indices.present_queue_family not in unique_indices:
-        unique_indices.append(indices.present_queue_family)
+def create_logical_device(device_capabilities, indices, debug):
+    unique_indices = indices.unique_families()
 
 
     queueCreateInfos = []
@@ -63,11 +118,12 @@ def create_logical_device(physicalDevice, instance, surface, debug):
 
         queueCreateInfos.append(queueCreateInfo)
 
-    deviceFeatures = VkPhysicalDeviceFeatures()
+    deviceFeatures = get_enabled_features(device_capabilities)
 
-    deviceExtensions = [
-        VK_KHR_SWAPCHAIN_EXTENSION_NAME
-    ]
+    deviceExtensions = get_enabled_extensions(device_capabilities, device_capabilities.surface is None)
+
+    if debug:
+        print('Device extensions:', deviceExtensions)
 
     deviceCreateInfo = VkDeviceCreateInfo(
         sType=VK_STRUCTURE_TYPE_DEVICE_CREATE_INFO,
@@ -78,5 +134,5 @@ def create_logical_device(physicalDevice, instance, surface, debug):
         ppEnabledExtensionNames=deviceExtensions
     )
 
-    return vkCreateDevice(physicalDevice, deviceCreateInfo, None)
+    return vkCreateDevice(device_capabilities.physical_device, deviceCreateInfo, None)
 
@@ -0,0 +1,62 @@
+from vulkan import *
+
+# Extension entry points by the extension that provides them
+INSTANCE_FUNCTIONS = {
+    VK_KHR_SURFACE_EXTENSION_NAME: [
+        'vkDestroySurfaceKHR',
+        'vkGetPhysicalDeviceSurfaceSupportKHR',
+        'vkGetPhysicalDeviceSurfaceCapabilitiesKHR',
+        'vkGetPhysicalDeviceSurfaceFormatsKHR',
+        'vkGetPhysicalDeviceSurfacePresentModesKHR'
+    ],
+    VK_KHR_XLIB_SURFACE_EXTENSION_NAME: ['vkCreateXlibSurfaceKHR'],
+    VK_KHR_WAYLAND_SURFACE_EXTENSION_NAME: ['vkCreateWaylandSurfaceKHR'],
+    VK_KHR_WIN32_SURFACE_EXTENSION_NAME: ['vkCreateWin32SurfaceKHR'],
+    VK_KHR_GET_PHYSICAL_DEVICE_PROPERTIES_2_EXTENSION_NAME: [
+        'vkGetPhysicalDeviceProperties2KHR',
+        'vkGetPhysicalDeviceMemoryProperties2KHR'
+    ],
+    # Only enabled so VkPhysicalDeviceIDProperties may be chained, this entry point marks it as enabled
+    VK_KHR_EXTERNAL_MEMORY_CAPABILITIES_EXTENSION_NAME: ['vkGetPhysicalDeviceExternalBufferPropertiesKHR'],
+    VK_EXT_DEBUG_REPORT_EXTENSION_NAME: [
+        'vkCreateDebugReportCallbackEXT',
+        'vkDestroyDebugReportCallbackEXT'
+    ]
+}
+
+DEVICE_FUNCTIONS = {
+    VK_KHR_SWAPCHAIN_EXTENSION_NAME: [
+        'vkCreateSwapchainKHR',
+        'vkDestroySwapchainKHR',
+        'vkGetSwapchainImagesKHR',
+        'vkAcquireNextImageKHR',
+        'vkQueuePresentKHR'
+    ],
+    VK_KHR_DRAW_INDIRECT_COUNT_EXTENSION_NAME: ['vkCmdDrawIndexedIndirectCountKHR']
+}
+
+class DispatchTable:
+    def __init__(self, handle, get_proc_addr, functions, extensions, debug) -> None:
+        # Entry points of extensions that were not enabled are left as None
+        resolved = 0
+        for (extension, names) in functions.items():
+            for name in names:
+                function = None
+                if extension in extensions:
+                    try:
+                        function = get_proc_addr(handle, name)
+                        resolved += 1
+                    except ProcedureNotFoundError:
+                        if debug:
+                            print(f"Entry point {name} not found")
+                setattr(self, name, function)
+
+        if debug:
+            print(f"Resolved {resolved} extension entry points")
+
+def make_instance_dispatch(instance, extensions, debug):
+    return DispatchTable(instance, vkGetInstanceProcAddr, INSTANCE_FUNCTIONS, extensions, debug)
+
+def make_device_dispatch(device, extensions, debug):
+    # Device level pointers go straight to the driver, skipping the loader trampoline
+    return DispatchTable(device, vkGetDeviceProcAddr, DEVICE_FUNCTIONS, extensions, debug)
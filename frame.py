@@ -1,5 +1,44 @@
+from vulkan import *
+
 class SwapchainFrame:
     def __init__(self):
         self.image = None
         self.image_view = None
-        
\ No newline at end of file
+        self.framebuffer = None
+
+    def destroy(self, device):
+        if self.framebuffer is not None:
+            vkDestroyFramebuffer(device, self.framebuffer, None)
+            self.framebuffer = None
+
+        if self.image_view is not None:
+            vkDestroyImageView(device, self.image_view, None)
+            self.image_view = None
+
+class FrameInFlight:
+    def __init__(self):
+        self.commands = None
+        self.descriptors = None
+        self.uniforms = None
+        self.image_available = None
+        self.render_finished = None
+        self.in_flight = None
+
+    def destroy(self, device):
+        self.commands.destroy()
+        self.descriptors.destroy()
+        self.uniforms.destroy()
+        vkDestroySemaphore(device, self.image_available, None)
+        vkDestroySemaphore(device, self.render_finished, None)
+        vkDestroyFence(device, self.in_flight, None)
+
+class OffscreenFrame(SwapchainFrame):
+    def __init__(self):
+        super().__init__()
+        self.image_allocation = None
+
+    def destroy(self, device):
+        super().destroy(device)
+
+        vkDestroyImage(device, self.image, None)
+        self.image_allocation.free()
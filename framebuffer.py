@@ -0,0 +1,20 @@
+from vulkan import *
+
+def make_framebuffers(device, render_pass, extent, frames, debug):
+    for i, frame in enumerate(frames):
+        attachments = [frame.image_view]
+
+        framebuffer_info = VkFramebufferCreateInfo(
+            sType=VK_STRUCTURE_TYPE_FRAMEBUFFER_CREATE_INFO,
+            renderPass=render_pass,
+            attachmentCount=len(attachments),
+            pAttachments=attachments,
+            width=extent.width,
+            height=extent.height,
+            layers=1
+        )
+
+        frame.framebuffer = vkCreateFramebuffer(device, framebuffer_info, None)
+
+        if debug:
+            print(f"Made framebuffer for frame {i}")
@@ -0,0 +1,169 @@
+from vulkan import *
+import staging
+
+# Interleaved vertex layout: vec2 position followed by vec3 color, all float32
+VERTEX_STRIDE = 20
+
+def get_binding_descriptions():
+    return [
+        VkVertexInputBindingDescription(
+            binding=0,
+            stride=VERTEX_STRIDE,
+            inputRate=VK_VERTEX_INPUT_RATE_VERTEX
+        )
+    ]
+
+def get_attribute_descriptions():
+    return [
+        VkVertexInputAttributeDescription(
+            binding=0,
+            location=0,
+            format=VK_FORMAT_R32G32_SFLOAT,
+            offset=0
+        ),
+        VkVertexInputAttributeDescription(
+            binding=0,
+            location=1,
+            format=VK_FORMAT_R32G32B32_SFLOAT,
+            offset=8
+        )
+    ]
+
+def as_bytes(data):
+    view = memoryview(data)
+    if not view.c_contiguous:
+        raise Exception('Geometry data must be C-contiguous')
+
+    return view.cast('B')
+
+def get_index_type(data):
+    itemsize = memoryview(data).itemsize
+
+    if itemsize == 2:
+        return VK_INDEX_TYPE_UINT16
+    elif itemsize == 4:
+        return VK_INDEX_TYPE_UINT32
+    else:
+        raise Exception(f"Unsupported index size of {itemsize} bytes")
+
+class Mesh:
+    def __init__(self) -> None:
+        self.vertex_buffer = None
+        self.vertex_allocation = None
+        self.vertex_count = 0
+        self.index_buffer = None
+        self.index_allocation = None
+        self.index_count = 0
+        self.index_type = None
+        # Overrides on the engine's mesh pipeline description, None draws with the base pipeline
+        self.pipeline_variant = None
+
+    def destroy(self, allocator):
+        allocator.destroy_buffer(self.vertex_buffer, self.vertex_allocation)
+
+        if self.index_buffer is not None:
+            allocator.destroy_buffer(self.index_buffer, self.index_allocation)
+
+class PendingCopy:
+    def __init__(self, src_offset, dst_buffer, dst_offset, size) -> None:
+        self.src_offset = src_offset
+        self.dst_buffer = dst_buffer
+        self.dst_offset = dst_offset
+        self.size = size
+
+class GeometryUploader:
+    def __init__(self, allocator, ring_size, make_room, debug) -> None:
+        self.allocator = allocator
+        self.debug = debug
+        self.ring = staging.StagingRing(allocator, ring_size, debug)
+
+        # Called when the ring is full, must retire or submit pending work so space frees up
+        self.make_room = make_room
+        self.pending = []
+
+    def stage(self, data, dst_buffer):
+        view = as_bytes(data)
+        written = 0
+
+        # Data larger than the ring is split into chunks that each fit
+        while written < view.nbytes:
+            chunk = view[written:written + self.ring.size // 2]
+            offset = self.ring.write(chunk)
+
+            if offset is None:
+                self.make_room()
+                offset = self.ring.write(chunk)
+
+                if offset is None:
+                    raise Exception('Staging ring has no room after flushing')
+
+            self.pending.append(PendingCopy(offset, dst_buffer, written, chunk.nbytes))
+            written += chunk.nbytes
+
+    def create_device_buffer(self, size, usage):
+        return self.allocator.create_buffer(
+            size,
+            usage | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+            VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+        )
+
+    def upload_mesh(self, vertices, indices = None):
+        mesh = Mesh()
+
+        vertex_bytes = as_bytes(vertices)
+        mesh.vertex_count = vertex_bytes.nbytes // VERTEX_STRIDE
+        (mesh.vertex_buffer, mesh.vertex_allocation) = self.create_device_buffer(vertex_bytes.nbytes, VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+        self.stage(vertex_bytes, mesh.vertex_buffer)
+
+        if indices is not None:
+            index_bytes = as_bytes(indices)
+            mesh.index_type = get_index_type(indices)
+            mesh.index_count = index_bytes.nbytes // memoryview(indices).itemsize
+            (mesh.index_buffer, mesh.index_allocation) = self.create_device_buffer(index_bytes.nbytes, VK_BUFFER_USAGE_INDEX_BUFFER_BIT)
+            self.stage(index_bytes, mesh.index_buffer)
+
+        if self.debug:
+            print(f"Queued mesh upload: {mesh.vertex_count} vertices, {mesh.index_count} indices")
+
+        return mesh
+
+    def has_pending(self):
+        return len(self.pending) > 0
+
+    def record(self, command_buffer):
+        if not self.pending:
+            return
+
+        # One vkCmdCopyBuffer per destination, with every region staged for it
+        regions = {}
+        for copy in self.pending:
+            regions.setdefault(copy.dst_buffer, []).append(VkBufferCopy(
+                srcOffset=copy.src_offset,
+                dstOffset=copy.dst_offset,
+                size=copy.size
+            ))
+
+        for (dst_buffer, buffer_regions) in regions.items():
+            vkCmdCopyBuffer(command_buffer, self.ring.buffer, dst_buffer, len(buffer_regions), buffer_regions)
+
+        barrier = VkMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT | VK_ACCESS_INDEX_READ_BIT
+        )
+
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT,
+            0, 1, [barrier], 0, None, 0, None
+        )
+
+        self.pending = []
+
+    def mark_frame(self, slot):
+        self.ring.mark_frame(slot)
+
+    def retire_frame(self, slot):
+        self.ring.retire_frame(slot)
+
+    def destroy(self):
+        self.ring.destroy()
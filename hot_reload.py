@@ -0,0 +1,107 @@
+import os
+import threading
+from shaders import compiler
+
+class WatchedPipeline:
+    def __init__(self, name, filepaths, build, install) -> None:
+        self.name = name
+        self.filepaths = [os.path.abspath(filepath) for filepath in filepaths]
+        # Both run on the render thread, build reads the render pass and layouts the engine may replace,
+        # install waits until nothing in flight uses the old one
+        self.build = build
+        self.install = install
+
+class HotReloader:
+    def __init__(self, debug, interval = 0.5, directory = compiler.SHADER_DIRECTORY) -> None:
+        self.debug = debug
+        self.interval = interval
+
+        # Without a compiler edits to sources are ignored, rebuilt .spv files are still picked up
+        self.compiler = compiler.find_compiler()
+        self.outputs = compiler.read_outputs(directory)
+
+        self.pipelines = []
+        # .spv files written since the render thread last looked, the watcher never touches engine state
+        self.changed = set()
+        self.lock = threading.Lock()
+
+        self.mtimes = {}
+        self.scan()
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='hot-reload', daemon=True)
+        self.thread.start()
+
+        if debug:
+            print(f"Watching {len(self.outputs)} shaders in {directory}")
+
+    def register(self, name, filepaths, build, install):
+        with self.lock:
+            self.pipelines.append(WatchedPipeline(name, filepaths, build, install))
+
+    def scan(self):
+        changed = set()
+        for filepath in list(self.outputs.keys()) + list(self.outputs.values()):
+            try:
+                mtime = os.stat(filepath).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            if self.mtimes.get(filepath) != mtime:
+                if filepath in self.mtimes:
+                    changed.add(filepath)
+                self.mtimes[filepath] = mtime
+
+        return changed
+
+    def rebuild(self, changed):
+        outputs = {filepath for filepath in changed if filepath.endswith('.spv')}
+
+        if self.compiler is not None:
+            for source in changed:
+                if source not in self.outputs:
+                    continue
+                try:
+                    if compiler.build_source(source, self.outputs[source], self.compiler, debug=self.debug):
+                        outputs.add(self.outputs[source])
+                except Exception as e:
+                    # A typo mid edit should not take the watcher down, the next save retries
+                    print(e)
+
+        # Soak up the outputs just written so they are not seen as edits next time round
+        self.scan()
+
+        with self.lock:
+            self.changed |= outputs
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            changed = self.scan()
+            if changed:
+                self.rebuild(changed)
+
+    def take_ready(self):
+        # On the render thread at the start of a frame, so nothing it builds from can change underneath it
+        with self.lock:
+            outputs = self.changed
+            self.changed = set()
+            affected = [p for p in self.pipelines if any(filepath in outputs for filepath in p.filepaths)]
+
+        ready = []
+        for watched in affected:
+            try:
+                built = watched.build()
+            except Exception as e:
+                print(f"Failed to rebuild {watched.name}: {e}")
+                continue
+
+            ready.append((watched, built))
+
+            if self.debug:
+                print(f"Rebuilt {watched.name}")
+
+        return ready
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
@@ -0,0 +1,56 @@
+import numpy as np
+
+# Runs in the decode worker processes, so it stays free of Vulkan and the engine's modules
+
+# Largest side of the mip tail uploaded first, before the full image is streamed in
+TAIL_SIZE = 64
+
+def mip_count(width, height):
+    return max(width, height).bit_length()
+
+def mip_extent(width, height, level):
+    return (max(1, width >> level), max(1, height >> level))
+
+def downsample(pixels):
+    # 2x2 box filter, an odd last row or column is dropped so sizes follow the Vulkan mip chain
+    pixels = pixels.astype(np.uint16)
+
+    if pixels.shape[0] > 1:
+        rows = pixels.shape[0] // 2 * 2
+        pixels = (pixels[0:rows:2] + pixels[1:rows:2] + 1) // 2
+    if pixels.shape[1] > 1:
+        columns = pixels.shape[1] // 2 * 2
+        pixels = (pixels[:, 0:columns:2] + pixels[:, 1:columns:2] + 1) // 2
+
+    return pixels.astype(np.uint8)
+
+def make_tail(pixels, tail_size = TAIL_SIZE):
+    level = 0
+    while max(pixels.shape[0], pixels.shape[1]) > tail_size:
+        pixels = downsample(pixels)
+        level += 1
+
+    return (level, np.ascontiguousarray(pixels))
+
+def load_pixels(path):
+    if path.endswith('.npy'):
+        pixels = np.load(path)
+    else:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise Exception(f"Decoding {path} needs Pillow, only .npy textures load without it")
+
+        with Image.open(path) as image:
+            pixels = np.asarray(image.convert('RGBA'))
+
+    if pixels.ndim != 3 or pixels.shape[2] != 4 or pixels.dtype != np.uint8:
+        raise Exception(f"{path} is not an RGBA8 image, got {pixels.dtype} {pixels.shape}")
+
+    return np.ascontiguousarray(pixels)
+
+def decode(path, tail_size = TAIL_SIZE):
+    pixels = load_pixels(path)
+    (tail_level, tail) = make_tail(pixels, tail_size)
+
+    return (pixels, tail_level, tail)
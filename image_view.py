@@ -0,0 +1,27 @@
+from vulkan import *
+
+def make_image_view(device, image, format, level_count = 1):
+    components = VkComponentMapping(
+        r=VK_COMPONENT_SWIZZLE_IDENTITY,
+        g=VK_COMPONENT_SWIZZLE_IDENTITY,
+        b=VK_COMPONENT_SWIZZLE_IDENTITY,
+        a=VK_COMPONENT_SWIZZLE_IDENTITY
+    )
+
+    subresourceRange = VkImageSubresourceRange(
+        aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+        baseMipLevel=0,
+        levelCount=level_count,
+        baseArrayLayer=0,
+        layerCount=1
+    )
+
+    create_info = VkImageViewCreateInfo(
+        image=image,
+        viewType=VK_IMAGE_VIEW_TYPE_2D,
+        format=format,
+        components=components,
+        subresourceRange=subresourceRange
+    )
+
+    return vkCreateImageView(device, create_info, None)
@@ -0,0 +1,315 @@
+from vulkan import *
+import numpy as np
+import instancing
+import pipeline
+
+CULL_SHADER = 'shaders/cull.spv'
+
+CULL_GROUP_SIZE = 64
+COMMAND_STRIDE = 20
+# vkCmdUpdateBuffer writes at most 65536 bytes
+MAX_GROUPS = 65536 // COMMAND_STRIDE
+
+# Matches the push constant block in shaders/cull.comp, exactly the guaranteed 128 bytes
+PUSH_CONSTANT_DTYPE = np.dtype([
+    ('first', '<u4'),
+    ('count', '<u4'),
+    ('group', '<u4'),
+    ('padding', '<u4'),
+    ('sphere', '<f4', (4,)),
+    ('planes', '<f4', (6, 4))
+])
+
+# Clip volume planes as (normal, distance), a sphere fully behind any one of them is culled
+CLIP_PLANES = np.array([
+    [ 1.0,  0.0,  0.0, 1.0],
+    [-1.0,  0.0,  0.0, 1.0],
+    [ 0.0,  1.0,  0.0, 1.0],
+    [ 0.0, -1.0,  0.0, 1.0],
+    [ 0.0,  0.0,  1.0, 0.0],
+    [ 0.0,  0.0, -1.0, 1.0]
+], dtype=np.float32)
+
+def get_bounding_sphere(vertices, stride = 5, components = 2):
+    positions = np.frombuffer(memoryview(vertices).cast('B'), dtype=np.float32).reshape(-1, stride)[:, :components]
+
+    center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+    radius = float(np.linalg.norm(positions - center, axis=1).max())
+
+    sphere = np.zeros(4, dtype=np.float32)
+    sphere[:components] = center
+    sphere[3] = radius
+    return sphere
+
+class IndirectGroup:
+    def __init__(self, index, mesh, first, capacity, sphere) -> None:
+        self.index = index
+        self.mesh = mesh
+        self.first = first
+        self.capacity = capacity
+        self.sphere = sphere
+        self.count = 0
+        # Bumped whenever the objects change, so recorded frames are not reused
+        self.version = 0
+        # Slice of the renderer's object array, written by the application
+        self.objects = None
+
+    def set_objects(self, objects):
+        count = len(objects)
+        if count > self.capacity:
+            raise Exception(f"{count} objects do not fit in a group of {self.capacity}")
+
+        self.objects[:count] = objects
+        self.count = count
+        self.version += 1
+
+class IndirectSlot:
+    def __init__(self) -> None:
+        self.object_buffer = None
+        self.object_allocation = None
+        self.object_view = None
+        self.visible_buffer = None
+        self.visible_allocation = None
+        self.command_buffer = None
+        self.command_allocation = None
+        self.count_buffer = None
+        self.count_allocation = None
+        self.descriptor_set = None
+
+class IndirectRenderer:
+    def __init__(self, allocator, device, pipeline_cache, capacity, frame_count, draw_indexed_indirect_count, debug, max_groups = 256, shader_cache = None) -> None:
+        if max_groups > MAX_GROUPS:
+            raise Exception(f"At most {MAX_GROUPS} indirect groups are supported")
+
+        self.allocator = allocator
+        self.device = device
+        self.capacity = capacity
+        self.max_groups = max_groups
+        self.debug = debug
+
+        # None when VK_KHR_draw_indirect_count is missing, every group then issues its draw
+        self.draw_indexed_indirect_count = draw_indexed_indirect_count
+
+        self.objects = np.zeros(capacity, dtype=instancing.INSTANCE_DTYPE)
+        self.objects['transform'] = np.identity(4, dtype=np.float32)
+        self.objects['color'] = 1.0
+        self.planes = CLIP_PLANES.copy()
+
+        self.groups = []
+        self.used = 0
+
+        self.make_pipeline(pipeline_cache, shader_cache)
+        self.make_slots(frame_count)
+
+        if debug:
+            print(f"Created indirect renderer for {capacity} objects in up to {max_groups} groups")
+
+    def make_pipeline(self, pipeline_cache, shader_cache):
+        bindings = [
+            VkDescriptorSetLayoutBinding(
+                binding=binding,
+                descriptorType=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+                descriptorCount=1,
+                stageFlags=VK_SHADER_STAGE_COMPUTE_BIT
+            )
+            for binding in range(4)
+        ]
+
+        layout_info = VkDescriptorSetLayoutCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_LAYOUT_CREATE_INFO,
+            bindingCount=len(bindings),
+            pBindings=bindings
+        )
+        self.descriptor_set_layout = vkCreateDescriptorSetLayout(self.device, layout_info, None)
+
+        push_constant_range = VkPushConstantRange(
+            stageFlags=VK_SHADER_STAGE_COMPUTE_BIT,
+            offset=0,
+            size=PUSH_CONSTANT_DTYPE.itemsize
+        )
+
+        self.pipeline_layout = pipeline.create_pipeline_layout(self.device, [self.descriptor_set_layout], [push_constant_range])
+        self.pipeline = pipeline.create_compute_pipeline(self.device, CULL_SHADER, self.pipeline_layout, pipeline_cache, self.debug, shader_cache)
+
+    def make_slots(self, frame_count):
+        pool_size = VkDescriptorPoolSize(
+            type=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+            descriptorCount=4 * frame_count
+        )
+
+        pool_info = VkDescriptorPoolCreateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_POOL_CREATE_INFO,
+            maxSets=frame_count,
+            poolSizeCount=1,
+            pPoolSizes=[pool_size]
+        )
+        self.descriptor_pool = vkCreateDescriptorPool(self.device, pool_info, None)
+
+        alloc_info = VkDescriptorSetAllocateInfo(
+            sType=VK_STRUCTURE_TYPE_DESCRIPTOR_SET_ALLOCATE_INFO,
+            descriptorPool=self.descriptor_pool,
+            descriptorSetCount=frame_count,
+            pSetLayouts=[self.descriptor_set_layout] * frame_count
+        )
+        descriptor_sets = vkAllocateDescriptorSets(self.device, alloc_info)
+
+        object_size = self.capacity * instancing.INSTANCE_DTYPE.itemsize
+
+        # Each frame slot culls into its own buffers, so a frame never overwrites what the previous one draws
+        self.slots = []
+        for descriptor_set in descriptor_sets:
+            slot = IndirectSlot()
+            slot.descriptor_set = descriptor_set
+
+            (slot.object_buffer, slot.object_allocation) = self.allocator.create_buffer(
+                object_size,
+                VK_BUFFER_USAGE_STORAGE_BUFFER_BIT,
+                VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+            slot.object_view = np.frombuffer(slot.object_allocation.mapped, dtype=instancing.INSTANCE_DTYPE, count=self.capacity)
+
+            (slot.visible_buffer, slot.visible_allocation) = self.allocator.create_buffer(
+                object_size,
+                VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_VERTEX_BUFFER_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+
+            (slot.command_buffer, slot.command_allocation) = self.allocator.create_buffer(
+                self.max_groups * COMMAND_STRIDE,
+                VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_INDIRECT_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+
+            (slot.count_buffer, slot.count_allocation) = self.allocator.create_buffer(
+                self.max_groups * 4,
+                VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_INDIRECT_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+
+            buffers = [slot.object_buffer, slot.visible_buffer, slot.command_buffer, slot.count_buffer]
+            writes = [
+                VkWriteDescriptorSet(
+                    sType=VK_STRUCTURE_TYPE_WRITE_DESCRIPTOR_SET,
+                    dstSet=descriptor_set,
+                    dstBinding=binding,
+                    dstArrayElement=0,
+                    descriptorCount=1,
+                    descriptorType=VK_DESCRIPTOR_TYPE_STORAGE_BUFFER,
+                    pBufferInfo=[VkDescriptorBufferInfo(buffer=buffer, offset=0, range=VK_WHOLE_SIZE)]
+                )
+                for (binding, buffer) in enumerate(buffers)
+            ]
+            vkUpdateDescriptorSets(self.device, len(writes), writes, 0, None)
+
+            self.slots.append(slot)
+
+    def add_group(self, mesh, capacity, sphere):
+        if mesh.index_buffer is None:
+            raise Exception('Indirect groups need an indexed mesh')
+
+        if len(self.groups) == self.max_groups:
+            raise Exception(f"No room for more than {self.max_groups} indirect groups")
+
+        if self.used + capacity > self.capacity:
+            raise Exception(f"No room for {capacity} more objects, {self.capacity - self.used} left")
+
+        group = IndirectGroup(len(self.groups), mesh, self.used, capacity, np.asarray(sphere, dtype=np.float32))
+        group.objects = self.objects[self.used:self.used + capacity]
+
+        self.groups.append(group)
+        self.used += capacity
+
+        return group
+
+    def has_work(self):
+        return any(group.count > 0 for group in self.groups)
+
+    def record_cull(self, command_buffer, slot_index):
+        if not self.has_work():
+            return
+
+        slot = self.slots[slot_index]
+
+        # One copy of every object, the per-object work happens on the GPU
+        slot.object_view[:self.used] = self.objects[:self.used]
+
+        # Fresh commands with no instances, the cull shader counts the survivors in.
+        # firstInstance stays 0, a nonzero one needs drawIndirectFirstInstance, see record_draw
+        commands = np.zeros((len(self.groups), 5), dtype=np.uint32)
+        for group in self.groups:
+            commands[group.index] = [group.mesh.index_count, 0, 0, 0, 0]
+        vkCmdUpdateBuffer(command_buffer, slot.command_buffer, 0, commands.nbytes, ffi.from_buffer(commands))
+        vkCmdFillBuffer(command_buffer, slot.count_buffer, 0, len(self.groups) * 4, 0)
+
+        barrier = VkMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_SHADER_READ_BIT | VK_ACCESS_SHADER_WRITE_BIT
+        )
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT,
+            0, 1, [barrier], 0, None, 0, None
+        )
+
+        vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, self.pipeline)
+        vkCmdBindDescriptorSets(command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, self.pipeline_layout, 0, 1, [slot.descriptor_set], 0, None)
+
+        params = np.zeros(1, dtype=PUSH_CONSTANT_DTYPE)
+        params['planes'] = self.planes
+        for group in self.groups:
+            if group.count == 0:
+                continue
+
+            params['first'] = group.first
+            params['count'] = group.count
+            params['group'] = group.index
+            params['sphere'] = group.sphere
+
+            vkCmdPushConstants(command_buffer, self.pipeline_layout, VK_SHADER_STAGE_COMPUTE_BIT, 0, params.nbytes, ffi.from_buffer(params))
+            vkCmdDispatch(command_buffer, (group.count + CULL_GROUP_SIZE - 1) // CULL_GROUP_SIZE, 1, 1)
+
+        barrier = VkMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_SHADER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_INDIRECT_COMMAND_READ_BIT | VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT
+        )
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT,
+            VK_PIPELINE_STAGE_DRAW_INDIRECT_BIT | VK_PIPELINE_STAGE_VERTEX_INPUT_BIT,
+            0, 1, [barrier], 0, None, 0, None
+        )
+
+    def record_draw(self, command_buffer, slot_index):
+        slot = self.slots[slot_index]
+
+        # Expects the instanced pipeline to be bound, visible objects are its per-instance data
+        for group in self.groups:
+            if group.count == 0:
+                continue
+
+            # The group's slice of visible objects is reached through the binding offset instead of firstInstance
+            mesh = group.mesh
+            instance_offset = group.first * instancing.INSTANCE_DTYPE.itemsize
+            vkCmdBindVertexBuffers(command_buffer, 0, 2, [mesh.vertex_buffer, slot.visible_buffer], [0, instance_offset])
+            vkCmdBindIndexBuffer(command_buffer, mesh.index_buffer, 0, mesh.index_type)
+
+            offset = group.index * COMMAND_STRIDE
+            if self.draw_indexed_indirect_count is not None:
+                # A fully culled group leaves its count at zero and the draw is skipped on the GPU
+                self.draw_indexed_indirect_count(command_buffer, slot.command_buffer, offset, slot.count_buffer, group.index * 4, 1, COMMAND_STRIDE)
+            else:
+                vkCmdDrawIndexedIndirect(command_buffer, slot.command_buffer, offset, 1, COMMAND_STRIDE)
+
+    def destroy(self):
+        for slot in self.slots:
+            slot.object_view = None
+            self.allocator.destroy_buffer(slot.object_buffer, slot.object_allocation)
+            self.allocator.destroy_buffer(slot.visible_buffer, slot.visible_allocation)
+            self.allocator.destroy_buffer(slot.command_buffer, slot.command_allocation)
+            self.allocator.destroy_buffer(slot.count_buffer, slot.count_allocation)
+
+        vkDestroyDescriptorPool(self.device, self.descriptor_pool, None)
+        vkDestroyPipeline(self.device, self.pipeline, None)
+        vkDestroyPipelineLayout(self.device, self.pipeline_layout, None)
+        vkDestroyDescriptorSetLayout(self.device, self.descriptor_set_layout, None)
@@ -0,0 +1,104 @@
+from vulkan import *
+import numpy as np
+
+# Per-instance record. The transform is stored column-major to match GLSL,
+# so instances['transform'][i][c] is column c of instance i's matrix.
+INSTANCE_DTYPE = np.dtype([
+    ('transform', '<f4', (4, 4)),
+    ('color', '<f4', (4,))
+])
+
+INSTANCE_BINDING = 1
+FIRST_INSTANCE_LOCATION = 2
+
+def get_binding_descriptions():
+    return [
+        VkVertexInputBindingDescription(
+            binding=INSTANCE_BINDING,
+            stride=INSTANCE_DTYPE.itemsize,
+            inputRate=VK_VERTEX_INPUT_RATE_INSTANCE
+        )
+    ]
+
+def get_attribute_descriptions():
+    # A mat4 attribute takes four consecutive locations, one per column
+    attributes = [
+        VkVertexInputAttributeDescription(
+            binding=INSTANCE_BINDING,
+            location=FIRST_INSTANCE_LOCATION + column,
+            format=VK_FORMAT_R32G32B32A32_SFLOAT,
+            offset=INSTANCE_DTYPE.fields['transform'][1] + column * 16
+        )
+        for column in range(4)
+    ]
+
+    attributes.append(VkVertexInputAttributeDescription(
+        binding=INSTANCE_BINDING,
+        location=FIRST_INSTANCE_LOCATION + 4,
+        format=VK_FORMAT_R32G32B32A32_SFLOAT,
+        offset=INSTANCE_DTYPE.fields['color'][1]
+    ))
+
+    return attributes
+
+class InstanceBatch:
+    def __init__(self, allocator, mesh, capacity, frame_count, debug) -> None:
+        self.allocator = allocator
+        self.mesh = mesh
+        self.capacity = capacity
+        self.count = 0
+        # Bumped whenever the instances change, so recorded frames are not reused
+        self.version = 0
+
+        # Written by the application, copied to the frame slot's buffer when recorded
+        self.instances = np.zeros(capacity, dtype=INSTANCE_DTYPE)
+        self.instances['transform'] = np.identity(4, dtype=np.float32)
+        self.instances['color'] = 1.0
+
+        # One buffer per frame in flight so updates never race the GPU reading the last frame
+        self.buffers = []
+        self.allocations = []
+        self.views = []
+        size = capacity * INSTANCE_DTYPE.itemsize
+        for _ in range(frame_count):
+            (buffer, allocation) = allocator.create_buffer(
+                size,
+                VK_BUFFER_USAGE_VERTEX_BUFFER_BIT,
+                VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+            self.buffers.append(buffer)
+            self.allocations.append(allocation)
+            self.views.append(np.frombuffer(allocation.mapped, dtype=INSTANCE_DTYPE, count=capacity))
+
+        if debug:
+            print(f"Created instance batch with room for {capacity} instances")
+
+    def set_instances(self, instances):
+        count = len(instances)
+        if count > self.capacity:
+            raise Exception(f"{count} instances do not fit in a batch of {self.capacity}")
+
+        self.instances[:count] = instances
+        self.count = count
+        self.version += 1
+
+    def record(self, command_buffer, slot):
+        if self.count == 0:
+            return
+
+        # A single memcpy of the live instances, then one draw for all of them
+        self.views[slot][:self.count] = self.instances[:self.count]
+
+        vkCmdBindVertexBuffers(command_buffer, 0, 2, [self.mesh.vertex_buffer, self.buffers[slot]], [0, 0])
+
+        if self.mesh.index_buffer is not None:
+            vkCmdBindIndexBuffer(command_buffer, self.mesh.index_buffer, 0, self.mesh.index_type)
+            vkCmdDrawIndexed(command_buffer, self.mesh.index_count, self.count, 0, 0, 0)
+        else:
+            vkCmdDraw(command_buffer, self.mesh.vertex_count, self.count, 0, 0)
+
+    def destroy(self):
+        self.views = []
+        for (buffer, allocation) in zip(self.buffers, self.allocations):
+            self.allocator.destroy_buffer(buffer, allocation)
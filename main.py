@@ -1,33 +1,111 @@
 import sdl2
+import sdl2.ext
 from vulkan import *
 import ctypes
+import sys
+import time
+import array
 import instance
-import logging
+import validation
 import device
 import surface
 import queue_families
 import swapchain
+import pipeline
+import framebuffer
+import commands
+import sync
+import frame
+import offscreen
+import pipeline_cache
+import allocator
+import geometry
+import transfer
+import instancing
+import indirect
+import recording
+import parallel
+import profiler
+import dispatch
+import compute
+import readback
+import capture
+import hot_reload
+import descriptors
+import pipeline_state
+import uniforms
+import textures
+from shaders import shaders, compiler
 class Engine:
-    def __init__(self) -> None:
-        self.debugMode = True
+    def __init__(self, max_frames_in_flight = 2, headless = False, pipeline_cache_path = 'pipeline_cache.bin', staging_size = 16 * 1024 * 1024, indirect_capacity = 16384, record_workers = 0, device_policy = None, readback_slots = 3, build_shaders = False, watch_shaders = False, pipeline_workers = 2, uniform_size = 4 * 1024 * 1024, texture_budget = None, decode_workers = 2, debug = True) -> None:
+        self.debugMode = debug
+        self.headless = headless
+        self.pipeline_cache_path = pipeline_cache_path
+        self.staging_size = staging_size
+        self.indirect_capacity = indirect_capacity
+        self.record_workers = record_workers
+        # selection.SelectionPolicy, None prefers a discrete GPU
+        self.device_policy = device_policy
+        self.readback_slots = readback_slots
+        # Compile changed GLSL sources at startup, and rebuild affected pipelines on edits while running
+        self.build_shaders = build_shaders
+        self.watch_shaders = watch_shaders
+        # Threads compiling pipeline variants in the background
+        self.pipeline_workers = pipeline_workers
+        # Bytes of per-draw uniform data each frame in flight can hand out
+        self.uniform_size = uniform_size
+        # Bytes of device memory textures may fill, None leaves it to the driver's budget
+        self.texture_budget = texture_budget
+        self.decode_workers = decode_workers
 
         self.width = 640
         self.height = 480
 
+        if max_frames_in_flight < 1:
+            raise Exception('At least one frame must be in flight')
+
+        self.max_frames_in_flight = max_frames_in_flight
+        self.current_frame = 0
+        self.framebuffer_resized = False
+
+        # Bumped by anything that changes what a frame records
+        self.scene_version = 0
+        self.last_recorded_version = None
+
+        # Seconds spent in each init stage, in the order they ran
+        self.startup_times = {}
+
         if self.debugMode:
             print('Creating graphics engine')
 
-        self.build_window()
-        self.make_instance()
-        self.make_debug_messenger()
-        self.make_surface()
-        self.make_device()
+        if self.headless:
+            self.wm_info = None
+        else:
+            self.run_stage(self.build_window)
+        self.run_stage(self.make_instance)
+        self.run_stage(self.make_debug_messenger)
+        self.run_stage(self.make_surface)
+        self.run_stage(self.make_device)
+        self.swapchain = None
+        self.run_stage(self.make_swapchain)
+        self.run_stage(self.make_pipeline_cache)
+        self.run_stage(self.make_shader_cache)
+        self.run_stage(self.make_descriptors)
+        self.run_stage(self.make_pipeline)
+        self.run_stage(self.finalize_setup)
+        self.run_stage(self.make_assets)
+
+    def run_stage(self, stage):
+        start = time.perf_counter()
+        stage()
+        self.startup_times[stage.__name__] = time.perf_counter() - start
 
     def make_debug_messenger(self):
         if not self.debugMode:
+            self.debug_messenger = None
             return
-        
-        self.debug_messenger = logging.make_debug_messenger(self.instance)
+
+        self.debug_messenger = validation.make_debug_messenger(self.instance, self.instance_dispatch)
 
     def build_window(self):
         if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) != 0:
@@ -36,7 +114,7 @@ class Engine:
         self.window = sdl2.SDL_CreateWindow(
         'Hello World'.encode('ascii'),
         sdl2.SDL_WINDOWPOS_UNDEFINED,
-        sdl2.SDL_WINDOWPOS_UNDEFINED, self.width, self.height, 0)
+        sdl2.SDL_WINDOWPOS_UNDEFINED, self.width, self.height, sdl2.SDL_WINDOW_RESIZABLE)
 
         if not self.window:
             raise Exception(sdl2.SDL_GetError())
@@ -46,7 +124,15 @@ class Engine:
         sdl2.SDL_GetWindowWMInfo(self.window, ctypes.byref(self.wm_info))
 
     def get_desired_extensions(self):
-        extensions = [VK_KHR_SURFACE_EXTENSION_NAME]
+        # Only used to read device UUIDs, dropped by limit_supported_extensions when missing
+        id_extensions = [VK_KHR_GET_PHYSICAL_DEVICE_PROPERTIES_2_EXTENSION_NAME, VK_KHR_EXTERNAL_MEMORY_CAPABILITIES_EXTENSION_NAME]
+        if self.headless:
+            extensions = list(id_extensions)
+            if self.debugMode:
+                extensions.append(VK_EXT_DEBUG_REPORT_EXTENSION_NAME)
+            return extensions
+
+        extensions = [VK_KHR_SURFACE_EXTENSION_NAME] + id_extensions
 
         if self.wm_info == None:
             raise Exception('No window manager info')
@@ -62,47 +148,801 @@ class Engine:
 
         if self.debugMode:
             extensions.append(VK_EXT_DEBUG_REPORT_EXTENSION_NAME)
-        
+
         return extensions
 
     def make_instance(self):
-        extensions = self.get_desired_extensions()
+        extensions = instance.limit_supported_extensions(self.get_desired_extensions())
         self.instance = instance.make_instance('Foo', extensions, self.debugMode)
+        self.instance_dispatch = dispatch.make_instance_dispatch(self.instance, extensions, self.debugMode)
 
     def make_surface(self):
-        self.surface = surface.get_surface(self.instance, self.wm_info, self.debugMode)
+        if self.headless:
+            self.surface = None
+            return
+
+        self.surface = surface.get_surface(self.instance, self.instance_dispatch, self.wm_info, self.debugMode)
 
     def make_device(self):
-        self.physical_device = device.choose_physical_device(self.instance, self.debugMode)
-        self.device = device.create_logical_device(self.physical_device, self.instance, self.surface, self.debugMode)
-        (self.graphics_queue, self.present_queue) = queue_families.get_queues(self.physical_device, self.device, self.instance, self.surface, self.debugMode)
-        bundle = swapchain.create_swapchain(self.instance, self.physical_device, self.device, self.surface, self.width, self.height, self.debugMode)
-        self.swapchain = bundle.swapchain
+        self.capabilities = device.choose_physical_device(self.instance, self.instance_dispatch, self.surface, self.debugMode, self.headless, self.device_policy)
+        self.physical_device = self.capabilities.physical_device
+        self.queue_family_indices = queue_families.find_queue_families(self.capabilities, self.debugMode)
+
+        self.device = device.create_logical_device(self.capabilities, self.queue_family_indices, self.debugMode)
+        self.device_dispatch = dispatch.make_device_dispatch(self.device, device.get_enabled_extensions(self.capabilities, self.headless), self.debugMode)
+        (self.graphics_queue, self.present_queue) = queue_families.get_queues(self.device, self.queue_family_indices)
+        (self.transfer_queue, self.compute_queue) = queue_families.get_async_queues(self.device, self.queue_family_indices)
+        self.allocator = allocator.Allocator(self.capabilities, self.device, self.debugMode)
+
+    def make_swapchain(self):
+        if self.headless:
+            # One render target per frame slot, so the slot fence also guards its target
+            bundle = offscreen.create_offscreen_targets(self.allocator, self.device, self.width, self.height, self.max_frames_in_flight, self.debugMode)
+        else:
+            bundle = swapchain.create_swapchain(self.instance_dispatch, self.device_dispatch, self.capabilities, self.queue_family_indices, self.device, self.surface, self.width, self.height, self.debugMode, self.swapchain)
+            self.swapchain = bundle.swapchain
         self.swapchain_frames = bundle.frames
         self.format = bundle.format
         self.extent = bundle.extent
+        self.swapchain_readable = bundle.readable
+
+    def make_pipeline_cache(self):
+        self.pipeline_cache = pipeline_cache.create_pipeline_cache(self.capabilities, self.device, self.pipeline_cache_path, self.debugMode)
+
+    def make_shader_cache(self):
+        if self.build_shaders:
+            compiler.build_all(debug=self.debugMode)
+
+        self.shader_cache = shaders.ShaderModuleCache(self.device, self.debugMode)
+
+    def make_descriptors(self):
+        self.layout_cache = descriptors.LayoutCache(self.device, self.debugMode)
+        # Material sets that live across frames, allocated and written once per distinct binding
+        self.descriptor_sets = descriptors.DescriptorSetCache(self.device, self.layout_cache, self.debugMode)
+
+    def make_mesh_pipeline(self, render_pass = None):
+        input_bundle = pipeline.InputBundle(
+            device=self.device,
+            swapchain_image_format=self.format,
+            vertex_filepath='shaders/mesh.spv',
+            fragment_filepath='shaders/fragment.spv',
+            final_layout=VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL if self.headless else VK_IMAGE_LAYOUT_PRESENT_SRC_KHR,
+            pipeline_cache=self.pipeline_cache,
+            vertex_bindings=geometry.get_binding_descriptions(),
+            vertex_attributes=geometry.get_attribute_descriptions(),
+            render_pass=render_pass,
+            shader_cache=self.shader_cache
+        )
+
+        return pipeline.create_graphics_pipeline(input_bundle, self.debugMode)
+
+    def make_instanced_pipeline(self, render_pass):
+        # Same pass and fragment stage, with a second binding stepping once per instance
+        input_bundle = pipeline.InputBundle(
+            device=self.device,
+            swapchain_image_format=self.format,
+            vertex_filepath='shaders/instanced.spv',
+            fragment_filepath='shaders/fragment.spv',
+            pipeline_cache=self.pipeline_cache,
+            vertex_bindings=geometry.get_binding_descriptions() + instancing.get_binding_descriptions(),
+            vertex_attributes=geometry.get_attribute_descriptions() + instancing.get_attribute_descriptions(),
+            render_pass=render_pass,
+            shader_cache=self.shader_cache
+        )
+
+        return pipeline.create_graphics_pipeline(input_bundle, self.debugMode)
+
+    def make_pipeline(self):
+        output_bundle = self.make_mesh_pipeline()
+        self.pipeline_layout = output_bundle.pipeline_layout
+        self.render_pass = output_bundle.render_pass
+        self.pipeline = output_bundle.pipeline
+        # Base of the per-mesh variants, and the fallback drawn with until a variant is compiled
+        self.mesh_description = output_bundle.description
+
+        output_bundle = self.make_instanced_pipeline(self.render_pass)
+        self.instanced_pipeline_layout = output_bundle.pipeline_layout
+        self.instanced_pipeline = output_bundle.pipeline
+
+    def finalize_setup(self):
+        framebuffer.make_framebuffers(self.device, self.render_pass, self.extent, self.swapchain_frames, self.debugMode)
+
+        indices = self.queue_family_indices
+        self.command_pool = commands.make_command_pool(self.device, indices.graphics_queue_family, self.debugMode)
+
+        limits = self.capabilities.properties.limits
+        self.frames_in_flight = []
+        for _ in range(self.max_frames_in_flight):
+            frame_in_flight = frame.FrameInFlight()
+            frame_in_flight.commands = recording.FrameCommands(self.device, indices.graphics_queue_family, self.debugMode)
+            frame_in_flight.descriptors = descriptors.FrameDescriptors(self.device, self.layout_cache, self.debugMode)
+            frame_in_flight.uniforms = uniforms.LinearAllocator(
+                self.allocator, self.uniform_size, limits.minUniformBufferOffsetAlignment, limits.maxUniformBufferRange, self.debugMode
+            )
+            frame_in_flight.image_available = sync.make_semaphore(self.device, self.debugMode)
+            frame_in_flight.render_finished = sync.make_semaphore(self.device, self.debugMode)
+            frame_in_flight.in_flight = sync.make_fence(self.device, self.debugMode)
+            self.frames_in_flight.append(frame_in_flight)
+
+        # Called inside the render pass with (command_buffer, frame uniforms), see add_draw_callback
+        self.draw_callbacks = []
+
+        # Fence of the frame slot that last rendered to each swapchain image
+        self.images_in_flight = [None] * len(self.swapchain_frames)
+
+        self.uploader = geometry.GeometryUploader(self.allocator, self.staging_size, self.flush_uploads, self.debugMode)
+
+        # Without a dedicated transfer family, streamed meshes go through the per-frame uploader
+        self.streamer = None
+        if self.transfer_queue is not None:
+            self.streamer = transfer.AsyncUploader(
+                self.allocator, self.device, indices.transfer_queue_family, self.transfer_queue,
+                indices.graphics_queue_family, self.staging_size, self.debugMode
+            )
+
+        self.indirect = indirect.IndirectRenderer(
+            self.allocator, self.device, self.pipeline_cache, self.indirect_capacity,
+            self.max_frames_in_flight, self.device_dispatch.vkCmdDrawIndexedIndirectCountKHR, self.debugMode,
+            shader_cache=self.shader_cache
+        )
+
+        self.profiler = profiler.Profiler(
+            self.capabilities, self.device, indices.graphics_queue_family, self.max_frames_in_flight, self.debugMode,
+            secondaries=self.record_workers > 0
+        )
+
+        # Without workers every draw is recorded inline on the calling thread
+        self.parallel = None
+        if self.record_workers > 0:
+            self.parallel = parallel.ParallelRecorder(self.device, indices.graphics_queue_family, self.record_workers, self.debugMode)
+
+        # Copies ride along in the frame's own submit, so they are done when its fence signals
+        self.readback = readback.ReadbackRing(self.allocator, self.device, indices.graphics_queue_family, self.readback_slots, self.debugMode)
+        self.capture = None
+
+        # Dispatches overlap rendering on a dedicated compute family, otherwise they share the graphics queue
+        if self.compute_queue is not None:
+            self.compute = compute.ComputeContext(
+                self.allocator, self.device, indices.compute_queue_family, self.compute_queue, self.pipeline_cache, self.debugMode,
+                shader_cache=self.shader_cache
+            )
+        else:
+            self.compute = compute.ComputeContext(
+                self.allocator, self.device, indices.graphics_queue_family, self.graphics_queue, self.pipeline_cache, self.debugMode,
+                shader_cache=self.shader_cache
+            )
+
+        # Uploads and mip blits go through the graphics queue, ahead of the frames that sample them
+        budget_supported = VK_EXT_MEMORY_BUDGET_EXTENSION_NAME in device.get_enabled_extensions(self.capabilities, self.headless)
+        self.textures = textures.TextureManager(
+            self.capabilities, self.instance_dispatch.vkGetPhysicalDeviceMemoryProperties2KHR if budget_supported else None,
+            self.allocator, self.device, indices.graphics_queue_family, self.graphics_queue, self.max_frames_in_flight, self.debugMode,
+            budget=self.texture_budget, decode_workers=self.decode_workers, on_destroy_view=self.descriptor_sets.invalidate
+        )
+
+        self.pipelines = pipeline_state.PipelineLibrary(
+            self.device, self.pipeline_cache, self.shader_cache, self.debugMode, self.pipeline_workers
+        )
+
+        self.reloader = None
+        if self.watch_shaders:
+            self.make_reloader()
+
+    def make_reloader(self):
+        self.reloader = hot_reload.HotReloader(self.debugMode)
+
+        def install_mesh(output_bundle):
+            vkDestroyPipeline(self.device, self.pipeline, None)
+            vkDestroyPipelineLayout(self.device, self.pipeline_layout, None)
+            self.pipeline = output_bundle.pipeline
+            self.pipeline_layout = output_bundle.pipeline_layout
+            self.mesh_description = output_bundle.description
+
+        def install_instanced(output_bundle):
+            vkDestroyPipeline(self.device, self.instanced_pipeline, None)
+            vkDestroyPipelineLayout(self.device, self.instanced_pipeline_layout, None)
+            self.instanced_pipeline = output_bundle.pipeline
+            self.instanced_pipeline_layout = output_bundle.pipeline_layout
+
+        def build_cull():
+            return pipeline.create_compute_pipeline(
+                self.device, indirect.CULL_SHADER, self.indirect.pipeline_layout, self.pipeline_cache, self.debugMode, self.shader_cache
+            )
+
+        def install_cull(cull_pipeline):
+            vkDestroyPipeline(self.device, self.indirect.pipeline, None)
+            self.indirect.pipeline = cull_pipeline
+
+        # Rebuilt pipelines keep sharing the current render pass
+        self.reloader.register(
+            'mesh', ['shaders/mesh.spv', 'shaders/fragment.spv'],
+            lambda: self.make_mesh_pipeline(self.render_pass), install_mesh
+        )
+        self.reloader.register(
+            'instanced', ['shaders/instanced.spv', 'shaders/fragment.spv'],
+            lambda: self.make_instanced_pipeline(self.render_pass), install_instanced
+        )
+        self.reloader.register('cull', [indirect.CULL_SHADER], build_cull, install_cull)
+
+    def apply_reloads(self):
+        ready = self.reloader.take_ready()
+        if not ready:
+            return
+
+        # Old pipelines can still be in use by frames in flight
+        fences = [frame_in_flight.in_flight for frame_in_flight in self.frames_in_flight]
+        vkWaitForFences(self.device, len(fences), fences, VK_TRUE, UINT64_MAX)
+
+        for (watched, built) in ready:
+            watched.install(built)
+
+        # Variants were built from the old shaders and layout, they recompile on next use
+        self.pipelines.clear()
+        self.mark_scene_changed()
+
+    def make_assets(self):
+        self.meshes = []
+        self.instance_batches = []
+
+        vertices = array.array('f', [
+             0.0, -0.5, 1.0, 0.0, 0.0,
+             0.5,  0.5, 0.0, 1.0, 0.0,
+            -0.5,  0.5, 0.0, 0.0, 1.0
+        ])
+        indices = array.array('H', [0, 1, 2])
+
+        self.upload_mesh(vertices, indices)
+
+    def upload_mesh(self, vertices, indices = None):
+        mesh = self.uploader.upload_mesh(vertices, indices)
+        self.meshes.append(mesh)
+        self.mark_scene_changed()
+        return mesh
+
+    def add_draw_callback(self, callback):
+        # For draws with the application's own pipelines, per-draw data goes through the uniforms allocator
+        self.draw_callbacks.append(callback)
+        self.mark_scene_changed()
+
+    def remove_draw_callback(self, callback):
+        self.draw_callbacks.remove(callback)
+        self.mark_scene_changed()
+
+    def make_push_constants(self, dtype, stages, offset = 0):
+        return uniforms.PushConstants(dtype, stages, offset, self.capabilities.properties.limits.maxPushConstantsSize)
+
+    def get_uniform_set(self, frame_uniforms, record_size, stages, index = 0):
+        # One persistent set per frame buffer and record size, bound with a dynamic offset per draw
+        return self.descriptor_sets.get(
+            [uniforms.dynamic_binding(index, stages)],
+            [frame_uniforms.descriptor_write(index, record_size)]
+        )
+
+    def load_texture(self, path, srgb = True):
+        # Returns straight away, the texture fills in over the next frames starting from its smallest mips
+        return self.textures.load(path, srgb)
+
+    def release_texture(self, texture):
+        self.textures.release(texture)
+
+    def get_texture_set(self, texture, stages = VK_SHADER_STAGE_FRAGMENT_BIT, index = 0):
+        # Counts as a use for eviction, call it for every frame the texture is drawn in
+        self.textures.touch(texture)
+        return self.descriptor_sets.get(
+            [descriptors.binding(index, VK_DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, stages)],
+            [descriptors.image_write(index, VK_DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, self.textures.get_view(texture), self.textures.sampler)]
+        )
+
+    def set_mesh_variant(self, mesh, **state):
+        # Overrides on the mesh pipeline's description, e.g. polygon_mode or blend, nothing resets it
+        mesh.pipeline_variant = state if state else None
+        if mesh.pipeline_variant is not None:
+            self.pipelines.request(self.mesh_description.variant(**state))
+            self.pipelines.flush()
+        self.mark_scene_changed()
+
+    def create_instance_batch(self, mesh, capacity):
+        batch = instancing.InstanceBatch(self.allocator, mesh, capacity, self.max_frames_in_flight, self.debugMode)
+        self.instance_batches.append(batch)
+        self.mark_scene_changed()
+        return batch
+
+    def add_indirect_group(self, mesh, capacity, sphere):
+        # Objects in the group are culled and drawn on the GPU, see indirect.get_bounding_sphere
+        group = self.indirect.add_group(mesh, capacity, sphere)
+        self.mark_scene_changed()
+        return group
+
+    def mark_scene_changed(self):
+        # Call after writing instance or object arrays in place instead of through their setters
+        self.scene_version += 1
+
+    def get_scene_version(self):
+        return (
+            self.scene_version,
+            tuple(batch.version for batch in self.instance_batches),
+            tuple(group.version for group in self.indirect.groups),
+            self.pipelines.version,
+            self.textures.version
+        )
+
+    def stream_mesh(self, vertices, indices = None):
+        if self.streamer is None:
+            return self.upload_mesh(vertices, indices)
+
+        # Drawn from the first frame after its transfer has been handed over
+        return self.streamer.upload_mesh(vertices, indices)
+
+    def flush_uploads(self):
+        fences = [frame_in_flight.in_flight for frame_in_flight in self.frames_in_flight]
+        vkWaitForFences(self.device, len(fences), fences, VK_TRUE, UINT64_MAX)
+
+        # The ring overflowed within one frame, push what is staged so far right away
+        if self.uploader.has_pending():
+            command_buffer = commands.begin_single_time_commands(self.device, self.command_pool)
+            self.uploader.record(command_buffer)
+            commands.end_single_time_commands(self.device, self.command_pool, self.graphics_queue, command_buffer)
+
+        self.uploader.ring.reset()
+
+    def recreate_swapchain(self):
+        width = ctypes.c_int()
+        height = ctypes.c_int()
+        sdl2.SDL_GetWindowSize(self.window, ctypes.byref(width), ctypes.byref(height))
+
+        # A minimized window has no drawable area, try again once it is restored
+        if width.value == 0 or height.value == 0:
+            return False
+
+        self.width = width.value
+        self.height = height.value
+        self.framebuffer_resized = False
+
+        if self.debugMode:
+            print(f"Recreating swapchain at {self.width}x{self.height}")
+
+        # Only frames still in flight can reference the old image views and framebuffers
+        fences = [frame_in_flight.in_flight for frame_in_flight in self.frames_in_flight]
+        vkWaitForFences(self.device, len(fences), fences, VK_TRUE, UINT64_MAX)
+
+        for swapchain_frame in self.swapchain_frames:
+            swapchain_frame.destroy(self.device)
+
+        old_swapchain = self.swapchain
+        old_format = self.format
+
+        self.make_swapchain()
+        self.device_dispatch.vkDestroySwapchainKHR(self.device, old_swapchain, None)
+
+        # Viewport and scissor are dynamic, only a new format needs a new render pass and pipelines for it
+        if self.format != old_format:
+            self.pipelines.clear()
+            self.destroy_pipeline()
+            self.make_pipeline()
+
+        framebuffer.make_framebuffers(self.device, self.render_pass, self.extent, self.swapchain_frames, self.debugMode)
+        self.images_in_flight = [None] * len(self.swapchain_frames)
+
+        # Recorded frames point at the old framebuffers
+        self.mark_scene_changed()
+
+        return True
+
+    def get_mesh_pipeline(self, mesh):
+        if mesh.pipeline_variant is None:
+            return self.pipeline
+
+        # A variant still compiling is drawn with the base pipeline, its arrival re-records the frame
+        description = self.mesh_description.variant(**mesh.pipeline_variant)
+        return self.pipelines.get_or_fallback(description, self.pipeline)
+
+    def record_meshes(self, command_buffer, meshes):
+        bound = None
+        for mesh in meshes:
+            mesh_pipeline = self.get_mesh_pipeline(mesh)
+            if mesh_pipeline != bound:
+                vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, mesh_pipeline)
+                bound = mesh_pipeline
+
+            vkCmdBindVertexBuffers(command_buffer, 0, 1, [mesh.vertex_buffer], [0])
+
+            if mesh.index_buffer is not None:
+                vkCmdBindIndexBuffer(command_buffer, mesh.index_buffer, 0, mesh.index_type)
+                vkCmdDrawIndexed(command_buffer, mesh.index_count, 1, 0, 0, 0)
+            else:
+                vkCmdDraw(command_buffer, mesh.vertex_count, 1, 0, 0)
+
+    def record_instanced(self, command_buffer):
+        # One draw per batch however many instances it holds
+        if self.instance_batches or self.indirect.has_work():
+            vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.instanced_pipeline)
+            for batch in self.instance_batches:
+                batch.record(command_buffer, self.current_frame)
+            self.indirect.record_draw(command_buffer, self.current_frame)
+
+    def record_draw_commands(self, command_buffer, image_index, frame_commands):
+        self.profiler.record_begin(command_buffer, self.current_frame)
+
+        # All geometry staged since the last frame is copied in this frame's single submit
+        self.uploader.record(command_buffer)
+
+        wait_semaphores = []
+        if self.streamer is not None:
+            (wait_semaphores, streamed_meshes) = self.streamer.acquire(command_buffer, self.current_frame)
+            if streamed_meshes:
+                self.meshes += streamed_meshes
+                self.mark_scene_changed()
+
+        # Culling runs before the pass and writes the indirect commands the pass draws from
+        self.indirect.record_cull(command_buffer, self.current_frame)
+
+        frame_uniforms = self.frames_in_flight[self.current_frame].uniforms
+        clear_value = VkClearValue(color=VkClearColorValue(float32=[0.0, 0.0, 0.0, 1.0]))
+
+        render_pass_info = VkRenderPassBeginInfo(
+            sType=VK_STRUCTURE_TYPE_RENDER_PASS_BEGIN_INFO,
+            renderPass=self.render_pass,
+            framebuffer=self.swapchain_frames[image_index].framebuffer,
+            renderArea=VkRect2D(offset=VkOffset2D(x=0, y=0), extent=self.extent),
+            clearValueCount=1,
+            pClearValues=[clear_value]
+        )
+
+        if self.parallel is None:
+            vkCmdBeginRenderPass(command_buffer, render_pass_info, VK_SUBPASS_CONTENTS_INLINE)
+            pipeline.record_viewport(command_buffer, self.extent)
+            self.record_meshes(command_buffer, self.meshes)
+            self.record_instanced(command_buffer)
+            for callback in self.draw_callbacks:
+                callback(command_buffer, frame_uniforms)
+        else:
+            # The draw list is split across workers, each chunk into its own secondary buffer
+            vkCmdBeginRenderPass(command_buffer, render_pass_info, VK_SUBPASS_CONTENTS_SECONDARY_COMMAND_BUFFERS)
+            tasks = [
+                lambda secondary, chunk=chunk: self.record_meshes(secondary, chunk)
+                for chunk in parallel.split_chunks(self.meshes, self.parallel.worker_count)
+            ]
+            tasks.append(self.record_instanced)
+            tasks += [
+                lambda secondary, callback=callback: callback(secondary, frame_uniforms)
+                for callback in self.draw_callbacks
+            ]
+            # Secondaries start without dynamic state, each one sets its own viewport and scissor
+            tasks = [self.with_viewport(task) for task in tasks]
+            self.parallel.record(
+                command_buffer, self.current_frame, frame_commands.version, frame_commands.reusable,
+                self.render_pass, self.swapchain_frames[image_index].framebuffer, tasks,
+                self.profiler.statistics_flags if self.profiler.statistics_pool is not None else 0
+            )
+
+        vkCmdEndRenderPass(command_buffer)
+
+        self.profiler.record_end(command_buffer, self.current_frame)
+
+        return wait_semaphores
+
+    def with_viewport(self, task):
+        def record(command_buffer):
+            pipeline.record_viewport(command_buffer, self.extent)
+            task(command_buffer)
+
+        return record
+
+    def get_frame_commands(self, frame_in_flight, image_index):
+        frame_commands = frame_in_flight.commands
+        version = self.get_scene_version()
+
+        # Copies and queue ownership transfers only happen in the frame that records them
+        must_record = self.uploader.has_pending() or (self.streamer is not None and self.streamer.in_transit)
+
+        if not must_record:
+            command_buffer = frame_commands.lookup(image_index, version)
+            if command_buffer is not None:
+                return (command_buffer, [])
+
+        # A scene that held still since the last recording is likely static, keep what is recorded now.
+        # Callbacks write this frame's uniforms as they record, replaying would skip the writes
+        reusable = not must_record and version == self.last_recorded_version and not self.draw_callbacks
+        self.last_recorded_version = version
+
+        command_buffer = frame_commands.begin(version, reusable)
+        upload_semaphores = self.record_draw_commands(command_buffer, image_index, frame_commands)
+        # Transient sets are reset with the slot, so a recording that used them cannot be replayed
+        reusable = reusable and not frame_in_flight.descriptors.has_allocations()
+        # Offsets handed out by the allocator are only good until the slot is reset
+        reusable = reusable and not frame_in_flight.uniforms.has_allocations()
+        frame_commands.end(command_buffer, image_index, reusable)
+        if not reusable and self.parallel is not None:
+            self.parallel.discard(self.current_frame)
+
+        # Variants missed while recording start compiling now
+        self.pipelines.flush()
+
+        return (command_buffer, upload_semaphores)
+
+    def wait_for_frame_slot(self):
+        frame_in_flight = self.frames_in_flight[self.current_frame]
+
+        # Only block on the slot we are about to reuse
+        vkWaitForFences(self.device, 1, [frame_in_flight.in_flight], VK_TRUE, UINT64_MAX)
+        self.profiler.resolve(self.current_frame)
+        self.readback.retire(frame_in_flight.in_flight)
+        self.readback.poll()
+        frame_in_flight.descriptors.reset()
+        frame_in_flight.uniforms.reset()
+        if self.capture is not None:
+            self.capture.ring.retire(frame_in_flight.in_flight)
+            self.capture.pump()
+
+        # Staging space this slot's last submit copied from is free again
+        self.uploader.retire_frame(self.current_frame)
+        if self.streamer is not None:
+            self.streamer.retire_frame(self.current_frame)
+            self.streamer.submit()
+
+        # Submitted ahead of this frame, so whatever it installs can be sampled right away
+        self.textures.update()
+
+        # Rebuilt here rather than on the watcher, a swapchain recreate cannot swap the render pass out from under it
+        if self.reloader is not None:
+            self.apply_reloads()
+
+        return frame_in_flight
+
+    def render(self):
+        if self.headless:
+            self.render_offscreen()
+            return
+
+        if self.framebuffer_resized and not self.recreate_swapchain():
+            return
+
+        self.profiler.begin_frame()
+        frame_in_flight = self.wait_for_frame_slot()
+
+        p_image_index = ffi.new('uint32_t*')
+        try:
+            with self.profiler.span('acquire'):
+                self.device_dispatch.vkAcquireNextImageKHR(self.device, self.swapchain, UINT64_MAX, frame_in_flight.image_available, None, p_image_index)
+        except VkErrorOutOfDateKhr:
+            self.recreate_swapchain()
+            return
+        except VkSuboptimalKhr:
+            # The image was still acquired, draw it and recreate after presenting
+            self.framebuffer_resized = True
+        image_index = p_image_index[0]
+
+        image_fence = self.images_in_flight[image_index]
+        if image_fence is not None and image_fence != frame_in_flight.in_flight:
+            vkWaitForFences(self.device, 1, [image_fence], VK_TRUE, UINT64_MAX)
+        self.images_in_flight[image_index] = frame_in_flight.in_flight
+
+        vkResetFences(self.device, 1, [frame_in_flight.in_flight])
+
+        with self.profiler.span('record'):
+            (command_buffer, upload_semaphores) = self.get_frame_commands(frame_in_flight, image_index)
+            command_buffers = [command_buffer] + self.record_readback(frame_in_flight, image_index, VK_IMAGE_LAYOUT_PRESENT_SRC_KHR)
+        self.uploader.mark_frame(self.current_frame)
+
+        wait_semaphores = [frame_in_flight.image_available] + upload_semaphores
+        wait_stages = [VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT] + [VK_PIPELINE_STAGE_VERTEX_INPUT_BIT] * len(upload_semaphores)
+
+        submit_info = VkSubmitInfo(
+            sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+            waitSemaphoreCount=len(wait_semaphores),
+            pWaitSemaphores=wait_semaphores,
+            pWaitDstStageMask=wait_stages,
+            commandBufferCount=len(command_buffers),
+            pCommandBuffers=command_buffers,
+            signalSemaphoreCount=1,
+            pSignalSemaphores=[frame_in_flight.render_finished]
+        )
+
+        with self.profiler.span('submit'):
+            vkQueueSubmit(self.graphics_queue, 1, [submit_info], frame_in_flight.in_flight)
+
+        present_info = VkPresentInfoKHR(
+            sType=VK_STRUCTURE_TYPE_PRESENT_INFO_KHR,
+            waitSemaphoreCount=1,
+            pWaitSemaphores=[frame_in_flight.render_finished],
+            swapchainCount=1,
+            pSwapchains=[self.swapchain],
+            pImageIndices=[image_index]
+        )
+
+        try:
+            with self.profiler.span('present'):
+                self.device_dispatch.vkQueuePresentKHR(self.present_queue, present_info)
+        except (VkErrorOutOfDateKhr, VkSuboptimalKhr):
+            self.framebuffer_resized = True
+
+        self.profiler.end_frame(self.current_frame)
+        self.current_frame = (self.current_frame + 1) % self.max_frames_in_flight
+
+    def render_offscreen(self):
+        self.profiler.begin_frame()
+        frame_in_flight = self.wait_for_frame_slot()
+        vkResetFences(self.device, 1, [frame_in_flight.in_flight])
+
+        with self.profiler.span('record'):
+            (command_buffer, upload_semaphores) = self.get_frame_commands(frame_in_flight, self.current_frame)
+            command_buffers = [command_buffer] + self.record_readback(frame_in_flight, self.current_frame, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL)
+        self.uploader.mark_frame(self.current_frame)
+
+        submit_info = VkSubmitInfo(
+            sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+            waitSemaphoreCount=len(upload_semaphores),
+            pWaitSemaphores=upload_semaphores,
+            pWaitDstStageMask=[VK_PIPELINE_STAGE_VERTEX_INPUT_BIT] * len(upload_semaphores),
+            commandBufferCount=len(command_buffers),
+            pCommandBuffers=command_buffers
+        )
+
+        with self.profiler.span('submit'):
+            vkQueueSubmit(self.graphics_queue, 1, [submit_info], frame_in_flight.in_flight)
+
+        self.profiler.end_frame(self.current_frame)
+        self.current_frame = (self.current_frame + 1) % self.max_frames_in_flight
+
+    def record_readback(self, frame_in_flight, image_index, layout):
+        # Kept out of the frame's command buffer, so recorded frames stay reusable
+        rings = [self.readback]
+        if self.capture is not None:
+            rings.append(self.capture.ring)
+
+        return [
+            ring.record(
+                self.swapchain_frames[image_index].image, layout, self.extent, self.format,
+                frame_in_flight.in_flight, self.profiler.frame
+            )
+            for ring in rings if ring.has_requests()
+        ]
+
+    def request_readback(self):
+        # Resolves with a readback.ReadbackFrame once the next rendered frame's fence signals
+        if not self.swapchain_readable:
+            raise Exception('Swapchain images cannot be copied on this surface')
+
+        return self.readback.request()
+
+    def request_readback_async(self):
+        if not self.swapchain_readable:
+            raise Exception('Swapchain images cannot be copied on this surface')
+
+        return self.readback.request_async()
+
+    def start_capture(self, writer, queue_size = 8):
+        # writer is a capture.ChunkedWriter or capture.EncoderWriter, frames are pulled from then on
+        if self.capture is not None:
+            raise Exception('A capture is already running')
+        if not self.swapchain_readable:
+            raise Exception('Swapchain images cannot be copied on this surface')
+
+        self.capture = capture.CaptureSession(
+            self.allocator, self.device, self.queue_family_indices.graphics_queue_family, writer,
+            self.max_frames_in_flight, queue_size, self.debugMode
+        )
+
+    def stop_capture(self):
+        if self.capture is None:
+            raise Exception('No capture is running')
+
+        statistics = self.capture.stop()
+        self.capture = None
+        return statistics
+
+    def read_frame(self):
+        # Renders one frame and blocks on its fence only, for screenshots and golden images
+        future = self.request_readback()
+        if future is None:
+            raise Exception('No free readback slot')
+
+        self.render()
+
+        with self.readback.wait(future) as frame:
+            return bytes(frame.array)
+
+    def run(self, frame_count = None):
+        if self.headless:
+            if frame_count is None:
+                raise Exception('Headless runs need a frame count')
+            for _ in range(frame_count):
+                self.render()
+            return
+
+        running = True
+        while running:
+            for event in sdl2.ext.get_events():
+                if event.type == sdl2.SDL_QUIT:
+                    running = False
+                    break
+                if event.type == sdl2.SDL_WINDOWEVENT and event.window.event == sdl2.SDL_WINDOWEVENT_SIZE_CHANGED:
+                    self.framebuffer_resized = True
+
+            if not running:
+                break
+
+            if sdl2.SDL_GetWindowFlags(self.window) & sdl2.SDL_WINDOW_MINIMIZED:
+                sdl2.SDL_WaitEvent(None)
+                continue
+
+            self.render()
+
+    def destroy_pipeline(self):
+        vkDestroyPipeline(self.device, self.instanced_pipeline, None)
+        vkDestroyPipelineLayout(self.device, self.instanced_pipeline_layout, None)
+        vkDestroyPipeline(self.device, self.pipeline, None)
+        vkDestroyPipelineLayout(self.device, self.pipeline_layout, None)
+        vkDestroyRenderPass(self.device, self.render_pass, None)
 
     def close(self):
         if self.debugMode:
             print('Closing graphics engine')
 
-        for frame in self.swapchain_frames:
-            vkDestroyImageView(self.device, frame.image_view, None)
+        vkDeviceWaitIdle(self.device)
+
+        if self.capture is not None:
+            self.stop_capture()
+
+        if self.reloader is not None:
+            self.reloader.stop()
+
+        for frame_in_flight in self.frames_in_flight:
+            frame_in_flight.destroy(self.device)
+        if self.parallel is not None:
+            self.parallel.destroy()
+        self.profiler.destroy()
+        self.compute.destroy()
+        self.readback.destroy()
+        self.textures.destroy()
+
+        vkDestroyCommandPool(self.device, self.command_pool, None)
+
+        for batch in self.instance_batches:
+            batch.destroy()
+        self.indirect.destroy()
+        for mesh in self.meshes:
+            mesh.destroy(self.allocator)
+        self.uploader.destroy()
+        if self.streamer is not None:
+            self.streamer.destroy()
+
+        self.pipelines.destroy()
+        self.destroy_pipeline()
+
+        if self.pipeline_cache_path is not None:
+            try:
+                pipeline_cache.save_pipeline_cache(self.capabilities, self.device, self.pipeline_cache, self.pipeline_cache_path, self.debugMode)
+            except OSError as e:
+                print(f"Failed to save pipeline cache: {e}")
+        vkDestroyPipelineCache(self.device, self.pipeline_cache, None)
+        self.shader_cache.destroy()
+        self.descriptor_sets.destroy()
+        self.layout_cache.destroy()
+
+        for swapchain_frame in self.swapchain_frames:
+            swapchain_frame.destroy(self.device)
+
+        if self.swapchain is not None:
+            self.device_dispatch.vkDestroySwapchainKHR(self.device, self.swapchain, None)
 
-        swapchain_destroy_function = vkGetInstanceProcAddr(self.instance, 'vkDestroySwapchainKHR')
-        swapchain_destroy_function(self.device, self.swapchain, None)
+        self.allocator.destroy()
 
         vkDestroyDevice(self.device, None)
 
-        surface_destroy_function = vkGetInstanceProcAddr(self.instance, 'vkDestroySurfaceKHR')
-        surface_destroy_function(self.instance, self.surface, None)
+        if self.surface is not None:
+            self.instance_dispatch.vkDestroySurfaceKHR(self.instance, self.surface, None)
 
         if self.debug_messenger:
-            destroyFunction = vkGetInstanceProcAddr(self.instance, 'vkDestroyDebugReportCallbackEXT')
-            destroyFunction(self.instance, self.debug_messenger, None)
+            self.instance_dispatch.vkDestroyDebugReportCallbackEXT(self.instance, self.debug_messenger, None)
 
         vkDestroyInstance(self.instance, None)
 
 if __name__ == '__main__':
-    engine = Engine()
-    engine.close()
\ No newline at end of file
+    if '--headless' in sys.argv:
+        engine = Engine(headless=True)
+        engine.run(frame_count=100)
+    else:
+        engine = Engine()
+        engine.run()
+    engine.close()
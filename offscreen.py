@@ -0,0 +1,32 @@
+from vulkan import *
+import frame
+import image_view
+
+class OffscreenBundle:
+    def __init__(self) -> None:
+        self.frames = []
+        self.format = None
+        self.extent = None
+        self.readable = True
+
+def create_offscreen_targets(allocator, device, width, height, count, debug, format = VK_FORMAT_R8G8B8A8_UNORM):
+    if debug:
+        print(f"Creating {count} offscreen targets of {width}x{height}")
+
+    bundle = OffscreenBundle()
+    bundle.format = format
+    bundle.extent = VkExtent2D(width=width, height=height)
+
+    for _ in range(count):
+        offscreen_frame = frame.OffscreenFrame()
+
+        (offscreen_frame.image, offscreen_frame.image_allocation) = allocator.create_image(
+            width, height, format,
+            VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT | VK_IMAGE_USAGE_TRANSFER_SRC_BIT,
+            VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+        )
+        offscreen_frame.image_view = image_view.make_image_view(device, offscreen_frame.image, format)
+
+        bundle.frames.append(offscreen_frame)
+
+    return bundle
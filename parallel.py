@@ -0,0 +1,85 @@
+from vulkan import *
+import concurrent.futures
+import threading
+import recording
+
+def split_chunks(items, count):
+    size = (len(items) + count - 1) // count
+    return [items[i:i + size] for i in range(0, len(items), size)] if items else []
+
+class ParallelRecorder:
+    def __init__(self, device, queue_family_index, worker_count, debug) -> None:
+        if worker_count < 1:
+            raise Exception('Parallel recording needs at least one worker')
+
+        self.device = device
+        self.queue_family_index = queue_family_index
+        self.worker_count = worker_count
+        self.debug = debug
+
+        # cffi drops the GIL around every vkCmd* call, so workers overlap their foreign calls
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='record')
+
+        # (worker thread, frame slot) -> secondary pool, a pool is only ever touched by its own thread
+        self.pools = {}
+        self.lock = threading.Lock()
+
+        if debug:
+            print(f"Recording secondary command buffers on {worker_count} workers")
+
+    def get_pool(self, slot):
+        key = (threading.get_ident(), slot)
+
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = recording.FrameCommands(self.device, self.queue_family_index, False, VK_COMMAND_BUFFER_LEVEL_SECONDARY)
+                self.pools[key] = pool
+
+        return pool
+
+    def record_task(self, slot, version, reusable, inheritance, task):
+        pool = self.get_pool(slot)
+
+        command_buffer = pool.begin(version, reusable, inheritance)
+        task(command_buffer)
+        pool.end(command_buffer)
+
+        return command_buffer
+
+    def record(self, command_buffer, slot, version, reusable, render_pass, framebuffer, tasks, pipeline_statistics = 0):
+        # The primary must have begun render_pass with VK_SUBPASS_CONTENTS_SECONDARY_COMMAND_BUFFERS
+        if not tasks:
+            return
+
+        inheritance = VkCommandBufferInheritanceInfo(
+            sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_INHERITANCE_INFO,
+            renderPass=render_pass,
+            subpass=0,
+            framebuffer=framebuffer,
+            # Statistics queries active in the primary carry on into the secondaries
+            pipelineStatistics=pipeline_statistics
+        )
+
+        futures = [
+            self.executor.submit(self.record_task, slot, version, reusable, inheritance, task)
+            for task in tasks
+        ]
+
+        # Executed in task order whichever worker finished first
+        secondaries = [future.result() for future in futures]
+        vkCmdExecuteCommands(command_buffer, len(secondaries), secondaries)
+
+    def discard(self, slot):
+        # The primary was not kept, so neither are the secondaries it executed
+        with self.lock:
+            for ((_, pool_slot), pool) in self.pools.items():
+                if pool_slot == slot:
+                    pool.discard()
+
+    def destroy(self):
+        self.executor.shutdown(wait=True)
+
+        for pool in self.pools.values():
+            pool.destroy()
+        self.pools = {}
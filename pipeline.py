@@ -0,0 +1,178 @@
+from vulkan import *
+from shaders import shaders
+import pipeline_state
+
+DYNAMIC_STATES = (VK_DYNAMIC_STATE_VIEWPORT, VK_DYNAMIC_STATE_SCISSOR)
+
+class InputBundle:
+    def __init__(self, device, swapchain_image_format, vertex_filepath, fragment_filepath, final_layout = VK_IMAGE_LAYOUT_PRESENT_SRC_KHR, pipeline_cache = None, vertex_bindings = None, vertex_attributes = None, render_pass = None, shader_cache = None, set_layouts = None, push_constant_ranges = None) -> None:
+        self.device = device
+        self.swapchain_image_format = swapchain_image_format
+        self.vertex_filepath = vertex_filepath
+        self.fragment_filepath = fragment_filepath
+        self.final_layout = final_layout
+        self.pipeline_cache = pipeline_cache
+        self.vertex_bindings = vertex_bindings if vertex_bindings is not None else []
+        self.vertex_attributes = vertex_attributes if vertex_attributes is not None else []
+        # Pipelines drawn in the same pass share it instead of creating their own
+        self.render_pass = render_pass
+        # shaders.ShaderModuleCache, without one modules are created and destroyed per pipeline
+        self.shader_cache = shader_cache
+        # Usually from descriptors.LayoutCache, which owns them
+        self.set_layouts = set_layouts
+        self.push_constant_ranges = push_constant_ranges
+
+class OutputBundle:
+    def __init__(self, pipeline_layout, render_pass, pipeline, description = None) -> None:
+        self.pipeline_layout = pipeline_layout
+        self.render_pass = render_pass
+        self.pipeline = pipeline
+        # Variants of this pipeline are derived from it, see pipeline_state.PipelineLibrary
+        self.description = description
+
+def create_render_pass(device, swapchain_image_format, debug, final_layout = VK_IMAGE_LAYOUT_PRESENT_SRC_KHR):
+    if debug:
+        print('Creating render pass')
+
+    color_attachment = VkAttachmentDescription(
+        flags=0,
+        format=swapchain_image_format,
+        samples=VK_SAMPLE_COUNT_1_BIT,
+        loadOp=VK_ATTACHMENT_LOAD_OP_CLEAR,
+        storeOp=VK_ATTACHMENT_STORE_OP_STORE,
+        stencilLoadOp=VK_ATTACHMENT_LOAD_OP_DONT_CARE,
+        stencilStoreOp=VK_ATTACHMENT_STORE_OP_DONT_CARE,
+        initialLayout=VK_IMAGE_LAYOUT_UNDEFINED,
+        finalLayout=final_layout
+    )
+
+    color_attachment_ref = VkAttachmentReference(
+        attachment=0,
+        layout=VK_IMAGE_LAYOUT_COLOR_ATTACHMENT_OPTIMAL
+    )
+
+    subpass = VkSubpassDescription(
+        pipelineBindPoint=VK_PIPELINE_BIND_POINT_GRAPHICS,
+        colorAttachmentCount=1,
+        pColorAttachments=[color_attachment_ref]
+    )
+
+    dependencies = [VkSubpassDependency(
+        srcSubpass=VK_SUBPASS_EXTERNAL,
+        dstSubpass=0,
+        srcStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,
+        srcAccessMask=0,
+        dstStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,
+        dstAccessMask=VK_ACCESS_COLOR_ATTACHMENT_READ_BIT | VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT
+    )]
+
+    # Offscreen targets are copied out after the pass, so make the writes visible to transfers
+    if final_layout == VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL:
+        dependencies.append(VkSubpassDependency(
+            srcSubpass=0,
+            dstSubpass=VK_SUBPASS_EXTERNAL,
+            srcStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,
+            srcAccessMask=VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT,
+            dstStageMask=VK_PIPELINE_STAGE_TRANSFER_BIT,
+            dstAccessMask=VK_ACCESS_TRANSFER_READ_BIT
+        ))
+
+    render_pass_info = VkRenderPassCreateInfo(
+        sType=VK_STRUCTURE_TYPE_RENDER_PASS_CREATE_INFO,
+        attachmentCount=1,
+        pAttachments=[color_attachment],
+        subpassCount=1,
+        pSubpasses=[subpass],
+        dependencyCount=len(dependencies),
+        pDependencies=dependencies
+    )
+
+    return vkCreateRenderPass(device, render_pass_info, None)
+
+def create_pipeline_layout(device, set_layouts = None, push_constant_ranges = None):
+    set_layouts = set_layouts if set_layouts is not None else []
+    push_constant_ranges = push_constant_ranges if push_constant_ranges is not None else []
+
+    pipeline_layout_info = VkPipelineLayoutCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO,
+        setLayoutCount=len(set_layouts),
+        pSetLayouts=set_layouts if set_layouts else None,
+        pushConstantRangeCount=len(push_constant_ranges),
+        pPushConstantRanges=push_constant_ranges if push_constant_ranges else None
+    )
+
+    return vkCreatePipelineLayout(device, pipeline_layout_info, None)
+
+def create_graphics_pipeline(input_bundle, debug):
+    if debug:
+        print('Creating graphics pipeline')
+
+    shader_cache = input_bundle.shader_cache
+    if shader_cache is not None:
+        vertex_module = shader_cache.get(input_bundle.vertex_filepath)
+        fragment_module = shader_cache.get(input_bundle.fragment_filepath)
+    else:
+        vertex_module = shaders.create_shader_module(input_bundle.device, input_bundle.vertex_filepath)
+        fragment_module = shaders.create_shader_module(input_bundle.device, input_bundle.fragment_filepath)
+
+    pipeline_layout = create_pipeline_layout(input_bundle.device, input_bundle.set_layouts, input_bundle.push_constant_ranges)
+    render_pass = input_bundle.render_pass
+    if render_pass is None:
+        render_pass = create_render_pass(input_bundle.device, input_bundle.swapchain_image_format, debug, input_bundle.final_layout)
+
+    description = pipeline_state.PipelineDescription(
+        input_bundle.vertex_filepath,
+        input_bundle.fragment_filepath,
+        pipeline_layout,
+        render_pass,
+        vertex_bindings=pipeline_state.describe_bindings(input_bundle.vertex_bindings),
+        vertex_attributes=pipeline_state.describe_attributes(input_bundle.vertex_attributes),
+        # Set per command buffer, so a resize never has to recompile the pipeline
+        dynamic_states=DYNAMIC_STATES
+    )
+    pipeline_info = pipeline_state.make_create_info(description, vertex_module, fragment_module)
+
+    graphics_pipeline = vkCreateGraphicsPipelines(input_bundle.device, input_bundle.pipeline_cache, 1, [pipeline_info], None)[0]
+
+    if shader_cache is None:
+        vkDestroyShaderModule(input_bundle.device, vertex_module, None)
+        vkDestroyShaderModule(input_bundle.device, fragment_module, None)
+
+    return OutputBundle(pipeline_layout, render_pass, graphics_pipeline, description)
+
+def record_viewport(command_buffer, extent):
+    # Dynamic state is not inherited, every primary and secondary drawing with these pipelines sets it
+    viewport = VkViewport(x=0, y=0, width=extent.width, height=extent.height, minDepth=0.0, maxDepth=1.0)
+    scissor = VkRect2D(offset=VkOffset2D(x=0, y=0), extent=extent)
+
+    vkCmdSetViewport(command_buffer, 0, 1, [viewport])
+    vkCmdSetScissor(command_buffer, 0, 1, [scissor])
+
+def create_compute_pipeline(device, compute_filepath, pipeline_layout, pipeline_cache, debug, shader_cache = None):
+    if debug:
+        print(f"Creating compute pipeline from {compute_filepath}")
+
+    if shader_cache is not None:
+        compute_module = shader_cache.get(compute_filepath)
+    else:
+        compute_module = shaders.create_shader_module(device, compute_filepath)
+
+    compute_stage = VkPipelineShaderStageCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO,
+        stage=VK_SHADER_STAGE_COMPUTE_BIT,
+        module=compute_module,
+        pName='main'
+    )
+
+    pipeline_info = VkComputePipelineCreateInfo(
+        sType=VK_STRUCTURE_TYPE_COMPUTE_PIPELINE_CREATE_INFO,
+        stage=compute_stage,
+        layout=pipeline_layout
+    )
+
+    compute_pipeline = vkCreateComputePipelines(device, pipeline_cache, 1, [pipeline_info], None)[0]
+
+    if shader_cache is None:
+        vkDestroyShaderModule(device, compute_module, None)
+
+    return compute_pipeline
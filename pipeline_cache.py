@@ -0,0 +1,125 @@
+from vulkan import *
+import os
+import struct
+import tempfile
+
+# Our own file header: magic, file version, vendor id, device id, driver version, cache uuid, blob size.
+# The driver version is not part of the Vulkan cache header, so it is recorded here.
+FILE_MAGIC = b'VKPC'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sIIII16sQ')
+
+# VkPipelineCacheHeaderVersionOne: header size, header version, vendor id, device id, cache uuid
+VK_CACHE_HEADER = struct.Struct('<IIII16s')
+
+def get_cache_uuid(properties):
+    return bytes(list(properties.pipelineCacheUUID))
+
+def validate_cache_data(data, properties, debug):
+    if len(data) < FILE_HEADER.size:
+        if debug:
+            print('Pipeline cache file is truncated')
+        return None
+
+    (magic, version, vendor_id, device_id, driver_version, uuid, size) = FILE_HEADER.unpack_from(data)
+    blob = data[FILE_HEADER.size:]
+
+    if magic != FILE_MAGIC or version != FILE_VERSION or size != len(blob):
+        if debug:
+            print('Pipeline cache file is not a valid cache')
+        return None
+
+    if (vendor_id != properties.vendorID or device_id != properties.deviceID
+            or driver_version != properties.driverVersion or uuid != get_cache_uuid(properties)):
+        if debug:
+            print('Pipeline cache was built for another device or driver, ignoring it')
+        return None
+
+    # Check the blob's own header as well, a driver may reject it silently otherwise
+    if len(blob) < VK_CACHE_HEADER.size:
+        return None
+
+    (header_size, header_version, blob_vendor_id, blob_device_id, blob_uuid) = VK_CACHE_HEADER.unpack_from(blob)
+    if (header_size < VK_CACHE_HEADER.size or header_version != VK_PIPELINE_CACHE_HEADER_VERSION_ONE
+            or blob_vendor_id != properties.vendorID or blob_device_id != properties.deviceID
+            or blob_uuid != get_cache_uuid(properties)):
+        if debug:
+            print('Pipeline cache blob header does not match the device, ignoring it')
+        return None
+
+    return blob
+
+def load_cache_data(path, properties, debug):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        if debug:
+            print(f"No pipeline cache found at {path}")
+        return None
+
+    blob = validate_cache_data(data, properties, debug)
+
+    if blob is not None and debug:
+        print(f"Loaded {len(blob)} bytes of pipeline cache from {path}")
+
+    return blob
+
+def create_pipeline_cache(device_capabilities, device, path, debug):
+    properties = device_capabilities.properties
+    blob = None
+    if path is not None:
+        blob = load_cache_data(path, properties, debug)
+
+    if blob:
+        create_info = VkPipelineCacheCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_CACHE_CREATE_INFO,
+            initialDataSize=len(blob),
+            pInitialData=ffi.from_buffer(blob)
+        )
+    else:
+        create_info = VkPipelineCacheCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_CACHE_CREATE_INFO
+        )
+
+    return vkCreatePipelineCache(device, create_info, None)
+
+def get_cache_data(device, pipeline_cache):
+    # The bindings do not wrap vkGetPipelineCacheData, so call it directly
+    data_size = ffi.new('size_t*')
+    result = lib.vkGetPipelineCacheData(device, pipeline_cache, data_size, ffi.NULL)
+    if result != VK_SUCCESS:
+        raise exception_codes[result]
+
+    data = ffi.new('char[]', data_size[0])
+    result = lib.vkGetPipelineCacheData(device, pipeline_cache, data_size, data)
+    if result != VK_SUCCESS:
+        raise exception_codes[result]
+
+    return ffi.buffer(data, data_size[0])[:]
+
+def save_pipeline_cache(device_capabilities, device, pipeline_cache, path, debug):
+    properties = device_capabilities.properties
+    blob = get_cache_data(device, pipeline_cache)
+
+    header = FILE_HEADER.pack(
+        FILE_MAGIC, FILE_VERSION, properties.vendorID, properties.deviceID,
+        properties.driverVersion, get_cache_uuid(properties), len(blob)
+    )
+
+    # Write next to the target and rename over it, so a crash never leaves a torn cache
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, tmp_path) = tempfile.mkstemp(prefix='.pipeline_cache.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if debug:
+        print(f"Saved {len(blob)} bytes of pipeline cache to {path}")
@@ -0,0 +1,379 @@
+from vulkan import *
+import concurrent.futures
+import threading
+
+# (src color, dst color, color op, src alpha, dst alpha, alpha op), None leaves blending off
+BLEND_ALPHA = (
+    VK_BLEND_FACTOR_SRC_ALPHA, VK_BLEND_FACTOR_ONE_MINUS_SRC_ALPHA, VK_BLEND_OP_ADD,
+    VK_BLEND_FACTOR_ONE, VK_BLEND_FACTOR_ZERO, VK_BLEND_OP_ADD
+)
+BLEND_ADDITIVE = (
+    VK_BLEND_FACTOR_ONE, VK_BLEND_FACTOR_ONE, VK_BLEND_OP_ADD,
+    VK_BLEND_FACTOR_ONE, VK_BLEND_FACTOR_ONE, VK_BLEND_OP_ADD
+)
+
+COLOR_WRITE_ALL = VK_COLOR_COMPONENT_R_BIT | VK_COLOR_COMPONENT_G_BIT | VK_COLOR_COMPONENT_B_BIT | VK_COLOR_COMPONENT_A_BIT
+
+def describe_bindings(bindings):
+    # cffi structs are not hashable, descriptions hold plain tuples instead
+    return tuple((binding.binding, binding.stride, binding.inputRate) for binding in bindings)
+
+def describe_attributes(attributes):
+    return tuple((attribute.location, attribute.binding, attribute.format, attribute.offset) for attribute in attributes)
+
+class PipelineDescription:
+    FIELDS = (
+        'vertex_filepath', 'fragment_filepath', 'layout', 'render_pass', 'subpass',
+        'vertex_bindings', 'vertex_attributes', 'topology', 'polygon_mode', 'cull_mode', 'front_face',
+        'blend', 'depth_test', 'depth_write', 'depth_compare', 'extent', 'dynamic_states'
+    )
+
+    def __init__(self, vertex_filepath, fragment_filepath, layout, render_pass, subpass = 0,
+                 vertex_bindings = (), vertex_attributes = (), topology = VK_PRIMITIVE_TOPOLOGY_TRIANGLE_LIST,
+                 polygon_mode = VK_POLYGON_MODE_FILL, cull_mode = VK_CULL_MODE_BACK_BIT, front_face = VK_FRONT_FACE_CLOCKWISE,
+                 blend = None, depth_test = False, depth_write = False, depth_compare = VK_COMPARE_OP_LESS,
+                 extent = None, dynamic_states = ()) -> None:
+        self.vertex_filepath = vertex_filepath
+        self.fragment_filepath = fragment_filepath
+        # Handles are owned by the caller, a pipeline is only used with this render pass or one compatible with it
+        self.layout = layout
+        self.render_pass = render_pass
+        self.subpass = subpass
+        self.vertex_bindings = tuple(vertex_bindings)
+        self.vertex_attributes = tuple(vertex_attributes)
+        self.topology = topology
+        self.polygon_mode = polygon_mode
+        self.cull_mode = cull_mode
+        self.front_face = front_face
+        self.blend = blend
+        self.depth_test = depth_test
+        self.depth_write = depth_write
+        self.depth_compare = depth_compare
+        # (width, height) baked into the viewport, unused once the viewport is dynamic
+        self.extent = extent
+        self.dynamic_states = tuple(dynamic_states)
+
+        self.key = tuple(getattr(self, field) for field in self.FIELDS)
+        self.hash = hash(self.key)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, PipelineDescription) and self.key == other.key
+
+    def variant(self, **changes):
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        fields.update(changes)
+        return PipelineDescription(**fields)
+
+def create_graphics_pipelines(device, pipeline_cache, infos):
+    # The bindings raise on failure and lose whatever pipelines the driver did create, so call it directly
+    create_infos = ffi.new('VkGraphicsPipelineCreateInfo[]', [info[0] for info in infos])
+    pipelines = ffi.new('VkPipeline[]', len(infos))
+    result = lib.vkCreateGraphicsPipelines(device, pipeline_cache, len(infos), create_infos, ffi.NULL, pipelines)
+    created = [pipelines[i] for i in range(len(infos))]
+
+    if result != VK_SUCCESS:
+        for pipeline in created:
+            if pipeline != ffi.NULL:
+                vkDestroyPipeline(device, pipeline, None)
+        raise exception_codes[result]
+
+    return created
+
+def make_create_info(description, vertex_module, fragment_module):
+    stages = [
+        VkPipelineShaderStageCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO,
+            stage=VK_SHADER_STAGE_VERTEX_BIT,
+            module=vertex_module,
+            pName='main'
+        ),
+        VkPipelineShaderStageCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO,
+            stage=VK_SHADER_STAGE_FRAGMENT_BIT,
+            module=fragment_module,
+            pName='main'
+        )
+    ]
+
+    vertex_bindings = [
+        VkVertexInputBindingDescription(binding=binding, stride=stride, inputRate=input_rate)
+        for (binding, stride, input_rate) in description.vertex_bindings
+    ]
+    vertex_attributes = [
+        VkVertexInputAttributeDescription(location=location, binding=binding, format=format, offset=offset)
+        for (location, binding, format, offset) in description.vertex_attributes
+    ]
+
+    vertex_input_info = VkPipelineVertexInputStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_VERTEX_INPUT_STATE_CREATE_INFO,
+        vertexBindingDescriptionCount=len(vertex_bindings),
+        pVertexBindingDescriptions=vertex_bindings,
+        vertexAttributeDescriptionCount=len(vertex_attributes),
+        pVertexAttributeDescriptions=vertex_attributes
+    )
+
+    input_assembly = VkPipelineInputAssemblyStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_INPUT_ASSEMBLY_STATE_CREATE_INFO,
+        topology=description.topology,
+        primitiveRestartEnable=VK_FALSE
+    )
+
+    # Dynamic viewport and scissor are set when recording, only their count goes in here
+    viewports = None
+    scissors = None
+    if description.extent is not None:
+        (width, height) = description.extent
+        if VK_DYNAMIC_STATE_VIEWPORT not in description.dynamic_states:
+            viewports = [VkViewport(x=0, y=0, width=width, height=height, minDepth=0.0, maxDepth=1.0)]
+        if VK_DYNAMIC_STATE_SCISSOR not in description.dynamic_states:
+            scissors = [VkRect2D(offset=VkOffset2D(x=0, y=0), extent=VkExtent2D(width=width, height=height))]
+
+    viewport_state = VkPipelineViewportStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_VIEWPORT_STATE_CREATE_INFO,
+        viewportCount=1,
+        pViewports=viewports,
+        scissorCount=1,
+        pScissors=scissors
+    )
+
+    rasterizer = VkPipelineRasterizationStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_RASTERIZATION_STATE_CREATE_INFO,
+        depthClampEnable=VK_FALSE,
+        rasterizerDiscardEnable=VK_FALSE,
+        polygonMode=description.polygon_mode,
+        lineWidth=1.0,
+        cullMode=description.cull_mode,
+        frontFace=description.front_face,
+        depthBiasEnable=VK_FALSE
+    )
+
+    multisampling = VkPipelineMultisampleStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_MULTISAMPLE_STATE_CREATE_INFO,
+        sampleShadingEnable=VK_FALSE,
+        rasterizationSamples=VK_SAMPLE_COUNT_1_BIT
+    )
+
+    depth_stencil = None
+    if description.depth_test or description.depth_write:
+        depth_stencil = VkPipelineDepthStencilStateCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_DEPTH_STENCIL_STATE_CREATE_INFO,
+            depthTestEnable=VK_TRUE if description.depth_test else VK_FALSE,
+            depthWriteEnable=VK_TRUE if description.depth_write else VK_FALSE,
+            depthCompareOp=description.depth_compare,
+            depthBoundsTestEnable=VK_FALSE,
+            stencilTestEnable=VK_FALSE
+        )
+
+    if description.blend is None:
+        color_blend_attachment = VkPipelineColorBlendAttachmentState(
+            colorWriteMask=COLOR_WRITE_ALL,
+            blendEnable=VK_FALSE
+        )
+    else:
+        (src_color, dst_color, color_op, src_alpha, dst_alpha, alpha_op) = description.blend
+        color_blend_attachment = VkPipelineColorBlendAttachmentState(
+            colorWriteMask=COLOR_WRITE_ALL,
+            blendEnable=VK_TRUE,
+            srcColorBlendFactor=src_color,
+            dstColorBlendFactor=dst_color,
+            colorBlendOp=color_op,
+            srcAlphaBlendFactor=src_alpha,
+            dstAlphaBlendFactor=dst_alpha,
+            alphaBlendOp=alpha_op
+        )
+
+    color_blending = VkPipelineColorBlendStateCreateInfo(
+        sType=VK_STRUCTURE_TYPE_PIPELINE_COLOR_BLEND_STATE_CREATE_INFO,
+        logicOpEnable=VK_FALSE,
+        attachmentCount=1,
+        pAttachments=[color_blend_attachment],
+        blendConstants=[0.0, 0.0, 0.0, 0.0]
+    )
+
+    dynamic_state = None
+    if description.dynamic_states:
+        dynamic_state = VkPipelineDynamicStateCreateInfo(
+            sType=VK_STRUCTURE_TYPE_PIPELINE_DYNAMIC_STATE_CREATE_INFO,
+            dynamicStateCount=len(description.dynamic_states),
+            pDynamicStates=list(description.dynamic_states)
+        )
+
+    return VkGraphicsPipelineCreateInfo(
+        sType=VK_STRUCTURE_TYPE_GRAPHICS_PIPELINE_CREATE_INFO,
+        stageCount=len(stages),
+        pStages=stages,
+        pVertexInputState=vertex_input_info,
+        pInputAssemblyState=input_assembly,
+        pViewportState=viewport_state,
+        pRasterizationState=rasterizer,
+        pMultisampleState=multisampling,
+        pDepthStencilState=depth_stencil,
+        pColorBlendState=color_blending,
+        pDynamicState=dynamic_state,
+        layout=description.layout,
+        renderPass=description.render_pass,
+        subpass=description.subpass
+    )
+
+class PipelineLibrary:
+    def __init__(self, device, pipeline_cache, shader_cache, debug, workers = 2, batch_size = 8) -> None:
+        self.device = device
+        self.pipeline_cache = pipeline_cache
+        self.shader_cache = shader_cache
+        self.debug = debug
+        self.batch_size = batch_size
+
+        # description -> pipeline, each distinct description is only ever compiled once
+        self.pipelines = {}
+        # Requested this frame, handed to the workers in batches by flush
+        self.queued = []
+        self.compiling = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+        # Bumped whenever a pipeline lands, so recordings drawn with a fallback get redone
+        self.version = 0
+        # Bumped by clear, batches started before it are thrown away when they finish
+        self.generation = 0
+
+        # cffi drops the GIL around vkCreateGraphicsPipelines, so drivers compile on these threads in parallel
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline')
+        self.futures = []
+
+        if debug:
+            print(f"Compiling pipelines on {workers} workers in batches of {batch_size}")
+
+    def create_pipelines(self, descriptions):
+        infos = [
+            make_create_info(
+                description,
+                self.shader_cache.get(description.vertex_filepath),
+                self.shader_cache.get(description.fragment_filepath)
+            )
+            for description in descriptions
+        ]
+
+        # One call for the whole batch, the driver can share work between them
+        return create_graphics_pipelines(self.device, self.pipeline_cache, infos)
+
+    def get(self, description):
+        # Blocking, for pipelines the first frame cannot draw without
+        with self.lock:
+            pipeline = self.pipelines.get(description)
+        if pipeline is not None:
+            return pipeline
+
+        pipeline = self.create_pipelines([description])[0]
+
+        with self.lock:
+            existing = self.pipelines.get(description)
+            if existing is None:
+                self.pipelines[description] = pipeline
+                self.version += 1
+                return pipeline
+
+        # Finished by a worker in the meantime
+        vkDestroyPipeline(self.device, pipeline, None)
+        return existing
+
+    def request(self, description):
+        # Never blocks, None until a worker has compiled it
+        with self.lock:
+            pipeline = self.pipelines.get(description)
+            if pipeline is not None:
+                return pipeline
+
+            if description not in self.compiling and description not in self.failed:
+                self.compiling.add(description)
+                self.queued.append(description)
+
+        return None
+
+    def get_or_fallback(self, description, fallback):
+        pipeline = self.request(description)
+        return pipeline if pipeline is not None else fallback
+
+    def is_ready(self, description):
+        with self.lock:
+            return description in self.pipelines
+
+    def flush(self):
+        # Once per frame, after recording has made its requests
+        with self.lock:
+            queued = self.queued
+            self.queued = []
+            generation = self.generation
+
+        for i in range(0, len(queued), self.batch_size):
+            batch = queued[i:i + self.batch_size]
+            self.futures.append(self.executor.submit(self.compile_batch, batch, generation))
+
+        self.futures = [future for future in self.futures if not future.done()]
+
+    def compile_batch(self, descriptions, generation):
+        try:
+            pipelines = self.create_pipelines(descriptions)
+        except Exception as e:
+            if len(descriptions) > 1:
+                # One bad variant fails the whole call, the others are compiled on their own
+                for description in descriptions:
+                    self.compile_batch([description], generation)
+                return
+
+            # A bad variant stays on its fallback instead of being retried every frame
+            print(f"Failed to compile pipeline: {e}")
+            with self.lock:
+                self.compiling.difference_update(descriptions)
+                if generation == self.generation:
+                    self.failed.update(descriptions)
+            return
+
+        stale = []
+        with self.lock:
+            self.compiling.difference_update(descriptions)
+            for (description, pipeline) in zip(descriptions, pipelines):
+                if generation != self.generation or description in self.pipelines:
+                    stale.append(pipeline)
+                else:
+                    self.pipelines[description] = pipeline
+            if len(stale) < len(descriptions):
+                self.version += 1
+
+        for pipeline in stale:
+            vkDestroyPipeline(self.device, pipeline, None)
+
+        if self.debug:
+            print(f"Compiled {len(descriptions) - len(stale)} pipelines in the background")
+
+    def wait_idle(self):
+        self.flush()
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+    def clear(self):
+        # Only once nothing in flight draws with these, e.g. after the shaders or the render pass changed
+        with self.lock:
+            pipelines = list(self.pipelines.values())
+            self.pipelines = {}
+            self.queued = []
+            self.compiling = set()
+            self.failed = set()
+            self.generation += 1
+            self.version += 1
+
+        # Batches already on a worker still read the old layouts and render passes, the caller
+        # destroys those next, so they have to land first. Their pipelines are stale and destroyed
+        concurrent.futures.wait(self.futures)
+        self.futures = []
+
+        for pipeline in pipelines:
+            vkDestroyPipeline(self.device, pipeline, None)
+
+    def destroy(self):
+        self.executor.shutdown(wait=True)
+        self.futures = []
+        self.clear()
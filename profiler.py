@@ -0,0 +1,242 @@
+from vulkan import *
+import json
+import math
+import time
+import numpy as np
+
+SPANS = ('acquire', 'record', 'submit', 'present')
+
+# Results come back in bit order, so keep this sorted by flag value
+STATISTICS = (
+    ('input_assembly_vertices', VK_QUERY_PIPELINE_STATISTIC_INPUT_ASSEMBLY_VERTICES_BIT),
+    ('vertex_shader_invocations', VK_QUERY_PIPELINE_STATISTIC_VERTEX_SHADER_INVOCATIONS_BIT),
+    ('clipping_primitives', VK_QUERY_PIPELINE_STATISTIC_CLIPPING_PRIMITIVES_BIT),
+    ('fragment_shader_invocations', VK_QUERY_PIPELINE_STATISTIC_FRAGMENT_SHADER_INVOCATIONS_BIT),
+    ('compute_shader_invocations', VK_QUERY_PIPELINE_STATISTIC_COMPUTE_SHADER_INVOCATIONS_BIT)
+)
+
+FRAME_DTYPE = np.dtype(
+    [('frame', '<u8'), ('start_ns', '<i8'), ('end_ns', '<i8')]
+    + [(f"{span}_{edge}", '<i8') for span in SPANS for edge in ('start', 'end')]
+    + [('gpu_ns', '<f8')]
+    + [(name, '<u8') for (name, _) in STATISTICS]
+)
+
+class Span:
+    def __init__(self, profiler, name) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.current[f"{self.name}_start"] = time.perf_counter_ns()
+
+    def __exit__(self, *args):
+        self.profiler.current[f"{self.name}_end"] = time.perf_counter_ns()
+
+class Profiler:
+    def __init__(self, device_capabilities, device, queue_family_index, frame_count, debug, capacity = 4096, secondaries = False) -> None:
+        self.device = device
+        self.debug = debug
+        self.capacity = capacity
+
+        # Single writer ring, records are filled in place and published by bumping written.
+        # Each record's sequence is odd while the render thread writes it, readers drop records it moved
+        self.records = np.zeros(capacity, dtype=FRAME_DTYPE)
+        self.sequences = np.zeros(capacity, dtype=np.uint64)
+        self.written = 0
+        self.frame = 0
+        self.current = np.zeros((), dtype=FRAME_DTYPE)
+
+        # Ring index of the frame each slot submitted, resolved once its fence signals
+        self.pending = {}
+
+        properties = device_capabilities.properties
+        features = device_capabilities.features
+        family = device_capabilities.queue_families[queue_family_index]
+
+        self.timestamp_period = properties.limits.timestampPeriod
+        self.timestamp_mask = (1 << family.timestampValidBits) - 1
+
+        self.timestamp_pool = None
+        if family.timestampValidBits > 0:
+            pool_info = VkQueryPoolCreateInfo(
+                sType=VK_STRUCTURE_TYPE_QUERY_POOL_CREATE_INFO,
+                queryType=VK_QUERY_TYPE_TIMESTAMP,
+                queryCount=2 * frame_count
+            )
+            self.timestamp_pool = vkCreateQueryPool(device, pool_info, None)
+
+        # Only usable when device.create_logical_device enabled the feature. A query active while
+        # secondaries execute also needs inheritedQueries, without it they are left unmeasured
+        self.statistics_flags = 0
+        self.statistics_pool = None
+        if features.pipelineStatisticsQuery and (not secondaries or features.inheritedQueries):
+            for (_, flag) in STATISTICS:
+                self.statistics_flags |= flag
+
+            pool_info = VkQueryPoolCreateInfo(
+                sType=VK_STRUCTURE_TYPE_QUERY_POOL_CREATE_INFO,
+                queryType=VK_QUERY_TYPE_PIPELINE_STATISTICS,
+                queryCount=frame_count,
+                pipelineStatistics=self.statistics_flags
+            )
+            self.statistics_pool = vkCreateQueryPool(device, pool_info, None)
+
+        if debug:
+            print(f"Profiling with GPU timestamps {'on' if self.timestamp_pool else 'off'}, pipeline statistics {'on' if self.statistics_pool else 'off'}")
+
+    def begin_frame(self):
+        self.current = np.zeros((), dtype=FRAME_DTYPE)
+        self.current['frame'] = self.frame
+        self.current['start_ns'] = time.perf_counter_ns()
+        self.current['gpu_ns'] = math.nan
+
+    def span(self, name):
+        return Span(self, name)
+
+    def end_frame(self, slot):
+        self.current['end_ns'] = time.perf_counter_ns()
+
+        index = self.written
+        position = index % self.capacity
+        self.sequences[position] += 1
+        self.records[position] = self.current
+        self.sequences[position] += 1
+        self.written += 1
+        self.frame += 1
+
+        if self.timestamp_pool is not None or self.statistics_pool is not None:
+            self.pending[slot] = index
+
+    def record_begin(self, command_buffer, slot):
+        # Queries are reset in the command buffer itself, so a reused recording stays valid
+        if self.timestamp_pool is not None:
+            vkCmdResetQueryPool(command_buffer, self.timestamp_pool, 2 * slot, 2)
+            vkCmdWriteTimestamp(command_buffer, VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT, self.timestamp_pool, 2 * slot)
+
+        if self.statistics_pool is not None:
+            vkCmdResetQueryPool(command_buffer, self.statistics_pool, slot, 1)
+            vkCmdBeginQuery(command_buffer, self.statistics_pool, slot, 0)
+
+    def record_end(self, command_buffer, slot):
+        if self.statistics_pool is not None:
+            vkCmdEndQuery(command_buffer, self.statistics_pool, slot)
+
+        if self.timestamp_pool is not None:
+            vkCmdWriteTimestamp(command_buffer, VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT, self.timestamp_pool, 2 * slot + 1)
+
+    def resolve(self, slot):
+        # Called once the slot's fence has signaled, so results are ready without waiting
+        index = self.pending.pop(slot, None)
+        if index is None or self.written - index > self.capacity:
+            return
+
+        # Query results are read first, so the record is only odd for the stores
+        results = {}
+
+        if self.timestamp_pool is not None:
+            timestamps = np.zeros(2, dtype=np.uint64)
+            try:
+                vkGetQueryPoolResults(
+                    self.device, self.timestamp_pool, 2 * slot, 2, timestamps.nbytes, ffi.from_buffer(timestamps),
+                    8, VK_QUERY_RESULT_64_BIT
+                )
+                ticks = (int(timestamps[1]) - int(timestamps[0])) & self.timestamp_mask
+                results['gpu_ns'] = ticks * self.timestamp_period
+            except VkNotReady:
+                pass
+
+        if self.statistics_pool is not None:
+            statistics = np.zeros(len(STATISTICS), dtype=np.uint64)
+            try:
+                vkGetQueryPoolResults(
+                    self.device, self.statistics_pool, slot, 1, statistics.nbytes, ffi.from_buffer(statistics),
+                    statistics.nbytes, VK_QUERY_RESULT_64_BIT
+                )
+                for (i, (name, _)) in enumerate(STATISTICS):
+                    results[name] = statistics[i]
+            except VkNotReady:
+                pass
+
+        position = index % self.capacity
+        record = self.records[position]
+        self.sequences[position] += 1
+        for (name, value) in results.items():
+            record[name] = value
+        self.sequences[position] += 1
+
+    def snapshot(self):
+        # Oldest record first, never blocks the render thread. Records it wrote to during the copy are left out
+        written = self.written
+        count = min(written, self.capacity)
+        frames = np.arange(written - count, written)
+        indices = frames % self.capacity
+
+        before = self.sequences[indices]
+        records = self.records[indices]
+        after = self.sequences[indices]
+
+        # Lapped by the writer since written was read, the slot holds a newer frame now
+        valid = (before == after) & (before % 2 == 0) & (frames >= self.written - self.capacity)
+        return records[valid]
+
+    def export_percentiles(self, percentiles = (50, 90, 99)):
+        records = self.snapshot()
+
+        series = {
+            'frame_ms': np.diff(records['start_ns']) / 1e6,
+            'gpu_ms': records['gpu_ns'][~np.isnan(records['gpu_ns'])] / 1e6
+        }
+        for span in SPANS:
+            measured = records[f"{span}_end"] > 0
+            series[f"{span}_ms"] = (records[f"{span}_end"][measured] - records[f"{span}_start"][measured]) / 1e6
+
+        report = {'frames': len(records)}
+        for (name, values) in series.items():
+            if len(values) == 0:
+                continue
+            report[name] = {f"p{p}": float(np.percentile(values, p)) for p in percentiles}
+
+        return report
+
+    def export_chrome_trace(self, path = None):
+        events = []
+        for record in self.snapshot():
+            frame = int(record['frame'])
+            events.append({
+                'name': f"frame {frame}", 'ph': 'X', 'pid': 0, 'tid': 'cpu',
+                'ts': int(record['start_ns']) / 1e3, 'dur': (int(record['end_ns']) - int(record['start_ns'])) / 1e3
+            })
+
+            for span in SPANS:
+                start = int(record[f"{span}_start"])
+                end = int(record[f"{span}_end"])
+                if end == 0:
+                    continue
+                events.append({
+                    'name': span, 'ph': 'X', 'pid': 0, 'tid': 'cpu',
+                    'ts': start / 1e3, 'dur': (end - start) / 1e3
+                })
+
+            # GPU clocks are not calibrated against the CPU, so GPU work is drawn from its submit
+            if not math.isnan(record['gpu_ns']):
+                start = int(record['submit_start']) or int(record['start_ns'])
+                events.append({
+                    'name': f"gpu frame {frame}", 'ph': 'X', 'pid': 0, 'tid': 'gpu',
+                    'ts': start / 1e3, 'dur': float(record['gpu_ns']) / 1e3,
+                    'args': {name: int(record[name]) for (name, _) in STATISTICS}
+                })
+
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+
+        return trace
+
+    def destroy(self):
+        if self.timestamp_pool is not None:
+            vkDestroyQueryPool(self.device, self.timestamp_pool, None)
+        if self.statistics_pool is not None:
+            vkDestroyQueryPool(self.device, self.statistics_pool, None)
@@ -1,44 +1,86 @@
 from vulkan import *
 
 class QueueFamilyIndices:
-    def __init__(self) -> None:
+    def __init__(self, needs_present = True) -> None:
         self.graphics_queue_family = None
         self.present_queue_family = None
+        self.transfer_queue_family = None
+        self.compute_queue_family = None
+        self.needs_present = needs_present
 
     def is_complete(self):
+        if not self.needs_present:
+            return self.graphics_queue_family is not None
+
         return self.graphics_queue_family is not None and self.present_queue_family is not None
 
-def find_queue_families(device, instance, surface, debug):
-    indices = QueueFamilyIndices()
+    def unique_families(self):
+        unique = []
+        for index in [self.graphics_queue_family, self.present_queue_family, self.transfer_queue_family, self.compute_queue_family]:
+            if index is not None and index not in unique:
+                unique.append(index)
+
+        return unique
 
-    surface_support = vkGetInstanceProcAddr(instance, "vkGetPhysicalDeviceSurfaceSupportKHR")
+def find_queue_families(capabilities, debug):
+    # Headless devices have no surface, so queues are chosen by graphics capability alone
+    indices = QueueFamilyIndices(needs_present=capabilities.surface is not None)
 
-    queue_families = vkGetPhysicalDeviceQueueFamilyProperties(device)
+    queue_families = capabilities.queue_families
 
     if debug:
         print(f"Found {len(queue_families)} queue families")
 
     for i, queue_family in enumerate(queue_families):
-        if queue_family.queueFlags & VK_QUEUE_GRAPHICS_BIT:
-            indices.graphics_queue_family = i
-            if debug:
-                print(f"Using graphics queue family {i}")
+        flags = queue_family.queueFlags
+
+        if not indices.is_complete():
+            if flags & VK_QUEUE_GRAPHICS_BIT:
+                indices.graphics_queue_family = i
+                if debug:
+                    print(f"Using graphics queue family {i}")
+
 
+            if capabilities.present_support[i]:
+                indices.present_queue_family = i
+                if debug:
+                    print(f"Using present queue family {i}")
 
-        if surface_support(device, i, surface):
-            indices.present_queue_family = i
-            if debug:
-                print(f"Using present queue family {i}")
+        # Dedicated families run alongside the graphics queue, so only take ones without graphics
+        if flags & VK_QUEUE_GRAPHICS_BIT:
+            continue
 
-        if indices.is_complete():
-            break
+        if flags & VK_QUEUE_COMPUTE_BIT:
+            if indices.compute_queue_family is None:
+                indices.compute_queue_family = i
+                if debug:
+                    print(f"Using compute queue family {i}")
+        elif flags & VK_QUEUE_TRANSFER_BIT:
+            if indices.transfer_queue_family is None:
+                indices.transfer_queue_family = i
+                if debug:
+                    print(f"Using transfer queue family {i}")
 
     return indices
 
-def get_queues(physicalDevice, device, instance, surface, debug):
-    indices = find_queue_families(physicalDevice, instance, surface, debug)
+def get_queues(device, indices):
+    graphics_queue = vkGetDeviceQueue(device, indices.graphics_queue_family, 0)
+
+    if indices.present_queue_family is None:
+        return [graphics_queue, None]
 
     return [
-        vkGetDeviceQueue(device, indices.graphics_queue_family, 0),
+        graphics_queue,
         vkGetDeviceQueue(device, indices.present_queue_family, 0)
     ]
+
+def get_async_queues(device, indices):
+    transfer_queue = None
+    if indices.transfer_queue_family is not None:
+        transfer_queue = vkGetDeviceQueue(device, indices.transfer_queue_family, 0)
+
+    compute_queue = None
+    if indices.compute_queue_family is not None:
+        compute_queue = vkGetDeviceQueue(device, indices.compute_queue_family, 0)
+
+    return [transfer_queue, compute_queue]
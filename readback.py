@@ -0,0 +1,256 @@
+from vulkan import *
+import asyncio
+import concurrent.futures
+import numpy as np
+import commands
+
+FREE = 0
+REQUESTED = 1
+PENDING = 2
+READY = 3
+
+class ReadbackFrame:
+    def __init__(self, ring, slot, frame, format) -> None:
+        self.ring = ring
+        self.slot = slot
+        self.frame = frame
+        self.format = format
+        # (height, width, 4) view straight over the mapped slot, only valid until released
+        self.array = slot.array
+
+    def release(self):
+        if self.slot is not None:
+            self.array = None
+            self.ring.release(self.slot)
+            self.slot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+class ReadbackSlot:
+    def __init__(self, command_buffer) -> None:
+        self.command_buffer = command_buffer
+        self.buffer = None
+        self.allocation = None
+        self.size = 0
+        self.array = None
+        self.state = FREE
+        self.future = None
+        self.fence = None
+        self.frame = None
+        self.format = None
+
+class ReadbackRing:
+    def __init__(self, allocator, device, queue_family_index, slot_count, debug) -> None:
+        self.allocator = allocator
+        self.device = device
+        self.debug = debug
+
+        self.command_pool = commands.make_command_pool(device, queue_family_index, debug)
+        command_buffers = commands.make_command_buffers(device, self.command_pool, slot_count, debug)
+        self.slots = [ReadbackSlot(command_buffer) for command_buffer in command_buffers]
+
+        # Served oldest first, one request per rendered frame
+        self.requested = []
+        self.dropped = 0
+
+        if debug:
+            print(f"Created readback ring with {slot_count} slots")
+
+    def request(self):
+        for slot in self.slots:
+            if slot.state == FREE:
+                slot.state = REQUESTED
+                slot.future = concurrent.futures.Future()
+                self.requested.append(slot)
+                return slot.future
+
+        # Every slot is in flight or still held by a consumer, the caller decides what a miss means
+        self.dropped += 1
+        return None
+
+    def request_async(self):
+        future = self.request()
+        if future is None:
+            return None
+
+        return asyncio.wrap_future(future)
+
+    def has_requests(self):
+        return len(self.requested) > 0
+
+    def ensure_size(self, slot, size):
+        if slot.size >= size:
+            return
+
+        # Only ever called on a requested slot, so nothing still reads the old buffer
+        if slot.buffer is not None:
+            self.allocator.destroy_buffer(slot.buffer, slot.allocation)
+
+        # Stays mapped for its whole lifetime, cached so the host reads at full speed
+        (slot.buffer, slot.allocation) = self.allocator.create_buffer(
+            size,
+            VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+            VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT,
+            VK_MEMORY_PROPERTY_HOST_CACHED_BIT
+        )
+        slot.size = size
+
+    def record(self, image, layout, extent, format, fence, frame):
+        # Returns a command buffer to submit right after the frame's own, on the same queue
+        slot = self.requested.pop(0)
+
+        # Tightly packed 4 bytes per pixel for the supported RGBA8/BGRA8 formats
+        size = extent.width * extent.height * 4
+        self.ensure_size(slot, size)
+        slot.array = np.frombuffer(slot.allocation.mapped, dtype=np.uint8, count=size).reshape(extent.height, extent.width, 4)
+
+        command_buffer = slot.command_buffer
+        begin_info = VkCommandBufferBeginInfo(
+            sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+            flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+        )
+        vkBeginCommandBuffer(command_buffer, begin_info)
+
+        subresource_range = VkImageSubresourceRange(
+            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+            baseMipLevel=0,
+            levelCount=1,
+            baseArrayLayer=0,
+            layerCount=1
+        )
+
+        to_transfer = VkImageMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_IMAGE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_TRANSFER_READ_BIT,
+            oldLayout=layout,
+            newLayout=VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+            srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            image=image,
+            subresourceRange=subresource_range
+        )
+        # The swapchain pass has no outgoing dependency of its own, only the implicit one ending at
+        # BOTTOM_OF_PIPE, so the source scope has to reach that far to chain with its final layout transition
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_ALL_COMMANDS_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT,
+            0, 0, None, 0, None, 1, [to_transfer]
+        )
+
+        region = VkBufferImageCopy(
+            bufferOffset=0,
+            bufferRowLength=0,
+            bufferImageHeight=0,
+            imageSubresource=VkImageSubresourceLayers(
+                aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+                mipLevel=0,
+                baseArrayLayer=0,
+                layerCount=1
+            ),
+            imageOffset=VkOffset3D(x=0, y=0, z=0),
+            imageExtent=VkExtent3D(width=extent.width, height=extent.height, depth=1)
+        )
+        vkCmdCopyImageToBuffer(command_buffer, image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, slot.buffer, 1, [region])
+
+        # Back to whatever the render pass left it in, e.g. for presentation
+        to_original = VkImageMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_IMAGE_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_TRANSFER_READ_BIT,
+            dstAccessMask=0,
+            oldLayout=VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+            newLayout=layout,
+            srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            image=image,
+            subresourceRange=subresource_range
+        )
+        to_host = VkBufferMemoryBarrier(
+            sType=VK_STRUCTURE_TYPE_BUFFER_MEMORY_BARRIER,
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_HOST_READ_BIT,
+            srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            buffer=slot.buffer,
+            offset=0,
+            size=VK_WHOLE_SIZE
+        )
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_HOST_BIT | VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT,
+            0, 0, None, 1, [to_host], 1, [to_original]
+        )
+
+        vkEndCommandBuffer(command_buffer)
+
+        slot.state = PENDING
+        slot.fence = fence
+        slot.frame = frame
+        slot.format = format
+
+        return command_buffer
+
+    def resolve(self, slot):
+        slot.state = READY
+        slot.fence = None
+        slot.future.set_result(ReadbackFrame(self, slot, slot.frame, slot.format))
+
+    def retire(self, fence):
+        # The caller has already waited on this fence, as wait_for_frame_slot does
+        for slot in self.slots:
+            if slot.state == PENDING and slot.fence == fence:
+                self.resolve(slot)
+
+    def poll(self):
+        # Non-blocking, picks up frames that finished before their slot comes round again
+        for slot in self.slots:
+            if slot.state != PENDING:
+                continue
+
+            try:
+                vkGetFenceStatus(self.device, slot.fence)
+            except VkNotReady:
+                continue
+
+            self.resolve(slot)
+
+    def wait(self, future):
+        # For synchronous callers, blocks on the one frame fence the readback rides on
+        for slot in self.slots:
+            if slot.future is not future:
+                continue
+
+            if slot.state == REQUESTED:
+                raise Exception('Readback has not been submitted yet, render a frame first')
+            if slot.state == PENDING:
+                vkWaitForFences(self.device, 1, [slot.fence], VK_TRUE, UINT64_MAX)
+                self.resolve(slot)
+            break
+
+        return future.result()
+
+    def release(self, slot):
+        slot.array = None
+        slot.future = None
+        slot.state = FREE
+
+    def cancel_requests(self):
+        for slot in self.requested:
+            slot.future.cancel()
+            slot.future = None
+            slot.state = FREE
+        self.requested = []
+
+    def destroy(self):
+        self.cancel_requests()
+
+        for slot in self.slots:
+            if slot.state == PENDING:
+                slot.future.cancel()
+            slot.array = None
+            if slot.buffer is not None:
+                self.allocator.destroy_buffer(slot.buffer, slot.allocation)
+
+        vkDestroyCommandPool(self.device, self.command_pool, None)
@@ -0,0 +1,81 @@
+from vulkan import *
+import commands
+
+class FrameCommands:
+    def __init__(self, device, queue_family_index, debug, level = VK_COMMAND_BUFFER_LEVEL_PRIMARY) -> None:
+        self.device = device
+        self.debug = debug
+        self.level = level
+
+        # Buffers are never reset one at a time, the whole pool is reset when the scene changes
+        # or when it holds a recording that will not be submitted again
+        self.pool = commands.make_command_pool(device, queue_family_index, debug, flags=VK_COMMAND_POOL_CREATE_TRANSIENT_BIT)
+
+        self.buffers = []
+        self.next_free = 0
+
+        # Scene version the recordings in this pool were made for
+        self.version = None
+        # Whether the buffer begun last may be submitted more than once
+        self.reusable = False
+        # Recordings that may be submitted again, keyed by target image
+        self.recorded = {}
+        # Set once a recording in the pool is thrown away, so its buffer is not left to pile up
+        self.stale = False
+
+    def lookup(self, key, version):
+        if version != self.version:
+            return None
+
+        return self.recorded.get(key)
+
+    def reset(self):
+        vkResetCommandPool(self.device, self.pool, 0)
+        self.next_free = 0
+        self.recorded = {}
+        self.stale = False
+
+    def discard(self):
+        self.stale = True
+
+    def begin(self, version, reusable, inheritance = None):
+        # Only valid once this frame slot's fence has signaled, nothing in the pool is pending then
+        if version != self.version or self.stale:
+            self.reset()
+            self.version = version
+
+        if self.next_free == len(self.buffers):
+            self.buffers += commands.make_command_buffers(self.device, self.pool, 1, self.debug, self.level)
+
+        command_buffer = self.buffers[self.next_free]
+        self.next_free += 1
+        self.reusable = reusable
+
+        flags = 0 if reusable else VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+        # Secondary buffers continue the render pass their primary is in
+        if inheritance is not None:
+            flags |= VK_COMMAND_BUFFER_USAGE_RENDER_PASS_CONTINUE_BIT
+
+        begin_info = VkCommandBufferBeginInfo(
+            sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+            flags=flags,
+            pInheritanceInfo=inheritance
+        )
+        vkBeginCommandBuffer(command_buffer, begin_info)
+
+        return command_buffer
+
+    def end(self, command_buffer, key = None, reusable = False):
+        vkEndCommandBuffer(command_buffer)
+
+        if key is None:
+            return
+
+        if reusable:
+            self.recorded[key] = command_buffer
+        else:
+            self.recorded.pop(key, None)
+            self.discard()
+
+    def destroy(self):
+        vkDestroyCommandPool(self.device, self.pool, None)
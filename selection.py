@@ -0,0 +1,157 @@
+from vulkan import *
+import math
+
+PREFER_DISCRETE = 'discrete'
+PREFER_INTEGRATED = 'integrated'
+FORCE_CPU = 'cpu'
+
+# Device type dominates the score, everything else only orders devices of the same type
+TYPE_WEIGHT = 1000
+
+TYPE_RANKS = {
+    PREFER_DISCRETE: {
+        VK_PHYSICAL_DEVICE_TYPE_DISCRETE_GPU: 4,
+        VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU: 3,
+        VK_PHYSICAL_DEVICE_TYPE_VIRTUAL_GPU: 2,
+        VK_PHYSICAL_DEVICE_TYPE_CPU: 1
+    },
+    # Saves power on laptops where the integrated GPU drives the display anyway
+    PREFER_INTEGRATED: {
+        VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU: 4,
+        VK_PHYSICAL_DEVICE_TYPE_DISCRETE_GPU: 3,
+        VK_PHYSICAL_DEVICE_TYPE_VIRTUAL_GPU: 2,
+        VK_PHYSICAL_DEVICE_TYPE_CPU: 1
+    },
+    FORCE_CPU: {
+        VK_PHYSICAL_DEVICE_TYPE_CPU: 1
+    }
+}
+
+TYPE_NAMES = {
+    VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU: 'integrated',
+    VK_PHYSICAL_DEVICE_TYPE_DISCRETE_GPU: 'discrete',
+    VK_PHYSICAL_DEVICE_TYPE_VIRTUAL_GPU: 'virtual',
+    VK_PHYSICAL_DEVICE_TYPE_CPU: 'cpu'
+}
+
+# Features used when present, each one is worth a little
+OPTIONAL_FEATURES = ['pipelineStatisticsQuery', 'multiDrawIndirect', 'drawIndirectFirstInstance', 'samplerAnisotropy']
+
+class SelectionPolicy:
+    def __init__(self, prefer = PREFER_DISCRETE, device_uuid = None) -> None:
+        if prefer not in TYPE_RANKS:
+            raise Exception(f"Unknown device preference {prefer}")
+
+        self.prefer = prefer
+        # Hex string as printed in the debug ranking, dashes are ignored
+        self.device_uuid = device_uuid.replace('-', '').lower() if device_uuid else None
+
+class DeviceScore:
+    def __init__(self, device_capabilities) -> None:
+        self.capabilities = device_capabilities
+        self.total = 0
+        self.parts = {}
+        self.rejected = None
+
+    def add(self, name, points):
+        self.parts[name] = points
+        self.total += points
+
+    def reject(self, reason):
+        self.rejected = reason
+
+def get_device_local_bytes(device_capabilities):
+    memory_properties = device_capabilities.memory_properties
+
+    total = 0
+    for i in range(memory_properties.memoryHeapCount):
+        heap = memory_properties.memoryHeaps[i]
+        if heap.flags & VK_MEMORY_HEAP_DEVICE_LOCAL_BIT:
+            total += heap.size
+
+    return total
+
+def score_queues(device_capabilities):
+    points = 0
+    has_transfer = False
+    has_compute = False
+
+    for family in device_capabilities.queue_families:
+        flags = family.queueFlags
+        if flags & VK_QUEUE_GRAPHICS_BIT:
+            continue
+        if flags & VK_QUEUE_COMPUTE_BIT:
+            has_compute = True
+        elif flags & VK_QUEUE_TRANSFER_BIT:
+            has_transfer = True
+
+    # Matches what queue_families.find_queue_families will pick up for the async queues
+    if has_transfer:
+        points += 20
+    if has_compute:
+        points += 20
+
+    return points
+
+def score_limits(device_capabilities):
+    limits = device_capabilities.properties.limits
+
+    # Log scaled so a single huge limit cannot outweigh the rest
+    return int(
+        math.log2(max(limits.maxImageDimension2D, 1))
+        + math.log2(max(limits.maxComputeSharedMemorySize, 1))
+        + math.log2(max(limits.maxComputeWorkGroupInvocations, 1))
+        + math.log2(max(limits.maxStorageBufferRange, 1))
+        + limits.maxBoundDescriptorSets
+    )
+
+def score_device(device_capabilities, policy, is_suitable):
+    score = DeviceScore(device_capabilities)
+    device_type = device_capabilities.properties.deviceType
+
+    if policy.device_uuid is not None and device_capabilities.device_uuid != policy.device_uuid:
+        score.reject('UUID does not match')
+        return score
+
+    if not is_suitable(device_capabilities):
+        score.reject('missing required extensions, features or queues')
+        return score
+
+    type_rank = TYPE_RANKS[policy.prefer].get(device_type)
+    if type_rank is None:
+        score.reject(f"{TYPE_NAMES.get(device_type, 'unknown')} devices are excluded by policy")
+        return score
+
+    score.add('type', type_rank * TYPE_WEIGHT)
+    # 10 points per doubling of device local memory from 64MiB up
+    heap_mib = get_device_local_bytes(device_capabilities) // (1024 * 1024)
+    score.add('memory', int(10 * max(math.log2(max(heap_mib, 1)) - 6, 0)))
+    score.add('limits', score_limits(device_capabilities))
+    score.add('queues', score_queues(device_capabilities))
+
+    features = device_capabilities.features
+    score.add('features', 5 * sum(1 for name in OPTIONAL_FEATURES if getattr(features, name)))
+
+    return score
+
+def rank_devices(candidates, policy, is_suitable, debug):
+    scores = [score_device(c, policy, is_suitable) for c in candidates]
+
+    # Stable sort, so equal scores keep the loader's enumeration order
+    ranked = sorted([s for s in scores if s.rejected is None], key=lambda s: s.total, reverse=True)
+
+    if debug:
+        log_ranking(ranked, [s for s in scores if s.rejected is not None])
+
+    return ranked
+
+def log_ranking(ranked, rejected):
+    print('Device ranking:')
+    for (i, score) in enumerate(ranked):
+        properties = score.capabilities.properties
+        parts = ', '.join(f"{name} {points}" for (name, points) in score.parts.items())
+        print(f"  {i + 1}. {properties.deviceName} ({TYPE_NAMES.get(properties.deviceType, 'unknown')}, "
+              f"uuid {score.capabilities.device_uuid}): {score.total} [{parts}]")
+
+    for score in rejected:
+        print(f"  Rejected {score.capabilities.properties.deviceName}: {score.rejected}")
@@ -1,3 +1,7 @@
 cd shaders
 glslc shader.vert -o vertex.spv
 glslc shader.frag -o fragment.spv
+glslc mesh.vert -o mesh.spv
+glslc instanced.vert -o instanced.spv
+glslc cull.comp -o cull.spv
+glslc integrate.comp -o integrate.spv
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+SOURCE_EXTENSIONS = ('.vert', '.frag', '.comp')
+SHADER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIRECTORY = os.path.join(SHADER_DIRECTORY, '.cache')
+
+def find_compiler():
+    # glslc is what compile.sh uses, glslangValidator ships with more distributions
+    glslc = shutil.which('glslc')
+    if glslc is not None:
+        return [glslc]
+
+    glslang = shutil.which('glslangValidator')
+    if glslang is not None:
+        return [glslang, '-V']
+
+    return None
+
+def read_outputs(directory = SHADER_DIRECTORY):
+    # compile.sh stays the one list of source -> output names
+    outputs = {}
+    with open(os.path.join(directory, 'compile.sh')) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 4 and parts[0] == 'glslc' and parts[2] == '-o':
+                outputs[os.path.join(directory, parts[1])] = os.path.join(directory, parts[3])
+
+    return outputs
+
+def get_cache_key(source, compiler):
+    with open(source, 'rb') as f:
+        code = f.read()
+
+    # The stage comes from the extension, so it is part of the key along with the compiler
+    digest = hashlib.sha256(code)
+    digest.update(os.path.splitext(source)[1].encode())
+    digest.update(' '.join(compiler).encode())
+    return digest.hexdigest()
+
+def compile_source(source, compiler, cache_directory = CACHE_DIRECTORY, debug = False):
+    key = get_cache_key(source, compiler)
+    cached = os.path.join(cache_directory, f"{key}.spv")
+    if os.path.exists(cached):
+        return cached
+
+    os.makedirs(cache_directory, exist_ok=True)
+
+    # Written beside the cache entry and renamed, so a half written file is never picked up
+    temporary = f"{cached}.{os.getpid()}.tmp"
+    result = subprocess.run(compiler + [source, '-o', temporary], capture_output=True, text=True)
+    if result.returncode != 0:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise Exception(f"Failed to compile {source}:\n{result.stdout}{result.stderr}")
+
+    os.replace(temporary, cached)
+
+    if debug:
+        print(f"Compiled {source} to {key[:12]}")
+
+    return cached
+
+def build_source(source, output, compiler, cache_directory = CACHE_DIRECTORY, debug = False):
+    cached = compile_source(source, compiler, cache_directory, debug)
+
+    with open(cached, 'rb') as f:
+        code = f.read()
+
+    # Leave an unchanged output alone, its modification time is what hot reload watches
+    if os.path.exists(output):
+        with open(output, 'rb') as f:
+            if f.read() == code:
+                return False
+
+    temporary = f"{output}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(code)
+    os.replace(temporary, output)
+
+    return True
+
+def build_all(directory = SHADER_DIRECTORY, debug = False):
+    compiler = find_compiler()
+    if compiler is None:
+        if debug:
+            print('No shader compiler found, using the SPIR-V already on disk')
+        return []
+
+    built = []
+    for (source, output) in read_outputs(directory).items():
+        if build_source(source, output, compiler, debug=debug):
+            built.append(output)
+
+    if debug:
+        print(f"Shader build updated {len(built)} outputs")
+
+    return built
+
+if __name__ == '__main__':
+    compiler = find_compiler()
+    if compiler is None:
+        sys.exit('Neither glslc nor glslangValidator is on the PATH')
+
+    for output in build_all(debug=True):
+        print(output)
@@ -0,0 +1,14 @@
+#version 450
+
+layout(location = 0) in vec2 inPosition;
+layout(location = 1) in vec3 inColor;
+
+layout(location = 2) in mat4 instanceTransform;
+layout(location = 6) in vec4 instanceColor;
+
+layout(location = 0) out vec3 fragColor;
+
+void main() {
+    gl_Position = instanceTransform * vec4(inPosition, 0.0, 1.0);
+    fragColor = inColor * instanceColor.rgb;
+}
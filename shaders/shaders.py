@@ -1,5 +1,75 @@
+from vulkan import *
+import hashlib
+import os
+import threading
+
 def read_shader_src(filename):
     with open(filename, 'rb') as f:
         code = f.read()
 
     return code
+
+def create_shader_module(device, filename):
+    code = read_shader_src(filename)
+
+    create_info = VkShaderModuleCreateInfo(
+        sType=VK_STRUCTURE_TYPE_SHADER_MODULE_CREATE_INFO,
+        codeSize=len(code),
+        pCode=code
+    )
+
+    return vkCreateShaderModule(device, create_info, None)
+
+class ShaderModuleCache:
+    def __init__(self, device, debug) -> None:
+        self.device = device
+        self.debug = debug
+
+        # Content hash -> module, so identical SPIR-V is only ever turned into one module
+        self.modules = {}
+        # Path -> (mtime, size, hash), a file is only read again once it changed on disk
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get_hash(self, filename):
+        stat = os.stat(filename)
+        known = self.files.get(filename)
+        if known is not None and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return (known[2], None)
+
+        code = read_shader_src(filename)
+        digest = hashlib.sha256(code).hexdigest()
+        self.files[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return (digest, code)
+
+    def get(self, filename):
+        # Modules are owned by the cache, pipelines built from them must not destroy them
+        with self.lock:
+            (digest, code) = self.get_hash(filename)
+
+            module = self.modules.get(digest)
+            if module is not None:
+                return module
+
+            if code is None:
+                code = read_shader_src(filename)
+
+            create_info = VkShaderModuleCreateInfo(
+                sType=VK_STRUCTURE_TYPE_SHADER_MODULE_CREATE_INFO,
+                codeSize=len(code),
+                pCode=code
+            )
+            module = vkCreateShaderModule(self.device, create_info, None)
+            self.modules[digest] = module
+
+            if self.debug:
+                print(f"Created shader module {digest[:12]} from {filename}")
+
+            return module
+
+    def destroy(self):
+        # Modules replaced by hot reload are kept until here, an editing session only makes so many
+        for module in self.modules.values():
+            vkDestroyShaderModule(self.device, module, None)
+        self.modules = {}
+        self.files = {}
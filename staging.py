@@ -0,0 +1,97 @@
+from vulkan import *
+
+def align_up(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+class StagingRing:
+    def __init__(self, allocator, size, debug) -> None:
+        self.allocator = allocator
+        self.size = size
+        self.debug = debug
+
+        (self.buffer, self.allocation) = allocator.create_buffer(
+            size,
+            VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
+            VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT
+        )
+        self.mapped = self.allocation.mapped
+
+        # Monotonic byte counters, their difference is what the GPU may still be reading
+        self.head = 0
+        self.tail = 0
+        self.allocated = 0
+        self.released = 0
+
+        # (head, allocated) recorded per frame slot when its commands are submitted
+        self.frame_marks = {}
+
+        if debug:
+            print(f"Created {size} byte staging ring")
+
+    def used(self):
+        return self.allocated - self.released
+
+    def allocate(self, size, alignment = 16):
+        if size > self.size:
+            raise Exception(f"Staging allocation of {size} bytes exceeds the {self.size} byte ring")
+
+        if self.used() == 0:
+            self.head = 0
+            self.tail = 0
+
+        start = align_up(self.head, alignment)
+
+        if self.head >= self.tail and self.used() < self.size:
+            if start + size <= self.size:
+                waste = start - self.head
+            elif size <= self.tail:
+                # Wrap around, the bytes left at the end are skipped until the tail passes them
+                waste = self.size - self.head
+                start = 0
+            else:
+                return None
+        elif self.head < self.tail and start + size <= self.tail:
+            waste = start - self.head
+        else:
+            return None
+
+        self.head = start + size
+        self.allocated += waste + size
+
+        return start
+
+    def write(self, data, alignment = 16):
+        view = memoryview(data).cast('B')
+        offset = self.allocate(view.nbytes, alignment)
+        if offset is None:
+            return None
+
+        self.mapped[offset:offset + view.nbytes] = view
+        return offset
+
+    def mark_frame(self, slot):
+        self.frame_marks[slot] = (self.head, self.allocated)
+
+    def retire_frame(self, slot):
+        mark = self.frame_marks.pop(slot, None)
+        if mark is None:
+            return
+
+        (head, allocated) = mark
+        if allocated > self.released:
+            self.tail = head
+            self.released = allocated
+
+    def retire_all(self):
+        for slot in list(self.frame_marks):
+            self.retire_frame(slot)
+
+    def reset(self):
+        # Only valid once the GPU has finished every copy out of the ring
+        self.frame_marks = {}
+        self.tail = self.head
+        self.released = self.allocated
+
+    def destroy(self):
+        self.mapped = None
+        self.allocator.destroy_buffer(self.buffer, self.allocation)
@@ -1,6 +1,6 @@
 from vulkan import *
-import queue_families
 import frame
+import image_view
 
 class SwapChainSupportDetails:
     def __init__(self) -> None:
@@ -14,9 +14,11 @@ class SwapChainBundle:
         self.frames = []
         self.format = None
         self.extent = None
+        # Whether images can be copied out for readback
+        self.readable = True
 
-def create_swapchain(instance, physicalDevice, logicalDevice, surface, width, height, debug):
-    support = query_swapchain_support(physicalDevice, instance, surface, debug)
+def create_swapchain(instance_dispatch, device_dispatch, device_capabilities, indices, logicalDevice, surface, width, height, debug, old_swapchain = None):
+    support = query_swapchain_support(device_capabilities, instance_dispatch, surface, debug)
     format = choose_swap_surface_format(support.formats, debug)
     present_mode = choose_swap_present_mode(support.present_modes, debug)
     extent = choose_swap_extent(width, height, support.capabilities, debug)
@@ -24,8 +26,6 @@ def create_swapchain(instance, physicalDevice, logicalDevice, surface, width, he
     if support.capabilities.maxImageCount > 0 and image_count > support.capabilities.maxImageCount:
         image_count = support.capabilities.maxImageCount
 
-    indices = queue_families.find_queue_families(physicalDevice, instance, surface, debug)
-
     if indices.graphics_queue_family != indices.present_queue_family:
         imageSharingMode = VK_SHARING_MODE_CONCURRENT
         queueFamilyIndexCount = 2
@@ -35,6 +35,12 @@ def create_swapchain(instance, physicalDevice, logicalDevice, surface, width, he
         queueFamilyIndexCount = 0
         queueFamilyIndices = None
 
+    # Readback copies straight out of the swapchain image when the surface allows it
+    image_usage = VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT
+    readable = bool(support.capabilities.supportedUsageFlags & VK_IMAGE_USAGE_TRANSFER_SRC_BIT)
+    if readable:
+        image_usage |= VK_IMAGE_USAGE_TRANSFER_SRC_BIT
+
     create_info = VkSwapchainCreateInfoKHR(
         surface=surface,
         minImageCount=image_count,
@@ -42,7 +48,7 @@ def create_swapchain(instance, physicalDevice, logicalDevice, surface, width, he
         imageColorSpace=format.colorSpace,
         imageExtent=extent,
         imageArrayLayers=1,
-        imageUsage=VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT,
+        imageUsage=image_usage,
         imageSharingMode=imageSharingMode,
         queueFamilyIndexCount=queueFamilyIndexCount,
         pQueueFamilyIndices=queueFamilyIndices,
@@ -50,60 +56,35 @@ def create_swapchain(instance, physicalDevice, logicalDevice, surface, width, he
         compositeAlpha=VK_COMPOSITE_ALPHA_OPAQUE_BIT_KHR,
         presentMode=present_mode,
         clipped=VK_TRUE,
-        oldSwapchain=None
+        oldSwapchain=old_swapchain
     )
 
     bundle = SwapChainBundle()
 
-    vkSwapchainKHR = vkGetDeviceProcAddr(logicalDevice, "vkCreateSwapchainKHR")
-    bundle.swapchain = vkSwapchainKHR(logicalDevice, create_info, None)
-    vkGetSwapchainImagesKHR = vkGetDeviceProcAddr(logicalDevice, "vkGetSwapchainImagesKHR")
-    
-    images = vkGetSwapchainImagesKHR(logicalDevice, bundle.swapchain)
-    for image in images:
-        components = VkComponentMapping(
-            r=VK_COMPONENT_SWIZZLE_IDENTITY,
-            g=VK_COMPONENT_SWIZZLE_IDENTITY,
-            b=VK_COMPONENT_SWIZZLE_IDENTITY,
-            a=VK_COMPONENT_SWIZZLE_IDENTITY
-        )
-
-        subresourceRange = VkImageSubresourceRange(
-            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
-            baseMipLevel=0,
-            levelCount=1,
-            baseArrayLayer=0,
-            layerCount=1
-        )
-
-        create_info = VkImageViewCreateInfo(
-            image=image,
-            viewType=VK_IMAGE_VIEW_TYPE_2D,
-            format=format.format,
-            components=components,
-            subresourceRange=subresourceRange
-        )
+    bundle.swapchain = device_dispatch.vkCreateSwapchainKHR(logicalDevice, create_info, None)
 
+    images = device_dispatch.vkGetSwapchainImagesKHR(logicalDevice, bundle.swapchain)
+    for image in images:
         swapchain_frame = frame.SwapchainFrame()
         swapchain_frame.image = image
-        swapchain_frame.image_view = vkCreateImageView(logicalDevice, create_info, None)
+        swapchain_frame.image_view = image_view.make_image_view(logicalDevice, image, format.format)
         bundle.frames.append(swapchain_frame)
 
     bundle.format = format.format
     bundle.extent = extent
+    bundle.readable = readable
 
     return bundle
 
-def query_swapchain_support(physicalDevice, instance, surface, debug):
+def query_swapchain_support(device_capabilities, instance_dispatch, surface, debug):
     details = SwapChainSupportDetails()
 
-    getCapabilities = vkGetInstanceProcAddr(instance, "vkGetPhysicalDeviceSurfaceCapabilitiesKHR")
-    getFormats = vkGetInstanceProcAddr(instance, "vkGetPhysicalDeviceSurfaceFormatsKHR")
-    getPresentModes = vkGetInstanceProcAddr(instance, "vkGetPhysicalDeviceSurfacePresentModesKHR")
+    # Formats and present modes do not change, but the current extent follows the window
+    getCapabilities = instance_dispatch.vkGetPhysicalDeviceSurfaceCapabilitiesKHR
 
-    details.capabilities = getCapabilities(physicalDevice, surface)
-    details.formats = getFormats(physicalDevice, surface)
-    details.present_modes = getPresentModes(physicalDevice, surface)
+    details.capabilities = getCapabilities(device_capabilities.physical_device, surface)
+    details.formats = device_capabilities.surface_formats
+    details.present_modes = device_capabilities.present_modes
 
     if debug:
         print("Swap chain support details:")
@@ -135,6 +116,13 @@ def choose_swap_present_mode(modes, debug):
     return VK_PRESENT_MODE_FIFO_KHR
 
 def choose_swap_extent(width, height, capabilities, debug):
+    # The surface dictates the extent unless it reports the special value 0xFFFFFFFF
+    if capabilities.currentExtent.width != 0xFFFFFFFF:
+        if debug:
+            print(f"Chosen extent: {capabilities.currentExtent.width}x{capabilities.currentExtent.height}")
+
+        return VkExtent2D(width=capabilities.currentExtent.width, height=capabilities.currentExtent.height)
+
     extent = VkExtent2D(width=width, height=height)
 
     extent.width = min(max(capabilities.minImageExtent.width, width), capabilities.maxImageExtent.width)
@@ -0,0 +1,26 @@
+from vulkan import *
+
+def make_semaphore(device, debug):
+    semaphore_info = VkSemaphoreCreateInfo(
+        sType=VK_STRUCTURE_TYPE_SEMAPHORE_CREATE_INFO
+    )
+
+    try:
+        return vkCreateSemaphore(device, semaphore_info, None)
+    except VkError as e:
+        if debug:
+            print('Failed to create semaphore')
+        raise e
+
+def make_fence(device, debug, signaled = True):
+    fence_info = VkFenceCreateInfo(
+        sType=VK_STRUCTURE_TYPE_FENCE_CREATE_INFO,
+        flags=VK_FENCE_CREATE_SIGNALED_BIT if signaled else 0
+    )
+
+    try:
+        return vkCreateFence(device, fence_info, None)
+    except VkError as e:
+        if debug:
+            print('Failed to create fence')
+        raise e
@@ -0,0 +1,616 @@
+from vulkan import *
+import concurrent.futures
+import multiprocessing
+import numpy as np
+import commands
+import image_decode
+import image_view
+import staging
+import sync
+
+TEXTURE_USAGE = VK_IMAGE_USAGE_TRANSFER_SRC_BIT | VK_IMAGE_USAGE_TRANSFER_DST_BIT | VK_IMAGE_USAGE_SAMPLED_BIT
+BLIT_FEATURES = VK_FORMAT_FEATURE_BLIT_SRC_BIT | VK_FORMAT_FEATURE_BLIT_DST_BIT | VK_FORMAT_FEATURE_SAMPLED_IMAGE_FILTER_LINEAR_BIT
+
+# Share of the reported budget textures may fill, the rest is headroom for everything else
+BUDGET_FRACTION = 0.9
+# Updates between budget queries, the query goes down to the driver
+BUDGET_INTERVAL = 30
+# Textures not touched for this many updates are not streamed back in after an eviction
+IDLE_FRAMES = 120
+# Full images being filled at once, each holds memory for its whole chain until it is done
+MAX_PROMOTIONS = 2
+
+def query_memory_budget(physical_device, get_memory_properties2):
+    # Needs VK_EXT_memory_budget on the device, summed over the device local heaps
+    budget = ffi.new('VkPhysicalDeviceMemoryBudgetPropertiesEXT*', {'sType': VK_STRUCTURE_TYPE_PHYSICAL_DEVICE_MEMORY_BUDGET_PROPERTIES_EXT})
+    properties2 = ffi.new('VkPhysicalDeviceMemoryProperties2*', {'sType': VK_STRUCTURE_TYPE_PHYSICAL_DEVICE_MEMORY_PROPERTIES_2, 'pNext': budget})
+    get_memory_properties2(physical_device, properties2)
+
+    memory_properties = properties2.memoryProperties
+    heaps = [i for i in range(memory_properties.memoryHeapCount) if memory_properties.memoryHeaps[i].flags & VK_MEMORY_HEAP_DEVICE_LOCAL_BIT]
+
+    return (sum(budget.heapBudget[i] for i in heaps), sum(budget.heapUsage[i] for i in heaps))
+
+def subresource_range(base_level, level_count):
+    return VkImageSubresourceRange(
+        aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+        baseMipLevel=base_level,
+        levelCount=level_count,
+        baseArrayLayer=0,
+        layerCount=1
+    )
+
+def subresource_layers(level):
+    return VkImageSubresourceLayers(
+        aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+        mipLevel=level,
+        baseArrayLayer=0,
+        layerCount=1
+    )
+
+def image_barrier(image, old_layout, new_layout, src_access, dst_access, base_level, level_count):
+    return VkImageMemoryBarrier(
+        sType=VK_STRUCTURE_TYPE_IMAGE_MEMORY_BARRIER,
+        srcAccessMask=src_access,
+        dstAccessMask=dst_access,
+        oldLayout=old_layout,
+        newLayout=new_layout,
+        srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+        dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+        image=image,
+        subresourceRange=subresource_range(base_level, level_count)
+    )
+
+def record_barriers(command_buffer, src_stage, dst_stage, barriers):
+    vkCmdPipelineBarrier(command_buffer, src_stage, dst_stage, 0, 0, None, 0, None, len(barriers), barriers)
+
+def record_mip_chain(command_buffer, image, width, height, level_count):
+    # Level 0 holds the uploaded pixels in TRANSFER_DST_OPTIMAL, each level is blitted from the one above
+    for level in range(1, level_count):
+        record_barriers(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, [image_barrier(
+            image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+            VK_ACCESS_TRANSFER_WRITE_BIT, VK_ACCESS_TRANSFER_READ_BIT, level - 1, 1
+        )])
+
+        (src_width, src_height) = image_decode.mip_extent(width, height, level - 1)
+        (dst_width, dst_height) = image_decode.mip_extent(width, height, level)
+        blit = VkImageBlit(
+            srcSubresource=subresource_layers(level - 1),
+            srcOffsets=[VkOffset3D(x=0, y=0, z=0), VkOffset3D(x=src_width, y=src_height, z=1)],
+            dstSubresource=subresource_layers(level),
+            dstOffsets=[VkOffset3D(x=0, y=0, z=0), VkOffset3D(x=dst_width, y=dst_height, z=1)]
+        )
+        vkCmdBlitImage(
+            command_buffer, image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+            1, [blit], VK_FILTER_LINEAR
+        )
+
+    # Bring the last level in line with the others, then hand the whole chain to the shaders
+    record_barriers(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, [image_barrier(
+        image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+        VK_ACCESS_TRANSFER_WRITE_BIT, VK_ACCESS_TRANSFER_READ_BIT, level_count - 1, 1
+    )])
+    record_barriers(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT, [image_barrier(
+        image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL,
+        VK_ACCESS_TRANSFER_READ_BIT, VK_ACCESS_SHADER_READ_BIT, 0, level_count
+    )])
+
+def make_sampler(device):
+    sampler_info = VkSamplerCreateInfo(
+        sType=VK_STRUCTURE_TYPE_SAMPLER_CREATE_INFO,
+        magFilter=VK_FILTER_LINEAR,
+        minFilter=VK_FILTER_LINEAR,
+        mipmapMode=VK_SAMPLER_MIPMAP_MODE_LINEAR,
+        addressModeU=VK_SAMPLER_ADDRESS_MODE_REPEAT,
+        addressModeV=VK_SAMPLER_ADDRESS_MODE_REPEAT,
+        addressModeW=VK_SAMPLER_ADDRESS_MODE_REPEAT,
+        anisotropyEnable=VK_FALSE,
+        compareEnable=VK_FALSE,
+        minLod=0.0,
+        # Views only cover the resident levels, so the sampler never has to clamp
+        maxLod=VK_LOD_CLAMP_NONE,
+        borderColor=VK_BORDER_COLOR_INT_OPAQUE_BLACK,
+        unnormalizedCoordinates=VK_FALSE
+    )
+
+    return vkCreateSampler(device, sampler_info, None)
+
+class Texture:
+    def __init__(self, path, format) -> None:
+        self.path = path
+        self.format = format
+        self.width = 0
+        self.height = 0
+        self.mip_count = 0
+
+        # Level of the full chain held in level 0 of the image, None until the tail is in
+        self.base = None
+        self.image = None
+        self.allocation = None
+        self.view = None
+
+        # Decoded data, dropped once it has been uploaded
+        self.future = None
+        self.pixels = None
+        self.tail_level = 0
+        self.tail = None
+
+        self.upload = None
+        self.last_used = 0
+        # The default texture is never evicted
+        self.pinned = False
+        self.failed = False
+
+    def is_complete(self):
+        return self.base == 0
+
+    def get_bytes(self):
+        return self.allocation.size if self.allocation is not None else 0
+
+    def get_full_bytes(self):
+        # The whole chain, a third on top of level 0
+        return self.width * self.height * 4 * 4 // 3
+
+class TextureUpload:
+    def __init__(self, texture, base, pixels, image, allocation, level_count) -> None:
+        self.texture = texture
+        self.base = base
+        self.pixels = pixels
+        self.image = image
+        self.allocation = allocation
+        self.level_count = level_count
+        # Rows of level 0 copied so far, a large image takes several updates
+        self.rows_done = 0
+        self.started = False
+
+class UploadBatch:
+    def __init__(self, batch_id, command_buffer, fence) -> None:
+        self.batch_id = batch_id
+        self.command_buffer = command_buffer
+        self.fence = fence
+
+class TextureManager:
+    def __init__(self, device_capabilities, get_memory_properties2, allocator, device, queue_family_index, queue, frame_count, debug,
+                 budget = None, ring_size = 16 * 1024 * 1024, upload_bytes_per_frame = 4 * 1024 * 1024, decode_workers = 2,
+                 tail_size = image_decode.TAIL_SIZE, on_destroy_view = None) -> None:
+        self.capabilities = device_capabilities
+        # None without VK_EXT_memory_budget, the budget is then a share of the device local heaps
+        self.get_memory_properties2 = get_memory_properties2
+        self.allocator = allocator
+        self.device = device
+        self.queue = queue
+        self.frame_count = frame_count
+        self.debug = debug
+        self.budget_limit = budget
+        self.upload_bytes_per_frame = upload_bytes_per_frame
+        self.decode_workers = decode_workers
+        self.tail_size = tail_size
+        # Called with each view before it is destroyed, so descriptor sets using it can be dropped
+        self.on_destroy_view = on_destroy_view
+
+        for format in (VK_FORMAT_R8G8B8A8_SRGB, VK_FORMAT_R8G8B8A8_UNORM):
+            features = vkGetPhysicalDeviceFormatProperties(device_capabilities.physical_device, format).optimalTilingFeatures
+            if features & BLIT_FEATURES != BLIT_FEATURES:
+                raise Exception(f"Format {format} cannot be blitted with linear filtering, mips cannot be generated")
+
+        # Blits need a graphics queue, uploads share it and land in submission order before the frames using them
+        self.ring = staging.StagingRing(allocator, ring_size, debug)
+        self.command_pool = commands.make_command_pool(device, queue_family_index, debug)
+        self.sampler = make_sampler(device)
+
+        # Started on the first load, spawned so workers do not inherit the Vulkan state
+        self.executor = None
+
+        self.textures = []
+        self.uploads = []
+        self.batches = []
+        self.batch = None
+        self.next_batch_id = 0
+        # (update, image, allocation, view) waiting for the frames that may still sample them
+        self.retired = []
+
+        self.frame = 0
+        self.budget = 0
+        self.evictions = 0
+        # Bumped whenever a view changes, so recorded frames are not reused with a stale one
+        self.version = 0
+
+        self.refresh_budget()
+
+        self.default = self.from_pixels(np.full((1, 1, 4), 255, dtype=np.uint8), srgb=False)
+        self.default.pinned = True
+        self.update()
+
+        if debug:
+            print(f"Streaming textures within a budget of {self.budget} bytes")
+
+    def get_format(self, srgb):
+        return VK_FORMAT_R8G8B8A8_SRGB if srgb else VK_FORMAT_R8G8B8A8_UNORM
+
+    def load(self, path, srgb = True):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.decode_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+
+        texture = Texture(path, self.get_format(srgb))
+        texture.last_used = self.frame
+        texture.future = self.executor.submit(image_decode.decode, path, self.tail_size)
+        self.textures.append(texture)
+
+        return texture
+
+    def from_pixels(self, pixels, srgb = True):
+        texture = Texture(None, self.get_format(srgb))
+        texture.last_used = self.frame
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        self.set_pixels(texture, pixels, *image_decode.make_tail(pixels, self.tail_size))
+        self.textures.append(texture)
+
+        return texture
+
+    def set_pixels(self, texture, pixels, tail_level, tail):
+        texture.height = pixels.shape[0]
+        texture.width = pixels.shape[1]
+        texture.mip_count = image_decode.mip_count(texture.width, texture.height)
+        texture.pixels = pixels
+        texture.tail_level = tail_level
+        # Only needed for the first upload, a texture that already has an image streams its full chain
+        texture.tail = tail if texture.base is None else None
+
+    def touch(self, texture):
+        texture.last_used = self.frame
+
+    def get_view(self, texture):
+        # Sampled as plain white until its tail has been uploaded
+        return texture.view if texture.view is not None else self.default.view
+
+    def release(self, texture):
+        self.textures.remove(texture)
+        if texture.future is not None:
+            texture.future.cancel()
+
+        if texture.upload is not None:
+            self.uploads.remove(texture.upload)
+            self.retire(texture.upload.image, texture.upload.allocation, None)
+            texture.upload = None
+
+        if texture.image is not None:
+            self.retire(texture.image, texture.allocation, texture.view)
+            texture.image = None
+            texture.allocation = None
+            texture.view = None
+            self.version += 1
+
+    def retire(self, image, allocation, view):
+        self.retired.append((self.frame, image, allocation, view))
+
+    def get_resident_bytes(self):
+        return sum(texture.get_bytes() for texture in self.textures) + sum(upload.allocation.size for upload in self.uploads)
+
+    def refresh_budget(self):
+        if self.get_memory_properties2 is not None:
+            (budget, usage) = query_memory_budget(self.capabilities.physical_device, self.get_memory_properties2)
+            # What other allocations in this and other processes leave over for textures
+            target = int((budget - usage + self.get_resident_bytes()) * BUDGET_FRACTION)
+        else:
+            memory_properties = self.capabilities.memory_properties
+            target = sum(
+                memory_properties.memoryHeaps[i].size for i in range(memory_properties.memoryHeapCount)
+                if memory_properties.memoryHeaps[i].flags & VK_MEMORY_HEAP_DEVICE_LOCAL_BIT
+            ) // 2
+
+        self.budget = target if self.budget_limit is None else min(self.budget_limit, target)
+
+    def get_command_buffer(self):
+        if self.batch is None:
+            command_buffer = commands.make_command_buffers(self.device, self.command_pool, 1, False)[0]
+            begin_info = VkCommandBufferBeginInfo(
+                sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+                flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+            )
+            vkBeginCommandBuffer(command_buffer, begin_info)
+
+            self.batch = UploadBatch(self.next_batch_id, command_buffer, sync.make_fence(self.device, self.debug, signaled=False))
+            self.next_batch_id += 1
+
+        return self.batch.command_buffer
+
+    def submit(self):
+        batch = self.batch
+        self.batch = None
+        vkEndCommandBuffer(batch.command_buffer)
+
+        submit_info = VkSubmitInfo(
+            sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+            commandBufferCount=1,
+            pCommandBuffers=[batch.command_buffer]
+        )
+        vkQueueSubmit(self.queue, 1, [submit_info], batch.fence)
+        self.ring.mark_frame(batch.batch_id)
+        self.batches.append(batch)
+
+    def poll_batches(self):
+        # In submission order, the ring can only be released front to back
+        while self.batches:
+            batch = self.batches[0]
+            try:
+                vkGetFenceStatus(self.device, batch.fence)
+            except VkNotReady:
+                return
+
+            self.ring.retire_frame(batch.batch_id)
+            self.destroy_batch(batch)
+            self.batches.pop(0)
+
+    def destroy_batch(self, batch):
+        vkFreeCommandBuffers(self.device, self.command_pool, 1, [batch.command_buffer])
+        vkDestroyFence(self.device, batch.fence, None)
+
+    def destroy_retired(self, everything = False):
+        # The engine calls update after waiting on the oldest frame slot, older updates' frames are done
+        remaining = []
+        for (frame, image, allocation, view) in self.retired:
+            if not everything and frame > self.frame - self.frame_count:
+                remaining.append((frame, image, allocation, view))
+                continue
+
+            if view is not None:
+                if self.on_destroy_view is not None:
+                    self.on_destroy_view(view)
+                vkDestroyImageView(self.device, view, None)
+            self.allocator.destroy_image(image, allocation)
+        self.retired = remaining
+
+    def collect_decodes(self):
+        for texture in self.textures:
+            if texture.future is None or not texture.future.done():
+                continue
+
+            future = texture.future
+            texture.future = None
+            try:
+                self.set_pixels(texture, *future.result())
+            except Exception as e:
+                # Left on the default texture, or on whatever mips it already has
+                print(f"Failed to decode {texture.path}: {e}")
+                texture.failed = True
+
+    def install(self, texture, image, allocation, base, level_count):
+        if texture.image is not None:
+            self.retire(texture.image, texture.allocation, texture.view)
+
+        texture.image = image
+        texture.allocation = allocation
+        texture.view = image_view.make_image_view(self.device, image, texture.format, level_count)
+        texture.base = base
+        self.version += 1
+
+    def start_upload(self, texture, base, pixels):
+        (width, height) = image_decode.mip_extent(texture.width, texture.height, base)
+        level_count = texture.mip_count - base
+        (image, allocation) = self.allocator.create_image(
+            width, height, texture.format, TEXTURE_USAGE, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT, mip_levels=level_count
+        )
+
+        texture.upload = TextureUpload(texture, base, pixels, image, allocation, level_count)
+        self.uploads.append(texture.upload)
+
+    def continue_upload(self, upload, byte_budget):
+        command_buffer = self.get_command_buffer()
+        if not upload.started:
+            record_barriers(command_buffer, VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, [image_barrier(
+                upload.image, VK_IMAGE_LAYOUT_UNDEFINED, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+                0, VK_ACCESS_TRANSFER_WRITE_BIT, 0, upload.level_count
+            )])
+            upload.started = True
+
+        (height, width) = upload.pixels.shape[:2]
+        row_bytes = width * 4
+        used = 0
+
+        # Level 0 goes up in bands of rows, as many as this update's share of bytes and the ring allow
+        while upload.rows_done < height and used < byte_budget:
+            rows = min(height - upload.rows_done, max(1, (byte_budget - used) // row_bytes), max(1, self.ring.size // 2 // row_bytes))
+            offset = self.ring.write(upload.pixels[upload.rows_done:upload.rows_done + rows])
+            if offset is None:
+                break
+
+            region = VkBufferImageCopy(
+                bufferOffset=offset,
+                bufferRowLength=0,
+                bufferImageHeight=0,
+                imageSubresource=subresource_layers(0),
+                imageOffset=VkOffset3D(x=0, y=upload.rows_done, z=0),
+                imageExtent=VkExtent3D(width=width, height=rows, depth=1)
+            )
+            vkCmdCopyBufferToImage(command_buffer, self.ring.buffer, upload.image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, 1, [region])
+
+            upload.rows_done += rows
+            used += rows * row_bytes
+
+        if upload.rows_done == height:
+            record_mip_chain(command_buffer, upload.image, width, height, upload.level_count)
+
+            # Frames recorded from now on sample the new image, the copies ahead of them in the queue fill it
+            texture = upload.texture
+            self.install(texture, upload.image, upload.allocation, upload.base, upload.level_count)
+            texture.upload = None
+            self.uploads.remove(upload)
+            if upload.base == 0:
+                texture.pixels = None
+
+        return used
+
+    def demote(self, texture):
+        # Drops the top level by copying the rest into a smaller image, memory cannot be freed from inside one
+        base = texture.base + 1
+        (width, height) = image_decode.mip_extent(texture.width, texture.height, base)
+        level_count = texture.mip_count - base
+        (image, allocation) = self.allocator.create_image(
+            width, height, texture.format, TEXTURE_USAGE, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT, mip_levels=level_count
+        )
+
+        command_buffer = self.get_command_buffer()
+        record_barriers(command_buffer, VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, [
+            image_barrier(
+                texture.image, VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+                VK_ACCESS_SHADER_READ_BIT, VK_ACCESS_TRANSFER_READ_BIT, 1, level_count
+            ),
+            image_barrier(
+                image, VK_IMAGE_LAYOUT_UNDEFINED, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+                0, VK_ACCESS_TRANSFER_WRITE_BIT, 0, level_count
+            )
+        ])
+
+        regions = []
+        for level in range(level_count):
+            (level_width, level_height) = image_decode.mip_extent(width, height, level)
+            regions.append(VkImageCopy(
+                srcSubresource=subresource_layers(level + 1),
+                srcOffset=VkOffset3D(x=0, y=0, z=0),
+                dstSubresource=subresource_layers(level),
+                dstOffset=VkOffset3D(x=0, y=0, z=0),
+                extent=VkExtent3D(width=level_width, height=level_height, depth=1)
+            ))
+        vkCmdCopyImage(
+            command_buffer, texture.image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+            len(regions), regions
+        )
+
+        record_barriers(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT, [image_barrier(
+            image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL,
+            VK_ACCESS_TRANSFER_WRITE_BIT, VK_ACCESS_SHADER_READ_BIT, 0, level_count
+        )])
+
+        self.install(texture, image, allocation, base, level_count)
+        self.evictions += 1
+
+    def evict(self):
+        over = self.get_resident_bytes() - self.budget
+        if over <= 0:
+            return
+
+        # Least recently used first, one level each, never below the tail or anything drawn last frame
+        candidates = [
+            texture for texture in self.textures
+            if not texture.pinned and texture.upload is None and texture.base is not None
+            and texture.base < texture.tail_level and texture.last_used < self.frame - 1
+        ]
+        candidates.sort(key=lambda texture: texture.last_used)
+
+        for texture in candidates:
+            if over <= 0:
+                return
+
+            # Each level is about three quarters of what is left of the chain
+            over -= texture.get_bytes() * 3 // 4
+            self.demote(texture)
+
+    def schedule(self):
+        byte_budget = self.upload_bytes_per_frame
+
+        # Tails first, every texture shows something before any of them gets its full chain
+        for texture in self.textures:
+            if texture.tail is not None and texture.upload is None:
+                self.start_upload(texture, texture.tail_level, texture.tail)
+                texture.tail = None
+
+        for upload in sorted(self.uploads, key=lambda upload: -upload.base):
+            if byte_budget <= 0:
+                break
+            byte_budget -= self.continue_upload(upload, byte_budget)
+
+        # Most recently used first, only as far as the budget goes without evicting anything.
+        # Decoded ones go ahead of ones still to decode, so their pixels are not dropped and fetched again
+        candidates = [
+            texture for texture in self.textures
+            if texture.base is not None and texture.base > 0 and texture.upload is None
+            and not texture.failed and self.frame - texture.last_used <= IDLE_FRAMES
+        ]
+        candidates.sort(key=lambda texture: (texture.pixels is None, -texture.last_used))
+
+        # Decodes in flight for a promotion are already spoken for, in memory and in promotions
+        decoding = [texture for texture in self.textures if texture.future is not None and texture.base is not None]
+        decoding_bytes = sum(texture.get_full_bytes() for texture in decoding)
+        promotions = len(self.uploads) + len(decoding)
+
+        for texture in candidates:
+            if promotions >= MAX_PROMOTIONS:
+                break
+            if texture.future is not None:
+                continue
+
+            # Checked before decoding, so a texture that does not fit is not decoded every frame
+            full_bytes = texture.get_full_bytes()
+            if self.get_resident_bytes() + decoding_bytes + full_bytes > self.budget:
+                break
+
+            if texture.pixels is None:
+                # Dropped earlier and wanted again, the file is decoded once more
+                if texture.path is not None:
+                    texture.future = self.executor.submit(image_decode.decode, texture.path, self.tail_size)
+                    decoding_bytes += full_bytes
+                    promotions += 1
+                continue
+
+            self.start_upload(texture, 0, texture.pixels)
+            promotions += 1
+
+        # Promotion is deferred for the rest, their full images are not held in memory meanwhile.
+        # Textures made from pixels have no file to decode again and keep theirs
+        for texture in self.textures:
+            if texture.pixels is not None and texture.path is not None and texture.upload is None and texture.tail is None:
+                texture.pixels = None
+
+    def update(self):
+        # Once per frame, after the engine has waited on the frame slot it is about to reuse
+        self.frame += 1
+        self.poll_batches()
+        self.destroy_retired()
+        self.collect_decodes()
+
+        if self.frame % BUDGET_INTERVAL == 0:
+            self.refresh_budget()
+
+        self.evict()
+        self.schedule()
+
+        if self.batch is not None:
+            self.submit()
+
+    def get_statistics(self):
+        return {
+            'textures': len(self.textures),
+            'complete': sum(1 for texture in self.textures if texture.is_complete()),
+            'decoding': sum(1 for texture in self.textures if texture.future is not None),
+            'uploading': len(self.uploads),
+            'resident_bytes': self.get_resident_bytes(),
+            'budget': self.budget,
+            'evictions': self.evictions
+        }
+
+    def destroy(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+        # Only once the device is idle, every batch and frame using these is done
+        if self.batch is not None:
+            self.submit()
+        vkQueueWaitIdle(self.queue)
+        for batch in self.batches:
+            self.destroy_batch(batch)
+        self.batches = []
+
+        for upload in self.uploads:
+            self.retire(upload.image, upload.allocation, None)
+        for texture in self.textures:
+            if texture.image is not None:
+                self.retire(texture.image, texture.allocation, texture.view)
+        self.uploads = []
+        self.textures = []
+        self.destroy_retired(everything=True)
+
+        vkDestroySampler(self.device, self.sampler, None)
+        vkDestroyCommandPool(self.device, self.command_pool, None)
+        self.ring.destroy()
@@ -0,0 +1,239 @@
+from vulkan import *
+import commands
+import geometry
+import staging
+import sync
+
+class UploadBatch:
+    def __init__(self, batch_id) -> None:
+        self.batch_id = batch_id
+        self.command_buffer = None
+        self.fence = None
+        self.semaphore = None
+        self.meshes = []
+        self.buffers = []
+        self.transfer_done = False
+        self.acquired_by = None
+
+class AsyncUploader:
+    def __init__(self, allocator, device, transfer_family, transfer_queue, graphics_family, ring_size, debug) -> None:
+        self.allocator = allocator
+        self.device = device
+        self.transfer_family = transfer_family
+        self.transfer_queue = transfer_queue
+        self.graphics_family = graphics_family
+        self.debug = debug
+
+        self.ring = staging.StagingRing(allocator, ring_size, debug)
+        self.command_pool = commands.make_command_pool(device, transfer_family, debug)
+
+        self.pending = []
+        self.pending_meshes = []
+        self.pending_buffers = []
+        self.next_batch_id = 0
+
+        # Submitted on the transfer queue but not yet taken over by a graphics frame
+        self.in_transit = []
+        # Taken over by a graphics frame, kept until that frame's fence has signaled
+        self.acquired = []
+
+        if debug:
+            print(f"Streaming uploads on transfer queue family {transfer_family}")
+
+    def stage(self, data, dst_buffer):
+        view = geometry.as_bytes(data)
+        written = 0
+
+        while written < view.nbytes:
+            chunk = view[written:written + self.ring.size // 2]
+            offset = self.ring.write(chunk)
+
+            while offset is None:
+                self.make_room()
+                offset = self.ring.write(chunk)
+
+            self.pending.append(geometry.PendingCopy(offset, dst_buffer, written, chunk.nbytes))
+            written += chunk.nbytes
+
+    def make_room(self):
+        if self.pending:
+            self.submit()
+
+        # Block on the oldest transfer still reading from the ring
+        for batch in self.in_transit + self.acquired:
+            if not batch.transfer_done:
+                vkWaitForFences(self.device, 1, [batch.fence], VK_TRUE, UINT64_MAX)
+                self.poll()
+                return
+
+        raise Exception('Staging ring has no room and no transfer to wait on')
+
+    def upload_mesh(self, vertices, indices = None):
+        mesh = geometry.Mesh()
+
+        vertex_bytes = geometry.as_bytes(vertices)
+        mesh.vertex_count = vertex_bytes.nbytes // geometry.VERTEX_STRIDE
+        (mesh.vertex_buffer, mesh.vertex_allocation) = self.allocator.create_buffer(
+            vertex_bytes.nbytes,
+            VK_BUFFER_USAGE_VERTEX_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+            VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+        )
+        self.stage(vertex_bytes, mesh.vertex_buffer)
+        self.pending_buffers.append(mesh.vertex_buffer)
+
+        if indices is not None:
+            index_bytes = geometry.as_bytes(indices)
+            mesh.index_type = geometry.get_index_type(indices)
+            mesh.index_count = index_bytes.nbytes // memoryview(indices).itemsize
+            (mesh.index_buffer, mesh.index_allocation) = self.allocator.create_buffer(
+                index_bytes.nbytes,
+                VK_BUFFER_USAGE_INDEX_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+                VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            )
+            self.stage(index_bytes, mesh.index_buffer)
+            self.pending_buffers.append(mesh.index_buffer)
+
+        self.pending_meshes.append(mesh)
+
+        return mesh
+
+    def ownership_barriers(self, buffers, src_access, dst_access):
+        return [
+            VkBufferMemoryBarrier(
+                sType=VK_STRUCTURE_TYPE_BUFFER_MEMORY_BARRIER,
+                srcAccessMask=src_access,
+                dstAccessMask=dst_access,
+                srcQueueFamilyIndex=self.transfer_family,
+                dstQueueFamilyIndex=self.graphics_family,
+                buffer=buffer,
+                offset=0,
+                size=VK_WHOLE_SIZE
+            )
+            for buffer in buffers
+        ]
+
+    def submit(self):
+        if not self.pending:
+            return
+
+        batch = UploadBatch(self.next_batch_id)
+        self.next_batch_id += 1
+
+        batch.command_buffer = commands.make_command_buffers(self.device, self.command_pool, 1, False)[0]
+        batch.fence = sync.make_fence(self.device, self.debug, signaled=False)
+        batch.semaphore = sync.make_semaphore(self.device, self.debug)
+
+        begin_info = VkCommandBufferBeginInfo(
+            sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+            flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+        )
+        vkBeginCommandBuffer(batch.command_buffer, begin_info)
+
+        regions = {}
+        for copy in self.pending:
+            regions.setdefault(copy.dst_buffer, []).append(VkBufferCopy(
+                srcOffset=copy.src_offset,
+                dstOffset=copy.dst_offset,
+                size=copy.size
+            ))
+
+        for (dst_buffer, buffer_regions) in regions.items():
+            vkCmdCopyBuffer(batch.command_buffer, self.ring.buffer, dst_buffer, len(buffer_regions), buffer_regions)
+
+        # Release half of the queue family ownership transfer, the graphics frame acquires
+        barriers = self.ownership_barriers(self.pending_buffers, VK_ACCESS_TRANSFER_WRITE_BIT, 0)
+        vkCmdPipelineBarrier(
+            batch.command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT,
+            0, 0, None, len(barriers), barriers, 0, None
+        )
+
+        vkEndCommandBuffer(batch.command_buffer)
+
+        submit_info = VkSubmitInfo(
+            sType=VK_STRUCTURE_TYPE_SUBMIT_INFO,
+            commandBufferCount=1,
+            pCommandBuffers=[batch.command_buffer],
+            signalSemaphoreCount=1,
+            pSignalSemaphores=[batch.semaphore]
+        )
+
+        vkQueueSubmit(self.transfer_queue, 1, [submit_info], batch.fence)
+        self.ring.mark_frame(batch.batch_id)
+
+        batch.meshes = self.pending_meshes
+        batch.buffers = self.pending_buffers
+        self.in_transit.append(batch)
+
+        if self.debug:
+            print(f"Submitted upload batch {batch.batch_id} with {len(self.pending)} copies")
+
+        self.pending = []
+        self.pending_meshes = []
+        self.pending_buffers = []
+
+    def acquire(self, command_buffer, slot):
+        if not self.in_transit:
+            return ([], [])
+
+        buffers = []
+        semaphores = []
+        meshes = []
+        for batch in self.in_transit:
+            buffers += batch.buffers
+            semaphores.append(batch.semaphore)
+            meshes += batch.meshes
+            batch.acquired_by = slot
+            self.acquired.append(batch)
+        self.in_transit = []
+
+        # The source stage matches the semaphore wait stage, so the acquire is ordered after the wait
+        barriers = self.ownership_barriers(buffers, 0, VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT | VK_ACCESS_INDEX_READ_BIT)
+        vkCmdPipelineBarrier(
+            command_buffer, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT,
+            0, 0, None, len(barriers), barriers, 0, None
+        )
+
+        return (semaphores, meshes)
+
+    def poll(self):
+        for batch in self.in_transit + self.acquired:
+            if batch.transfer_done:
+                continue
+
+            try:
+                vkGetFenceStatus(self.device, batch.fence)
+            except VkNotReady:
+                continue
+
+            batch.transfer_done = True
+            self.ring.retire_frame(batch.batch_id)
+
+    def retire_frame(self, slot):
+        self.poll()
+
+        # The frame that waited on a batch's semaphore has finished, so the batch is done with
+        remaining = []
+        for batch in self.acquired:
+            if batch.acquired_by == slot and batch.transfer_done:
+                self.destroy_batch(batch)
+            else:
+                remaining.append(batch)
+        self.acquired = remaining
+
+    def destroy_batch(self, batch):
+        vkFreeCommandBuffers(self.device, self.command_pool, 1, [batch.command_buffer])
+        vkDestroyFence(self.device, batch.fence, None)
+        vkDestroySemaphore(self.device, batch.semaphore, None)
+
+    def destroy(self):
+        for batch in self.in_transit + self.acquired:
+            self.destroy_batch(batch)
+
+        for mesh in self.pending_meshes:
+            mesh.destroy(self.allocator)
+        for batch in self.in_transit:
+            for mesh in batch.meshes:
+                mesh.destroy(self.allocator)
+
+        vkDestroyCommandPool(self.device, self.command_pool, None)
+        self.ring.destroy()
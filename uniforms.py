@@ -0,0 +1,117 @@
+from vulkan import *
+import threading
+import numpy as np
+import descriptors
+
+def align_up(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+def aligned_dtype(dtype, alignment):
+    # Each record padded out to the offset alignment, so record i starts at a valid dynamic offset
+    dtype = np.dtype(dtype)
+    if dtype.names is None:
+        dtype = np.dtype([('value', dtype)])
+
+    return np.dtype({
+        'names': list(dtype.names),
+        'formats': [dtype.fields[name][0] for name in dtype.names],
+        'offsets': [dtype.fields[name][1] for name in dtype.names],
+        'itemsize': align_up(dtype.itemsize, alignment)
+    })
+
+def dynamic_binding(index, stages):
+    return descriptors.binding(index, VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC, stages)
+
+def bind_dynamic(command_buffer, pipeline_layout, set_index, descriptor_set, offsets, bind_point = VK_PIPELINE_BIND_POINT_GRAPHICS):
+    # One offset per dynamic binding in the set, in binding order
+    vkCmdBindDescriptorSets(command_buffer, bind_point, pipeline_layout, set_index, 1, [descriptor_set], len(offsets), offsets)
+
+class LinearAllocator:
+    def __init__(self, allocator, size, alignment, max_range, debug, usage = VK_BUFFER_USAGE_UNIFORM_BUFFER_BIT) -> None:
+        self.allocator = allocator
+        self.size = size
+        self.alignment = alignment
+        self.max_range = max_range
+
+        # Written by the CPU every frame and read once by the GPU, so device local when the heap is mappable
+        (self.buffer, self.allocation) = allocator.create_buffer(
+            size,
+            usage,
+            VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT,
+            VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+        )
+        # Mapped once for the buffer's lifetime, allocations are views into it
+        self.bytes = np.frombuffer(self.allocation.mapped, dtype=np.uint8, count=size)
+
+        self.head = 0
+        self.high_water = 0
+        # Secondaries recorded in parallel allocate from the same frame
+        self.lock = threading.Lock()
+
+        if debug:
+            print(f"Created {size} byte linear uniform allocator, aligned to {alignment}")
+
+    def allocate(self, size):
+        with self.lock:
+            offset = align_up(self.head, self.alignment)
+            if offset + size > self.size:
+                raise Exception(f"Linear allocator is out of space, {size} bytes requested with {self.size - offset} left")
+            self.head = offset + size
+
+        return offset
+
+    def allocate_array(self, dtype, count = 1):
+        # One bump for a whole batch of draws, record i is bound at offset + i * array.itemsize
+        record = aligned_dtype(dtype, self.alignment)
+        offset = self.allocate(record.itemsize * count)
+        array = self.bytes[offset:offset + record.itemsize * count].view(record)
+
+        return (offset, array)
+
+    def write(self, data):
+        data = np.ascontiguousarray(data)
+        offset = self.allocate(data.nbytes)
+        self.bytes[offset:offset + data.nbytes] = data.reshape(-1).view(np.uint8)
+
+        return offset
+
+    def descriptor_write(self, index, record_size):
+        # The descriptor covers one record, the dynamic offset picks which one
+        if record_size > self.max_range:
+            raise Exception(f"Uniform records of {record_size} bytes exceed the device limit of {self.max_range}")
+
+        return descriptors.buffer_write(index, VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC, self.buffer, 0, record_size)
+
+    def has_allocations(self):
+        return self.head > 0
+
+    def reset(self):
+        # Only once the frame fence has signalled, the GPU is done reading everything handed out
+        self.high_water = max(self.high_water, self.head)
+        self.head = 0
+
+    def destroy(self):
+        self.bytes = None
+        self.allocator.destroy_buffer(self.buffer, self.allocation)
+
+class PushConstants:
+    def __init__(self, dtype, stages, offset = 0, max_size = None) -> None:
+        self.dtype = np.dtype(dtype)
+        self.stages = stages
+        self.offset = offset
+
+        if self.dtype.itemsize % 4 != 0 or offset % 4 != 0:
+            raise Exception('Push constant offset and size must be multiples of 4')
+        if max_size is not None and offset + self.dtype.itemsize > max_size:
+            raise Exception(f"{offset + self.dtype.itemsize} bytes of push constants exceed the device limit of {max_size}")
+
+        # Filled in place per draw, the pointer handed to Vulkan is made once here
+        self.values = np.zeros((), dtype=self.dtype)
+        self.pointer = ffi.from_buffer(self.values)
+
+    def get_range(self):
+        return VkPushConstantRange(stageFlags=self.stages, offset=self.offset, size=self.dtype.itemsize)
+
+    def record(self, command_buffer, pipeline_layout):
+        # Not shared between recording threads, each keeps its own instance
+        vkCmdPushConstants(command_buffer, pipeline_layout, self.stages, self.offset, self.dtype.itemsize, self.pointer)
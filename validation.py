@@ -4,7 +4,7 @@ def debug_callback(*args):
     print(f"Validation layer: {args[5]} - {args[6]}")
     return 0
 
-def make_debug_messenger(instance):
+def make_debug_messenger(instance, instance_dispatch):
     createInfo = VkDebugReportCallbackCreateInfoEXT(
         sType=VK_STRUCTURE_TYPE_DEBUG_REPORT_CALLBACK_CREATE_INFO_EXT,
         pNext=None,
@@ -12,6 +12,4 @@ def make_debug_messenger(instance):
         pfnCallback=debug_callback
     )
 
-    creationFunction = vkGetInstanceProcAddr(instance, 'vkCreateDebugReportCallbackEXT')
-
-    return creationFunction(instance, createInfo, None)
+    return instance_dispatch.vkCreateDebugReportCallbackEXT(instance, createInfo, None)